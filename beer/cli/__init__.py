@@ -1,3 +1,6 @@
 
 from . import dataset
+from . import feastore
+from . import aligraphs
+from . import accstats
 
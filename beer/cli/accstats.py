@@ -0,0 +1,231 @@
+'''Binary format of the accumulated statistics (ELBO shards).
+
+A shard is a single file made of:
+    * the magic string "BEERACC\\n" followed by the version of the
+      format and the size (in bytes) of the header, both stored as
+      little-endian uint32
+    * a JSON header with the value of the ELBO, the number of frames
+      ("minibatchsize"), the size of the data set ("datasize"), the
+      number of utterances ("count") and the layout of the statistics:
+      for each parameter, its id (position in the mean-field
+      factorization of the model), its offset and its shape
+    * a padding to align the statistics on 8 bytes
+    * the statistics: a raw (little-endian) float64 buffer.
+
+The statistics are memory-mapped when a shard is loaded so that
+shards can be summed without loading them in memory.
+
+'''
+
+import json
+import os
+import struct
+import numpy as np
+import torch
+
+import beer
+
+
+__all__ = ['AccStatsShard', 'elbo_from_shard', 'load_shard', 'reduce_shards',
+           'save_elbo', 'save_shard']
+
+
+MAGIC = b'BEERACC\n'
+VERSION = 1
+_PREAMBLE = struct.Struct('<8sII')
+_DTYPE = np.dtype('<f8')
+
+
+class AccStatsShard:
+    '''Accumulated statistics (and ELBO value) stored in a shard.
+
+    Attributes:
+        elbo (float): Value of the ELBO.
+        minibatchsize (int): Number of frames.
+        datasize (int): Size of the data set.
+        count (int): Number of utterances.
+        layout (list): List of dictionaries (one per parameter) with
+            keys "id", "offset" and "shape".
+        stats (``numpy.ndarray``): Statistics (float64) of all the
+            parameters.
+
+    '''
+
+    def __init__(self, elbo, minibatchsize, datasize, count, layout, stats):
+        self.elbo = elbo
+        self.minibatchsize = minibatchsize
+        self.datasize = datasize
+        self.count = count
+        self.layout = layout
+        self.stats = stats
+
+    def header(self):
+        'Header of the shard.'
+        return {
+            'elbo': self.elbo,
+            'minibatchsize': self.minibatchsize,
+            'datasize': self.datasize,
+            'count': self.count,
+            'size': len(self.stats),
+            'layout': self.layout,
+        }
+
+    def add_(self, other):
+        '''Add in-place the ELBO and the statistics of another shard.
+
+        Args:
+            other (:any:`AccStatsShard`): Shard to add.
+
+        Returns:
+            :any:`AccStatsShard`: The shard itself.
+
+        '''
+        if self.layout != other.layout:
+            raise ValueError('cannot add shards with different layouts')
+        if self.datasize != other.datasize:
+            raise ValueError('cannot add shards evaluated on different '
+                             'data sets')
+        np.add(self.stats, other.stats, out=self.stats)
+        self.elbo += other.elbo
+        self.minibatchsize += other.minibatchsize
+        self.count += other.count
+        return self
+
+
+def save_shard(path, shard):
+    '''Write (atomically) a shard.
+
+    Args:
+        path (str): Output path.
+        shard (:any:`AccStatsShard`): Shard to store.
+
+    '''
+    header = json.dumps(shard.header()).encode()
+    header += b' ' * (-(_PREAMBLE.size + len(header)) % _DTYPE.itemsize)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.write(np.ascontiguousarray(shard.stats, dtype=_DTYPE).tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_shard(path):
+    '''Load a shard, the statistics are memory-mapped (read-only).
+
+    Args:
+        path (str): Path of the shard.
+
+    Returns:
+        :any:`AccStatsShard`
+
+    '''
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise ValueError(f'{path}: not an accumulated statistics file')
+        magic, version, header_size = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ValueError(f'{path}: not an accumulated statistics file')
+        if version != VERSION:
+            raise ValueError(f'{path}: unsupported format version {version} '
+                             f'(expected {VERSION})')
+        header = json.loads(f.read(header_size).decode())
+    offset = _PREAMBLE.size + header_size
+    if header['size'] == 0:
+        stats = np.zeros(0, dtype=_DTYPE)
+    else:
+        stats = np.memmap(path, dtype=_DTYPE, mode='r', offset=offset,
+                          shape=(header['size'],))
+    return AccStatsShard(header['elbo'], header['minibatchsize'],
+                         header['datasize'], header['count'],
+                         header['layout'], stats)
+
+
+def reduce_shards(paths):
+    '''Sum the shards one after another. Only the running sum is held
+    in memory.
+
+    Args:
+        paths (seq): Paths of the shards.
+
+    Returns:
+        :any:`AccStatsShard`
+
+    '''
+    total = None
+    for path in paths:
+        shard = load_shard(path)
+        if total is None:
+            total = AccStatsShard(shard.elbo, shard.minibatchsize,
+                                  shard.datasize, shard.count, shard.layout,
+                                  np.array(shard.stats, dtype=_DTYPE))
+        else:
+            total.add_(shard)
+        del shard
+    if total is None:
+        raise ValueError('no shard to reduce')
+    return total
+
+
+def _parameters(model):
+    return [param for group in model.mean_field_factorization()
+            for param in group]
+
+
+def save_elbo(path, elbo, model, count):
+    '''Store the ELBO accumulated over several utterances as a shard.
+
+    Args:
+        path (str): Output path.
+        elbo (``EvidenceLowerBoundInstance``): Accumulated ELBO.
+        model (:any:`BayesianModel`): Model for which the ELBO was
+            computed.
+        count (int): Number of utterances.
+
+    '''
+    parameters = _parameters(model)
+    acc_stats = elbo.acc_stats
+    if not isinstance(acc_stats, beer.StatisticsAccumulator) \
+            or acc_stats.parameters() != parameters:
+        acc_stats = beer.StatisticsAccumulator(parameters).add_(acc_stats)
+    layout, offset = [], 0
+    for i, param in enumerate(parameters):
+        shape = list(acc_stats[param].shape)
+        layout.append({'id': i, 'offset': offset, 'shape': shape})
+        offset += acc_stats[param].numel()
+    stats = acc_stats.buffer.detach().cpu().double().numpy()
+    shard = AccStatsShard(float(elbo), elbo.minibatchsize, elbo.datasize,
+                          count, layout, stats)
+    save_shard(path, shard)
+
+
+def elbo_from_shard(shard, model):
+    '''Create the ELBO of the model from a shard.
+
+    Args:
+        shard (:any:`AccStatsShard`): Accumulated statistics.
+        model (:any:`BayesianModel`): Model for which the statistics
+            were accumulated.
+
+    Returns:
+        ``EvidenceLowerBoundInstance``
+
+    '''
+    parameters = _parameters(model)
+    if len(parameters) != len(shard.layout):
+        raise ValueError(f'the shard has statistics for '
+                         f'{len(shard.layout)} parameters but the model has '
+                         f'{len(parameters)}')
+    for entry, param in zip(shard.layout, parameters):
+        if tuple(entry['shape']) != tuple(param.stats.shape):
+            raise ValueError(f'shape mismatch for parameter {entry["id"]}: '
+                             f'{tuple(entry["shape"])} != '
+                             f'{tuple(param.stats.shape)}')
+    ref = parameters[0].stats
+    stats = torch.from_numpy(np.array(shard.stats)).to(ref)
+    return beer.inference.objectives.EvidenceLowerBoundInstance(
+        torch.tensor(shard.elbo),
+        beer.StatisticsAccumulator(parameters, stats),
+        parameters, shard.minibatchsize, shard.datasize
+    )
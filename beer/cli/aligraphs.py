@@ -0,0 +1,258 @@
+'''Content-addressed cache of compiled alignment graphs.
+
+An alignment graph only depends on the sequence of units of the
+transcription and on the topology of the HMM of each unit. Therefore,
+the compiled graphs are stored in a cache directory under a key
+computed from these two elements:
+    * "<cachedir>/<key>.npz": the compiled graph stored as plain
+      arrays (no pickled python objects), the transition matrix is
+      stored as a list of arcs.
+
+Graphs are compiled lazily on first use and written atomically so
+that several processes (i.e. parallel jobs or training iterations)
+can share the same cache directory.
+
+An alignment graphs directory (as created by "beer hmm mkaligraph
+--cache") is made of:
+    * "<dir>/hmms": the HMM graph of each unit
+    * "<dir>/transcriptions": one "<uttid> <unit1> <unit2> ..." per
+      line
+    * "<dir>/graphs/": the cache of compiled graphs
+
+'''
+
+import hashlib
+import os
+import pickle
+import numpy as np
+import torch
+
+import beer
+
+
+__all__ = ['AlignmentGraphCache', 'AlignmentGraphs', 'create_graph_from_seq',
+           'is_alignment_graphs', 'load_alignment_graphs']
+
+
+HMMS_FILE = 'hmms'
+TRANSCRIPTIONS_FILE = 'transcriptions'
+GRAPHS_DIR = 'graphs'
+
+
+def create_graph_from_seq(seq, phone_graphs):
+    '''Create the compiled linear graph corresponding to a sequence
+    of phones.
+
+    Args:
+        seq (list): Sequence of phones.
+        phone_graphs (dict): Mapping phone -> :any:`beer.graph.Graph`.
+
+    Returns:
+        :any:`beer.graph.CompiledGraph`
+
+    '''
+    graph = beer.graph.Graph()
+    graph.start_state = graph.add_state()
+    last_state = graph.start_state
+    id2sym = {}
+    phone_states = []
+    for i, phone in enumerate(seq):
+        state = graph.add_state()
+        phone_states.append(state)
+        graph.add_arc(last_state, state)
+        last_state = state
+        id2sym[i] = phone
+    state = graph.add_state()
+    graph.add_arc(last_state, state)
+    graph.end_state = state
+
+    # Replace the phone states with the corresponding HMMs.
+    graph.replace_states({phone_states[i]: phone_graphs[phone]
+                          for i, phone in enumerate(seq)})
+    graph.normalize()
+
+    return graph.compile()
+
+
+# Digest of the topology (states, arcs and weights) of a graph.
+def _graph_digest(graph):
+    hasher = hashlib.sha1()
+    hasher.update(f'{graph.start_state} {graph.end_state}\n'.encode())
+    for state_id in sorted(graph.states()):
+        pdf_id = graph.state_from_id(state_id).pdf_id
+        hasher.update(f's {state_id} {pdf_id}\n'.encode())
+    for arc in sorted(graph.arcs(), key=lambda arc: (arc.start, arc.end)):
+        hasher.update(f'a {arc.start} {arc.end} '
+                      f'{float(arc.weight).hex()}\n'.encode())
+    return hasher.hexdigest()
+
+
+def _save_graph(path, graph):
+    trans_log_probs = graph.trans_log_probs
+    starts, ends = (trans_log_probs > float('-inf')).nonzero().t()
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            init_log_probs=graph.init_log_probs.numpy(),
+            final_log_probs=graph.final_log_probs.numpy(),
+            arc_starts=starts.numpy().astype(np.int32),
+            arc_ends=ends.numpy().astype(np.int32),
+            arc_log_probs=trans_log_probs[starts, ends].numpy(),
+            pdf_id_mapping=np.array(graph.pdf_id_mapping, dtype=np.int64)
+        )
+    os.replace(tmp_path, path)
+
+
+def _load_graph(path):
+    with np.load(path) as arrays:
+        init_log_probs = torch.from_numpy(arrays['init_log_probs'])
+        final_log_probs = torch.from_numpy(arrays['final_log_probs'])
+        starts = torch.from_numpy(arrays['arc_starts']).long()
+        ends = torch.from_numpy(arrays['arc_ends']).long()
+        arc_log_probs = torch.from_numpy(arrays['arc_log_probs'])
+        pdf_id_mapping = arrays['pdf_id_mapping'].tolist()
+    n_states = len(init_log_probs)
+    trans_log_probs = torch.zeros(n_states, n_states,
+                                  dtype=arc_log_probs.dtype) - float('inf')
+    trans_log_probs[starts, ends] = arc_log_probs
+    graph = beer.graph.CompiledGraph(init_log_probs, final_log_probs,
+                                     trans_log_probs, pdf_id_mapping)
+
+    # Same representation as the one given by "Graph.compile".
+    return graph.optimize()
+
+
+class AlignmentGraphCache:
+    '''Cache of compiled alignment graphs indexed by sequence of
+    phones.
+
+    Example:
+        >>> cache = AlignmentGraphCache('cache_dir', phone_graphs)
+        >>> graph = cache.get(['sil', 'a', 'b', 'sil'])
+
+    '''
+
+    def __init__(self, cachedir, phone_graphs):
+        '''
+        Args:
+            cachedir (str): Directory where the graphs are stored.
+            phone_graphs (dict): Mapping phone -> :any:`beer.graph.Graph`.
+
+        '''
+        os.makedirs(cachedir, exist_ok=True)
+        self.cachedir = cachedir
+        self.phone_graphs = phone_graphs
+        self.digests = {phone: _graph_digest(graph)
+                        for phone, graph in phone_graphs.items()}
+        self._graphs = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_graphs'] = {}
+        return state
+
+    def key(self, seq):
+        'Key of the alignment graph of the sequence of phones.'
+        hasher = hashlib.sha1()
+        for phone in seq:
+            hasher.update(f'{phone} {self.digests[phone]}\n'.encode())
+        return hasher.hexdigest()
+
+    def path(self, seq):
+        'Path of the stored alignment graph of the sequence of phones.'
+        return os.path.join(self.cachedir, self.key(seq) + '.npz')
+
+    def get(self, seq):
+        '''Return the compiled alignment graph of a sequence of phones.
+        The graph is compiled and stored in the cache if it is not
+        already present.
+
+        Args:
+            seq (list): Sequence of phones.
+
+        Returns:
+            :any:`beer.graph.CompiledGraph`
+
+        '''
+        key = self.key(seq)
+        try:
+            return self._graphs[key]
+        except KeyError:
+            pass
+        path = os.path.join(self.cachedir, key + '.npz')
+        if os.path.isfile(path):
+            graph = _load_graph(path)
+        else:
+            graph = create_graph_from_seq(seq, self.phone_graphs)
+            _save_graph(path, graph)
+        self._graphs[key] = graph
+        return graph
+
+
+def is_alignment_graphs(path):
+    'Return True if "path" is an alignment graphs directory.'
+    return os.path.isfile(os.path.join(path, TRANSCRIPTIONS_FILE))
+
+
+class AlignmentGraphs:
+    '''Dictionary-like access (by utterance id) to the alignment graphs
+    of an alignment graphs directory.'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HMMS_FILE), 'rb') as f:
+            phone_graphs, _ = pickle.load(f)
+        self.transcriptions = {}
+        with open(os.path.join(path, TRANSCRIPTIONS_FILE), 'r') as f:
+            for line in f:
+                tokens = line.strip().split()
+                self.transcriptions[tokens[0]] = tokens[1:]
+        self.cache = AlignmentGraphCache(os.path.join(path, GRAPHS_DIR),
+                                         phone_graphs)
+
+    def __len__(self):
+        return len(self.transcriptions)
+
+    def __contains__(self, uttid):
+        return uttid in self.transcriptions
+
+    def __iter__(self):
+        return iter(self.transcriptions)
+
+    def keys(self):
+        return self.transcriptions.keys()
+
+    def __getitem__(self, uttid):
+        return self.cache.get(self.transcriptions[uttid])
+
+
+# Adapt the "npz" archives of pickled graphs to the interface of
+# "AlignmentGraphs".
+class _NpzAlignmentGraphs:
+
+    def __init__(self, path):
+        self.archive = np.load(path, allow_pickle=True)
+
+    def __len__(self):
+        return len(self.archive.files)
+
+    def __contains__(self, uttid):
+        return uttid in self.archive.files
+
+    def __iter__(self):
+        return iter(self.archive.files)
+
+    def keys(self):
+        return self.archive.files
+
+    def __getitem__(self, uttid):
+        return self.archive[uttid][0]
+
+
+def load_alignment_graphs(path):
+    '''Load the alignment graphs: either an alignment graphs directory
+    or a "npz" archive of pickled graphs.'''
+    if is_alignment_graphs(path):
+        return AlignmentGraphs(path)
+    return _NpzAlignmentGraphs(path)
@@ -3,9 +3,10 @@
 from dataclasses import dataclass, field
 import random
 from typing import NamedTuple, Any
-import numpy as np
 import torch
 
+from .feastore import FeatureStore, load_features
+
 
 class Utterance(NamedTuple):
     'An audio recording and the associated meta-data.'
@@ -35,6 +36,59 @@ class UtteranceIterator:
         return Utterance(id=uttid, features=features)
 
 
+class Batch(NamedTuple):
+    '''A minibatch of utterances: the features of all the utterances
+    concatenated and the number of frames of each of them (as expected
+    by the "lengths" argument of the HMM based models).'''
+    ids: list
+    features: torch.Tensor
+    lengths: torch.Tensor
+
+    def sequences(self):
+        'List of the features of each utterance.'
+        return list(torch.split(self.features, self.lengths.tolist()))
+
+    def padded(self):
+        '''Features padded (with zeros) to the number of frames of
+        the longest utterance.
+
+        Returns:
+            ``torch.Tensor[B, max(lengths), D]``
+
+        '''
+        padded = self.features.new_zeros(len(self.lengths),
+                                         int(self.lengths.max()),
+                                         self.features.shape[-1])
+        for i, seq in enumerate(self.sequences()):
+            padded[i, :len(seq)] = seq
+        return padded
+
+
+class BatchIterator:
+
+    def __init__(self, batches, fea_dict):
+        self.batches = batches
+        self.fea_dict = fea_dict
+        self.idx = 0
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __next__(self):
+        try:
+            uttids = self.batches[self.idx]
+        except IndexError:
+            raise StopIteration
+        seqs = [torch.from_numpy(self.fea_dict[uttid]) for uttid in uttids]
+        lengths = torch.tensor([len(seq) for seq in seqs], dtype=torch.long)
+        features = torch.cat(seqs).float()
+        self.idx += 1
+        return Batch(ids=uttids, features=features, lengths=lengths)
+
+
 @dataclass
 class Dataset:
     'A collection of utterances with their features and meta-data.'
@@ -44,11 +98,13 @@ class Dataset:
     var: torch.Tensor
     size: int
     _fea_dict: Any = field(default=None)
+    _lengths: Any = field(default=None)
 
     @property
     def fea_dict(self):
+        'Features archive ("npz" archive or features store).'
         if self._fea_dict is None:
-            self._fea_dict = np.load(self.feapath)
+            self._fea_dict = load_features(self.feapath)
         return self._fea_dict
 
     def __getstate__(self):
@@ -56,8 +112,7 @@ class Dataset:
         return self.__dict__
 
     def __len__(self):
-        features = np.load(self.feapath)
-        return len(features.files)
+        return len(self.fea_dict.files)
 
     def utterances(self, random_order=True):
         '''Return an iterator over the utterances.
@@ -75,6 +130,72 @@ class Dataset:
             random.shuffle(uttsid)
         return UtteranceIterator(uttsid, self.fea_dict)
 
+    def lengths(self):
+        '''Number of frames of each utterance.
+
+        Returns:
+            ``dict``: Utterance id -> number of frames.
+
+        '''
+        if self._lengths is None:
+            fea_dict = self.fea_dict
+            if isinstance(fea_dict, FeatureStore):
+                # Read from the index: no need to access the features.
+                self._lengths = {uttid: nframes
+                                 for uttid, (_, nframes) in fea_dict.index.items()}
+            else:
+                self._lengths = {uttid: len(fea_dict[uttid])
+                                 for uttid in fea_dict.keys()}
+        return self._lengths
+
+    def batches(self, max_frames, bucket_width=10, random_order=True):
+        '''Return an iterator over minibatches of utterances of
+        similar length.
+
+        The utterances are grouped in buckets of ``bucket_width``
+        frames and the minibatches are filled, bucket after bucket,
+        with as many utterances as possible such that the padded
+        minibatch has no more than ``max_frames`` frames (the batched
+        inference of the HMMs works on padded sequences). An utterance
+        longer than ``max_frames`` makes a minibatch on its own.
+
+        Args:
+            max_frames (int): Maximum number of (padded) frames in a
+                minibatch.
+            bucket_width (int): Width (in frames) of the buckets.
+            random_order (boolean): If True, shuffle the utterances
+                within the buckets and the order of the minibatches.
+                Otherwise, the minibatches are sorted by increasing
+                length and the utterances by id.
+
+        Returns:
+            ``iterable`` of :any:`Batch`
+
+        '''
+        lengths = self.lengths()
+        uttids = sorted(lengths)
+        if random_order:
+            random.shuffle(uttids)
+
+        # The sort is stable: within a bucket, the utterances keep
+        # their (random) order.
+        uttids.sort(key=lambda uttid: lengths[uttid] // max(bucket_width, 1))
+
+        batches, batch, max_length = [], [], 0
+        for uttid in uttids:
+            new_max_length = max(max_length, lengths[uttid])
+            if batch and (len(batch) + 1) * new_max_length > max_frames:
+                batches.append(batch)
+                batch, new_max_length = [], lengths[uttid]
+            batch.append(uttid)
+            max_length = new_max_length
+        if batch:
+            batches.append(batch)
+
+        if random_order:
+            random.shuffle(batches)
+        return BatchIterator(batches, self.fea_dict)
+
     def __getitem__(self, key):
         features = torch.from_numpy(self.fea_dict[key]).float()
         return Utterance(key, features)
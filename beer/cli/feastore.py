@@ -0,0 +1,145 @@
+'''Memory-mapped features store.
+
+A features store is made of two files:
+    * "<path>": the features of all the utterances (float32) stored
+      contiguously in a raw binary file
+    * "<path>.idx": a text index, the first line is the dimension of
+      the features and each following line has the form
+      "<uttid> <offset> <nframes>" where the offset is expressed in
+      number of frames.
+
+The data file is memory-mapped so accessing an utterance does not
+require to read (or decompress) the rest of the archive.
+
+'''
+
+import os
+import numpy as np
+
+
+__all__ = ['FeatureStore', 'FeatureStoreWriter', 'is_feature_store',
+           'load_features']
+
+
+INDEX_EXT = '.idx'
+
+
+def is_feature_store(path):
+    'Return True if "path" is a features store.'
+    return os.path.isfile(path + INDEX_EXT)
+
+
+def load_features(path):
+    '''Load a features archive: either a features store or a "npz"
+    archive.'''
+    if is_feature_store(path):
+        return FeatureStore(path)
+    return np.load(path)
+
+
+class FeatureStore:
+    'Read-only, dictionary-like access to a features store.'
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        with open(path + INDEX_EXT, 'r') as f:
+            self.dim = int(f.readline().strip())
+            for line in f:
+                uttid, offset, nframes = line.strip().split()
+                self.index[uttid] = (int(offset), int(nframes))
+        self._data = None
+
+    @property
+    def data(self):
+        'All the features as a [total_nframes, dim] (memory-mapped) array.'
+        if self._data is None:
+            nframes = sum(length for _, length in self.index.values())
+            if nframes == 0:
+                self._data = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                # Copy-on-write: the arrays are writable (as expected
+                # by "torch.from_numpy") but the file is never
+                # modified.
+                self._data = np.memmap(self.path, dtype=np.float32, mode='c',
+                                       shape=(nframes, self.dim))
+        return self._data
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_data'] = None
+        return state
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, uttid):
+        return uttid in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    @property
+    def files(self):
+        'Same as :any:`keys` (for compatibility with "npz" archives).'
+        return list(self.index.keys())
+
+    def __getitem__(self, uttid):
+        offset, nframes = self.index[uttid]
+        return self.data[offset:offset + nframes]
+
+
+class FeatureStoreWriter:
+    '''Write a features store utterance by utterance.
+
+    Example:
+        >>> with FeatureStoreWriter('feats.bin') as writer:
+        ...     writer.add('utt1', features1)
+        ...     writer.add('utt2', features2)
+
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.dim = None
+        self.index = []
+        self.nframes = 0
+        self._fid = open(path, 'wb')
+
+    def add(self, uttid, features):
+        '''Append the features of an utterance to the store.
+
+        Args:
+            uttid (str): Utterance id.
+            features (``numpy.ndarray[N, D]``): Features.
+
+        '''
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.ndim != 2:
+            raise ValueError(f'expected a 2D array for "{uttid}", got '
+                             f'{features.ndim}D')
+        if self.dim is None:
+            self.dim = features.shape[1]
+        elif features.shape[1] != self.dim:
+            raise ValueError(f'features dimension mismatch for "{uttid}": '
+                             f'expected {self.dim}, got {features.shape[1]}')
+        self._fid.write(features.tobytes())
+        self.index.append((uttid, self.nframes, len(features)))
+        self.nframes += len(features)
+
+    def close(self):
+        'Flush the data and write the index.'
+        self._fid.close()
+        with open(self.path + INDEX_EXT, 'w') as f:
+            print(self.dim if self.dim is not None else 0, file=f)
+            for uttid, offset, nframes in self.index:
+                print(uttid, offset, nframes, file=f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -9,18 +9,19 @@ import numpy as np
 import torch
 
 from ...dataset import Dataset
+from ...feastore import load_features
 
 
 def accumulate(feature_file):
     '''Compute global mean, variance, frame counts
     Argument:
-        feature_file(str): feature file(npz)
+        feature_file(str): feature file (npz or features store)
     Returns:
         mean: np array (float)
         var: np array (float)
         tot_counts(int): total frames in feature files
     '''
-    feats = np.load(feature_file)
+    feats = load_features(feature_file)
     keys = list(feats.keys())
     dim = feats[keys[0]].shape[1]
     tot_sum = np.zeros(dim)
@@ -40,7 +41,8 @@ def accumulate(feature_file):
 
 def setup(parser):
     parser.add_argument('datadir', help='data directory')
-    parser.add_argument('features', help='features archive (npz format)')
+    parser.add_argument('features', help='features archive (npz format or '
+                                         'features store)')
     parser.add_argument('out', help='output compiled dataset')
 
 
@@ -7,22 +7,38 @@ import os
 import pickle
 from zipfile import ZipFile
 
+import numpy as np
+
+from ...feastore import FeatureStoreWriter
+
 
 def setup(parser):
     parser.add_argument('-e', '--extension', default='npy',
                         help='extension of the features file (default: npy)')
+    parser.add_argument('-m', '--mmap', action='store_true',
+                        help='create a memory-mapped features store '
+                             'instead of a npz archive')
     parser.add_argument('feadir', help='features directory')
     parser.add_argument('out', help='output zip archived')
 
 
 def main(args, logger):
     counts = 0
-    with ZipFile(args.out, 'w') as f:
-        for path in glob.glob(os.path.join(args.feadir, '*' + args.extension)):
-            logger.debug(f'adding {path} to the archive')
-            arcname = os.path.basename(path).replace('.' + args.extension, '')
-            f.write(path, arcname=arcname)
-            counts += 1
+    paths = sorted(glob.glob(os.path.join(args.feadir, '*' + args.extension)))
+    if args.mmap:
+        with FeatureStoreWriter(args.out) as writer:
+            for path in paths:
+                logger.debug(f'adding {path} to the features store')
+                uttid = os.path.basename(path).replace('.' + args.extension, '')
+                writer.add(uttid, np.load(path))
+                counts += 1
+    else:
+        with ZipFile(args.out, 'w') as f:
+            for path in paths:
+                logger.debug(f'adding {path} to the archive')
+                arcname = os.path.basename(path).replace('.' + args.extension, '')
+                f.write(path, arcname=arcname)
+                counts += 1
     logger.info(f'created archive from {counts} features files')
 
 if __name__ == "__main__":
@@ -4,6 +4,7 @@
 import argparse
 import beer
 import io
+import multiprocessing
 import os
 import subprocess
 import sys
@@ -12,6 +13,8 @@ import yaml
 import numpy as np
 from scipy.io.wavfile import read
 
+from ...feastore import FeatureStoreWriter
+
 
 feaconf = {
     'srate': 16000,
@@ -33,11 +36,153 @@ feaconf = {
 }
 
 
-def compute_dct_bases(nfilters, n_dct_coeff):
-    dct_bases = np.zeros((nfilters, n_dct_coeff))
-    for m in range(n_dct_coeff):
-        dct_bases[:, m] = np.cos((m+1) * np.pi / nfilters * (np.arange(nfilters) + 0.5))
-    return dct_bases
+# Constants of the features extraction (DCT bases, lifter, filter
+# bank...) for the current process. They are computed only once for a
+# given configuration.
+_constants = {}
+
+
+def get_constants(conf):
+    key = tuple(sorted(conf.items()))
+    try:
+        return _constants[key]
+    except KeyError:
+        pass
+    flen_samp = int(conf['srate'] * conf['window_len'])
+    fft_len = int(2 ** np.floor(np.log2(flen_samp) + 1))
+    constants = {
+        'dct_bases': beer.features.create_dct_bases(conf['nfilters'],
+                                                    conf['n_dct_coeff']),
+        'lifter': beer.features.create_lifter(conf['n_dct_coeff'],
+                                              conf['lifter_coeff']),
+        'fbank': beer.features.create_fbank(conf['nfilters'], fft_len,
+                                            lowfreq=conf['cutoff_lfreq'],
+                                            highfreq=conf['cutoff_hfreq']),
+    }
+    _constants.clear()
+    _constants[key] = constants
+    return constants
+
+
+def read_signal(inwav, logger=None):
+    # If 'inwav' ends up with the '|' symbol, 'inwav' is
+    # interpreted as a command otherwise we assume 'inwav' to
+    # be a path to a wav file.
+    if inwav[-1] == '|':
+        cmd = inwav[:-1]
+        if logger is not None:
+            logger.debug(f'reading command: {cmd}')
+        proc = subprocess.run(cmd, shell=True,
+                              stdout=subprocess.PIPE)
+        return read(io.BytesIO(proc.stdout))
+    if logger is not None:
+        logger.debug(f'reading file: {inwav}')
+    return read(inwav)
+
+
+def extract(signal, conf, logger=None):
+    '''Extract the features of a signal.
+
+    Args:
+        signal (``numpy.ndarray``): Audio signal.
+        conf (dict): Features configuration.
+        logger (``logging.Logger``): Logger (optional).
+
+    Returns:
+        ``numpy.ndarray[N, D]``: The features.
+
+    '''
+    def log(msg):
+        if logger is not None:
+            logger.debug(msg)
+
+    constants = get_constants(conf)
+
+    # Mel spectrum.
+    log('extracting STFT')
+    melspec, fft_len = beer.features.short_term_mspec(
+        signal,
+        flen=conf['window_len'],
+        frate=conf['framerate'],
+        preemph=conf['preemph'],
+        srate=conf['srate'],
+    )
+
+    # Filter bank.
+    if conf['apply_fbank']:
+        log(f'applying filter bank (F={conf["nfilters"]})')
+        melspec = melspec @ constants['fbank'].T
+
+    # Take the logarithm of the magnitude spectrum.
+    log('log of the STFT')
+    log_melspec = np.log(1e-6 + melspec)
+
+    # HTK compatibility normalization (probably doesn't change
+    # the accuracy of the recognition).
+    norm = np.sqrt(2. / conf['nfilters'])
+
+    # DCT transform.
+    if conf['apply_dct']:
+        log('cosine transform of the log STFT')
+        features = log_melspec @ constants['dct_bases']
+
+        features *= norm
+
+        # Liftering.
+        log('cepstrum liftering')
+        features *= constants['lifter']
+    else:
+        features = log_melspec
+
+    # Signal enery (per-frame).
+    if conf['add_energy']:
+        log('add the energy to the features')
+        energy = log_melspec.sum(axis=-1) * norm
+        features = np.c_[energy, features]
+
+    # Deltas.
+    if conf['apply_deltas']:
+        log('concatenating derivatives')
+        delta_order = conf['delta_order']
+        delta_winlen = conf['delta_winlen']
+        features = beer.features.add_deltas(features,
+            tuple([delta_winlen] * delta_order))
+
+    # Mean normalization.
+    if conf['utt_mnorm']:
+        log('utterance mean normalization')
+        features -= features.mean(axis=0)[None, :]
+
+    return features
+
+
+def process_line(line, conf, logger=None):
+    '''Read and extract the features of a line "<uttid> <wav|cmd>" of
+    the list of WAV files.'''
+    tokens = line.strip().split()
+    uttid, inwav = tokens[0], ' '.join(tokens[1:])
+    if logger is not None:
+        logger.debug(f'processing utterance: {uttid}')
+    sr, signal = read_signal(inwav, logger)
+    if not sr == conf['srate']:
+        msg = 'Sampling rate ({}) does not match the one ' \
+              'of the given file ({}).'
+        raise ValueError(msg.format(conf['srate'], sr))
+    return uttid, extract(signal, conf, logger)
+
+
+# Configuration of the worker processes.
+_worker_conf = None
+
+
+def _init_worker(conf):
+    global _worker_conf
+    _worker_conf = conf
+    get_constants(conf)
+
+
+def _worker_process_line(line):
+    return process_line(line, _worker_conf)
 
 
 class ShowDefaultsAction(argparse.Action):
@@ -51,6 +196,12 @@ class ShowDefaultsAction(argparse.Action):
 def setup(parser):
     parser.add_argument('--show-default-conf', action=ShowDefaultsAction,
                         help='show the default configuration and exit')
+    parser.add_argument('-a', '--archive', action='store_true',
+                        help='store all the features in a single '
+                             '(memory-mapped) features store, "outdir" is '
+                             'then the path of the store')
+    parser.add_argument('-n', '--num-workers', type=int, default=1,
+                        help='number of parallel processes (default: 1)')
     parser.add_argument('feaconf', help='configuration file of the '
                                         'features')
     parser.add_argument('wav_list', help='list of WAV files or "-" for stdin')
@@ -70,111 +221,52 @@ def main(args, logger):
             exit(1)
     feaconf.update(new_conf)
 
-    # Pre-compute the DCT bases.
-    dct_bases = compute_dct_bases(feaconf['nfilters'], feaconf['n_dct_coeff'])
-
-
     if args.wav_list == '-':
         infile = sys.stdin
     else:
         with open(args.wav_list, 'r') as f:
             infile = f.readlines()
+    lines = (line for line in infile if line.strip())
+
+    if args.num_workers > 1:
+        logger.debug(f'extracting the features with {args.num_workers} '
+                     'processes')
+        pool = multiprocessing.Pool(args.num_workers, initializer=_init_worker,
+                                    initargs=(feaconf,))
+        # The results are returned in the order of the input list as
+        # soon as they are available.
+        results = pool.imap(_worker_process_line, lines, chunksize=4)
+    else:
+        pool = None
+        results = (process_line(line, feaconf, logger) for line in lines)
 
-    counts = 0
-    for line in infile:
-        tokens = line.strip().split()
-        uttid, inwav = tokens[0], ' '.join(tokens[1:])
-        logger.debug(f'processing utterance: {uttid}')
-
-        # If 'inwav' ends up with the '|' symbol, 'inwav' is
-        # interpreted as a command otherwise we assume 'inwav' to
-        # be a path to a wav file.
-        if inwav[-1] == '|':
-            cmd = inwav[:-1]
-            logger.debug(f'reading command: {cmd}')
-            proc = subprocess.run(cmd, shell=True,
-                                  stdout=subprocess.PIPE)
-            sr, signal = read(io.BytesIO(proc.stdout))
-        else:
-            logger.debug(f'reading file: {inwav}')
-            sr, signal = read(inwav)
-        if not sr == feaconf['srate']:
-            msg = 'Sampling rate ({}) does not match the one ' \
-                  'of the given file ({}).'
-            logger.error(msg.format(feaconf['srate'], sr))
-            exit(1)
+    writer = None
+    if args.archive:
+        logger.debug(f'writing the features to: {args.outdir}')
+        writer = FeatureStoreWriter(args.outdir)
 
-        # Mel spectrum.
-        logger.debug('extracting STFT')
-        melspec, fft_len = beer.features.short_term_mspec(
-            signal,
-            flen=feaconf['window_len'],
-            frate=feaconf['framerate'],
-            preemph=feaconf['preemph'],
-            srate=feaconf['srate'],
-        )
-
-        # Filter bank.
-        if feaconf['apply_fbank']:
-            logger.debug(f'applying filter bank (F={feaconf["nfilters"]})')
-            fbank = beer.features.create_fbank(feaconf['nfilters'], fft_len,
-                                               lowfreq=feaconf['cutoff_lfreq'],
-                                               highfreq=feaconf['cutoff_hfreq'])
-            melspec = melspec @ fbank.T
-
-        # Take the logarithm of the magnitude spectrum.
-        logger.debug('log of the STFT')
-        log_melspec = np.log(1e-6 + melspec)
-
-        # HTK compatibility normalization (probably doesn't change
-        # the accuracy of the recognition).
-        norm = np.sqrt(2. / feaconf['nfilters'])
-
-        # DCT transform.
-        if feaconf['apply_dct']:
-            logger.debug('cosine transform of the log STFT')
-            features = log_melspec @ dct_bases
-
-            features *= norm
-
-            # Liftering.
-            logger.debug('cepstrum liftering')
-            l_coeff = feaconf['lifter_coeff']
-            lifter = 1 + (l_coeff / 2) * np.sin(np.pi * \
-                (1 + np.arange(feaconf['n_dct_coeff'])) / l_coeff)
-            features *= lifter
-        else:
-            features = log_melspec
-
-        # Signal enery (per-frame).
-        if feaconf['add_energy']:
-            logger.debug('add the energy to the features')
-            energy = log_melspec.sum(axis=-1) * norm
-            features = np.c_[energy, features]
-
-        # Deltas.
-        if feaconf['apply_deltas']:
-            logger.debug('concatenating derivatives')
-            delta_order = feaconf['delta_order']
-            delta_winlen = feaconf['delta_winlen']
-            features = beer.features.add_deltas(features,
-                tuple([delta_winlen] * delta_order))
-
-        # Mean normalization.
-        if feaconf['utt_mnorm']:
-            logger.debug('utterance mean normalization')
-            features -= features.mean(axis=0)[None, :]
-
-        # Store the features as a numpy file.
-        path = os.path.join(args.outdir, uttid)
-        logger.debug(f'saving features to: {path}')
-        np.save(path, features)
-
-        counts += 1
+    counts = 0
+    try:
+        for uttid, features in results:
+            if writer is not None:
+                writer.add(uttid, features)
+            else:
+                # Store the features as a numpy file.
+                path = os.path.join(args.outdir, uttid)
+                logger.debug(f'saving features to: {path}')
+                np.save(path, features)
+            counts += 1
+    except ValueError as err:
+        logger.error(str(err))
+        exit(1)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if writer is not None:
+            writer.close()
 
     logger.info(f'extracted features for {counts} file(s)')
 
 
 if __name__ == '__main__':
     main()
-
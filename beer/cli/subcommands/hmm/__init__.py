@@ -7,16 +7,17 @@ from . import mkdecodegraph
 from . import mkphoneloop
 from . import mkphoneloopgraph
 from . import mkphones
-from . import optimizer
 from . import posteriors
 from . import phonelist
+from . import reduce
+from . import serve
 from . import train
 from . import update
 
 
 cmds = [accumulate, decode, mkaligraph, mkdecodegraph, mkphoneloop,
-        mkphoneloopgraph, mkphones, optimizer, posteriors,
-        phonelist, train, update]
+        mkphoneloopgraph, mkphones, posteriors,
+        phonelist, reduce, serve, train, update]
 
 def setup(parser):
     subparsers = parser.add_subparsers(title='possible commands', metavar='<cmd>')
@@ -8,16 +8,19 @@ import sys
 import numpy as np
 
 import beer
+from ...accstats import save_elbo
+from ...aligraphs import load_alignment_graphs
 
 
 def setup(parser):
-    parser.add_argument('-a', '--alis', help='alignment graphs in a "npz" '
-                                             'archive')
+    parser.add_argument('-a', '--alis', help='alignment graphs: "npz" '
+                                             'archive or directory created '
+                                             'by "mkaligraph --cache"')
     parser.add_argument('-s', '--acoustic-scale', default=1., type=float,
                         help='scaling factor of the acoutsic model')
     parser.add_argument('model', help='hmm based model')
     parser.add_argument('dataset', help='training data set')
-    parser.add_argument('out', help='output accumulated ELBO')
+    parser.add_argument('out', help='output accumulated statistics')
 
 
 def main(args, logger):
@@ -32,18 +35,20 @@ def main(args, logger):
     alis = None
     if args.alis:
         logger.debug('loading alignment graphs')
-        alis = np.load(args.alis)
+        alis = load_alignment_graphs(args.alis)
 
-    elbo = beer.evidence_lower_bound(datasize=dataset.size)
+    # The statistics of all the parameters of the model are
+    # accumulated in a single (preallocated) buffer.
+    elbo = beer.evidence_lower_bound(model, datasize=dataset.size)
     count = 0
     for line in sys.stdin:
         uttid = line.strip().split()[0]
         utt = dataset[uttid]
 
         aligraph = None
-        if alis:
+        if alis is not None:
             try:
-                aligraph = alis[uttid][0]
+                aligraph = alis[uttid]
             except KeyError:
                 logger.warning(f'no alignment graph for utterance "{uttid}"')
         logger.debug(f'processing utterance: {utt.id}')
@@ -54,8 +59,7 @@ def main(args, logger):
         count += 1
 
     logger.debug('saving the accumulated ELBO...')
-    with open(args.out, 'wb') as f:
-        pickle.dump((elbo, count), f)
+    save_elbo(args.out, elbo, model, count)
 
     logger.info(f'accumulated ELBO over {count} utterances: {float(elbo) / (count * dataset.size) :.3f}.')
 
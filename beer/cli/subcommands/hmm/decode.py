@@ -9,11 +9,17 @@ import sys
 
 import numpy as np
 import beer
+from ...aligraphs import load_alignment_graphs
 
 
 def setup(parser):
-    parser.add_argument('-a', '--alis', help='alignment graphs in a "npz" '
-                                             'archive')
+    parser.add_argument('-a', '--alis', help='alignment graphs: "npz" '
+                                             'archive or directory created '
+                                             'by "mkaligraph --cache"')
+    parser.add_argument('-b', '--beam', type=float,
+                        help='pruning beam (log domain)')
+    parser.add_argument('--max-active', type=int,
+                        help='maximum number of active states per frame')
     parser.add_argument('--per-frame', action='store_true',
                         help='output the per-frame transcription')
     parser.add_argument('-s', '--acoustic-scale', default=1., type=float,
@@ -51,7 +57,7 @@ def main(args, logger):
     alis = None
     if args.alis:
         logger.debug('loading alignment graphs')
-        alis = np.load(args.alis)
+        alis = load_alignment_graphs(args.alis)
 
     if args.utts:
         if args.utts == '-':
@@ -67,18 +73,21 @@ def main(args, logger):
         utt = dataset[uttname]
 
         aligraph = None
-        if alis:
+        if alis is not None:
             try:
-                aligraph = alis[utt.id][0]
+                aligraph = alis[utt.id]
             except KeyError:
                 logger.warning(f'no alignment graph for utterance "{utt.id}"')
 
         logger.debug(f'processing utterance: {utt.id}')
-        path_ids = [
-            int(unit)
-            for unit in model.decode(utt.features, inference_graph=aligraph,
-                                     scale=args.acoustic_scale)
-        ]
+        path, n_active = model.decode(utt.features, inference_graph=aligraph,
+                                      beam=args.beam,
+                                      max_active=args.max_active,
+                                      scale=args.acoustic_scale,
+                                      return_active=True)
+        logger.debug(f'average number of active states: '
+                     f'{float(n_active.float().mean()):.2f}')
+        path_ids = [int(unit) for unit in path]
         phones = state2phone(path_ids, model.start_pdf, args.per_frame)
         print(utt.id, ' '.join(phones))
         count += 1
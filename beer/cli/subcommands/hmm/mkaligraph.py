@@ -3,48 +3,37 @@
 import argparse
 import pickle
 import os
+import shutil
 import sys
 
 import numpy as np
 import beer
+from ...aligraphs import AlignmentGraphCache, create_graph_from_seq
+from ...aligraphs import GRAPHS_DIR, HMMS_FILE, TRANSCRIPTIONS_FILE
 
 
 def setup(parser):
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help='store the transcriptions and a cache of '
+                             'compiled graphs (built lazily on first use) '
+                             'in the output directory')
+    parser.add_argument('--build', action='store_true',
+                        help='with "--cache", compile the graphs now '
+                             'instead of on first use')
     parser.add_argument('hmms', help='hmm graph for each unit')
     parser.add_argument('outdir', help='output directory')
 
 
-# Create the linear graph corresponding to a sequence of phones.
-def create_graph_from_seq(seq, phone_graphs):
-    graph = beer.graph.Graph()
-    graph.start_state = graph.add_state()
-    last_state = graph.start_state
-    id2sym = {}
-    phone_states = []
-    for i, phone in enumerate(seq):
-        state = graph.add_state()
-        phone_states.append(state)
-        graph.add_arc(last_state, state)
-        last_state = state
-        id2sym[i] = phone
-    state = graph.add_state()
-    graph.add_arc(last_state, state)
-    graph.end_state = state
-
-    # Replace the phone states with the corresponding HMMs.
-    for i, phone in enumerate(seq):
-        graph.replace_state(phone_states[i], phone_graphs[phone])
-    graph.normalize()
-
-    return graph.compile()
-
-
 def main(args, logger):
 
     logger.debug('loading the hmms')
     with open(args.hmms, 'rb') as fid:
         hmm_graphs, _ = pickle.load(fid)
 
+    if args.cache:
+        make_cache(args, logger, hmm_graphs)
+        return
+
     nutts = 0
     for line in sys.stdin:
         tokens = line.strip().split()
@@ -67,6 +56,34 @@ def main(args, logger):
     logger.info(f'created alignment graphs for {nutts} utterances')
 
 
+def make_cache(args, logger, hmm_graphs):
+    os.makedirs(args.outdir, exist_ok=True)
+    shutil.copyfile(args.hmms, os.path.join(args.outdir, HMMS_FILE))
+    cache = AlignmentGraphCache(os.path.join(args.outdir, GRAPHS_DIR),
+                                hmm_graphs)
+
+    nutts = 0
+    keys = set()
+    with open(os.path.join(args.outdir, TRANSCRIPTIONS_FILE), 'w') as f:
+        for line in sys.stdin:
+            tokens = line.strip().split()
+            uttid, phones = tokens[0], tokens[1:]
+
+            if len(phones) == 0:
+                logger.error(f'utterance {uttid} has no transcription')
+                continue
+
+            if args.build:
+                logger.debug(f'create alignment graph for utterance: {uttid}')
+                cache.get(phones)
+            keys.add(cache.key(phones))
+            print(uttid, ' '.join(phones), file=f)
+            nutts += 1
+
+    logger.info(f'stored the transcriptions of {nutts} utterances '
+                f'({len(keys)} distinct alignment graphs)')
+
+
 if __name__ == '__main__':
     main()
 
@@ -45,9 +45,8 @@ def main(args, logger):
     phone2state = {phone: state for state, phone in graph.symbols.items()}
 
     logger.debug('replace the phone state with the corresponding hmm')
-    for phone, hmm in units.items():
-        state = phone2state[phone]
-        graph.replace_state(state, hmm)
+    graph.replace_states({phone2state[phone]: hmm
+                          for phone, hmm in units.items()})
 
     logger.debug('normalize the graph')
     graph.normalize()
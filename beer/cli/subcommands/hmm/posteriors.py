@@ -14,6 +14,10 @@ EPS = 1e-5
 
 
 def setup(parser):
+    parser.add_argument('-b', '--beam', type=float,
+                        help='pruning beam (log domain)')
+    parser.add_argument('--max-active', type=int,
+                        help='maximum number of active states per frame')
     parser.add_argument('-S', '--state', action='store_true',
                         help='state level posteriors')
     parser.add_argument('-l', '--log', action='store_true',
@@ -61,7 +65,12 @@ def main(args, logger):
             logger.warning(f'no data for utterance {uttname}')
             continue
         logger.debug(f'processing utterance: {utt.id}')
-        posts = model.posteriors(utt.features, scale=args.acoustic_scale)
+        posts, n_active = model.posteriors(utt.features, beam=args.beam,
+                                           max_active=args.max_active,
+                                           scale=args.acoustic_scale,
+                                           return_active=True)
+        logger.debug(f'average number of active states: '
+                     f'{float(n_active.float().mean()):.2f}')
         posts = posts.detach().numpy()
         if not args.state:
             posts = state2phone(posts, model.start_pdf, model.end_pdf)
@@ -0,0 +1,55 @@
+
+'sum the accumulated statistics (from "accumulate") listed on stdin'
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+
+from ...accstats import reduce_shards, save_shard
+
+
+def setup(parser):
+    parser.add_argument('-n', '--num-workers', type=int, default=1,
+                        help='number of parallel processes, each process '
+                             'sums a part of the statistics before the '
+                             'final reduction (default: 1)')
+    parser.add_argument('out', help='output accumulated statistics')
+
+
+def _reduce_part(task):
+    paths, out = task
+    save_shard(out, reduce_shards(paths))
+    return out
+
+
+def main(args, logger):
+    paths = (line.strip() for line in sys.stdin if line.strip())
+
+    if args.num_workers <= 1:
+        # Streaming reduction: only the running sum is kept in memory.
+        total = reduce_shards(paths)
+    else:
+        # Tree reduction: the shards are split into parts summed in
+        # parallel and the partial sums are then reduced.
+        paths = list(paths)
+        nparts = max(min(args.num_workers, len(paths)), 1)
+        tasks = [(paths[i::nparts], f'{args.out}.part{i}')
+                 for i in range(nparts)]
+        logger.debug(f'summing {len(paths)} shards in {nparts} parts')
+        with mp.Pool(nparts) as pool:
+            parts = pool.map(_reduce_part, tasks)
+        try:
+            total = reduce_shards(parts)
+        finally:
+            for part in parts:
+                os.remove(part)
+
+    save_shard(args.out, total)
+    logger.info(f'reduced statistics of {total.count} utterances: '
+                f'ELBO={total.elbo / (total.count * total.datasize):.3f}')
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,294 @@
+'serve the decoding/posteriors of a hmm based model (unix socket or stdin)'
+
+import argparse
+from concurrent.futures import Future
+import json
+import os
+import pickle
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+import torch
+import beer
+
+from .decode import state2phone
+from .posteriors import state2phone as state2phone_posts
+
+
+# Protocol: one JSON object per line.
+#
+# Request:
+#   {"id": <any>, "type": "decode"|"posteriors",
+#    "uttid": <str> | "features": [[...], ...] | "npy": <path>,
+#    "state": <bool> (optional, state level posteriors),
+#    "per_frame": <bool> (optional, per-frame units)}
+#
+# Response:
+#   {"id": <any>, "path": [...], "units": [...]}  (decode)
+#   {"id": <any>, "posteriors": [[...], ...]}     (posteriors)
+#   {"id": <any>, "error": <str>}
+REQUEST_TYPES = ['decode', 'posteriors']
+
+
+def setup(parser):
+    parser.add_argument('-b', '--batch-size', type=int, default=16,
+                        help='maximum number of requests per batch')
+    parser.add_argument('-d', '--dataset',
+                        help='dataset to serve requests by utterance id')
+    parser.add_argument('-s', '--socket',
+                        help='listen on the given unix socket instead of '
+                             'stdin/stdout')
+    parser.add_argument('-w', '--max-wait', type=float, default=10.,
+                        help='maximum time (in ms) to wait for filling a '
+                             'batch')
+    parser.add_argument('model', help='hmm based model')
+
+
+class _Request:
+
+    def __init__(self, line):
+        self.future = Future()
+        request = json.loads(line)
+        self.id = request.get('id')
+        self.type = request.get('type', 'decode')
+        if self.type not in REQUEST_TYPES:
+            raise ValueError(f'unknown request type: {self.type}')
+        self.state = request.get('state', False)
+        self.per_frame = request.get('per_frame', False)
+        self.uttid = request.get('uttid')
+        self.features = request.get('features')
+        self.npy = request.get('npy')
+        if self.uttid is None and self.features is None and self.npy is None:
+            raise ValueError('expected "uttid", "features" or "npy"')
+
+
+# Dimension of the features expected by the model or None if it
+# cannot be found (e.g. the emissions are not computed by a Normal
+# set).
+def _features_dim(model):
+    modelset = getattr(model, 'modelset', None)
+    while modelset is not None:
+        dim = getattr(modelset, 'dim', None)
+        if isinstance(dim, int):
+            return dim
+        modelset = getattr(modelset, 'original_modelset',
+                           getattr(modelset, 'modelset', None))
+    return None
+
+
+def _error(request, err):
+    return json.dumps({'id': request.id,
+                       'error': f'{type(err).__name__}: {err}'})
+
+
+class Server:
+    '''Load the model once and process the requests by batches.'''
+
+    def __init__(self, model, dataset, batch_size, max_wait, logger):
+        self.model = model
+        self.dim = _features_dim(model)
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.max_wait = max_wait / 1000
+        self.logger = logger
+        self.requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, line):
+        'Submit a request and return a future of the (JSON) response.'
+        try:
+            request = _Request(line)
+        except (ValueError, AttributeError) as err:
+            future = Future()
+            future.set_result(json.dumps({'error': str(err)}))
+            return future
+        self.requests.put(request)
+        return request.future
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self.logger.debug(f'processing a batch of {len(batch)} requests')
+            try:
+                for req_type in REQUEST_TYPES:
+                    requests = [request for request in batch
+                                if request.type == req_type]
+                    if requests:
+                        self._process(req_type, requests)
+            except Exception as err:
+                # Whatever happens, the thread keeps serving and no
+                # request is left without a response.
+                self.logger.error(f'failed to process the batch: {err}')
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_result(_error(request, err))
+
+    # Load and check the features of a request: raise a ValueError if
+    # they are not a (non-empty) 2D array of the model's dimension.
+    def _features(self, request):
+        if request.uttid is not None:
+            if self.dataset is None:
+                raise ValueError('no dataset loaded')
+            features = self.dataset[request.uttid].features.numpy()
+        elif request.npy is not None:
+            features = np.load(request.npy)
+        else:
+            features = request.features
+        try:
+            features = np.asarray(features, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError('features should be a 2D array of numbers')
+        if features.ndim != 2 or len(features) == 0:
+            raise ValueError(f'features should be a non-empty 2D array, '
+                             f'got shape {features.shape}')
+        if self.dim is not None and features.shape[1] != self.dim:
+            raise ValueError(f'features dimension mismatch: expected '
+                             f'{self.dim}, got {features.shape[1]}')
+        return torch.from_numpy(features)
+
+    def _infer(self, req_type, features, lengths):
+        with torch.no_grad():
+            if req_type == 'decode':
+                return self.model.decode(torch.cat(features), lengths=lengths)
+            return self.model.posteriors(torch.cat(features), lengths=lengths)
+
+    def _response(self, request, result):
+        if request.type == 'decode':
+            path = [int(pdf_id) for pdf_id in result]
+            response = {'id': request.id, 'path': path}
+            if hasattr(self.model, 'start_pdf'):
+                response['units'] = state2phone(path, self.model.start_pdf,
+                                                request.per_frame)
+        else:
+            posts = result.detach().numpy()
+            if not request.state and hasattr(self.model, 'start_pdf'):
+                posts = state2phone_posts(posts, self.model.start_pdf,
+                                          self.model.end_pdf)
+            response = {'id': request.id, 'posteriors': posts.tolist()}
+        return json.dumps(response)
+
+    def _process(self, req_type, requests):
+        valid_requests, features = [], []
+        for request in requests:
+            try:
+                features.append(self._features(request))
+                valid_requests.append(request)
+            except (KeyError, ValueError, OSError) as err:
+                request.future.set_result(_error(request, err))
+        if not valid_requests:
+            return
+
+        lengths = [len(fea) for fea in features]
+        try:
+            results = torch.split(self._infer(req_type, features, lengths),
+                                  lengths)
+        except Exception as err:
+            # Process the requests one by one so that a faulty request
+            # does not make the other ones fail.
+            self.logger.error(f'failed to process the batch: {err}')
+            results = []
+            for request, fea in zip(valid_requests, features):
+                try:
+                    results.append(self._infer(req_type, [fea], [len(fea)]))
+                except Exception as req_err:
+                    results.append(None)
+                    request.future.set_result(_error(request, req_err))
+
+        for request, result in zip(valid_requests, results):
+            if result is None:
+                continue
+            try:
+                response = self._response(request, result)
+            except KeyError as err:
+                response = json.dumps({'id': request.id,
+                                       'error': f'unknown state: {err}'})
+            except Exception as err:
+                response = _error(request, err)
+            request.future.set_result(response)
+
+
+def serve_stdin(server):
+    # The requests are submitted as they are read so that they can be
+    # batched, the responses are written in the order of the requests.
+    responses = queue.Queue()
+
+    def read_requests():
+        for line in sys.stdin:
+            if line.strip():
+                responses.put(server.submit(line))
+        responses.put(None)
+
+    threading.Thread(target=read_requests, daemon=True).start()
+    count = 0
+    while True:
+        future = responses.get()
+        if future is None:
+            break
+        print(future.result(), flush=True)
+        count += 1
+    return count
+
+
+def serve_socket(server, path, logger):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode()
+                if not line.strip():
+                    continue
+                response = server.submit(line).result()
+                self.wfile.write((response + '\n').encode())
+                self.wfile.flush()
+
+    if os.path.exists(path):
+        os.remove(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as sock_server:
+        sock_server.daemon_threads = True
+        logger.info(f'listening on {path}')
+        try:
+            sock_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+
+def main(args, logger):
+    logger.debug('load the model')
+    with open(args.model, 'rb') as f:
+        model = pickle.load(f)
+
+    dataset = None
+    if args.dataset:
+        logger.debug('load the dataset')
+        with open(args.dataset, 'rb') as f:
+            dataset = pickle.load(f)
+
+    server = Server(model, dataset, args.batch_size, args.max_wait, logger)
+    if args.socket:
+        serve_socket(server, args.socket, logger)
+    else:
+        count = serve_stdin(server)
+        logger.info(f'served {count} requests.')
+
+
+if __name__ == "__main__":
+    main()
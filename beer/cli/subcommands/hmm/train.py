@@ -3,8 +3,11 @@
 
 import argparse
 import pickle
+import random
 import sys
 
+import torch
+import torch.multiprocessing as mp
 import beer
 
 
@@ -12,30 +15,68 @@ def setup(parser):
     parser.add_argument('-b', '--batch-size', type=int, default=-1,
                         help='batch size in number of utterance ' \
                              '(-1 means all the utterances as one batch)')
+    parser.add_argument('-f', '--max-frames', type=int, default=-1,
+                        help='group the utterances of similar length in ' \
+                             'batches of at most N (padded) frames ' \
+                             'processed with the batched forward-backward ' \
+                             'algorithm, overrides "--batch-size" (-1 ' \
+                             'means disabled)')
     parser.add_argument('-e', '--epochs', type=int, default=1,
                         help='number of epochs')
     parser.add_argument('-l', '--lrate', type=float, default=1.,
                         help='learning rate')
+    parser.add_argument('-n', '--num-workers', type=int, default=1,
+                        help='number of parallel processes (default: 1)')
     parser.add_argument('model', help='hmm based model')
     parser.add_argument('dataset', help='training data set')
     parser.add_argument('out', help='phone loop model')
 
 
-def main(args, logger):
-    logger.debug('load the model')
-    with open(args.model, 'rb') as f:
-        model = pickle.load(f)
+def _parameters(model):
+    return [param for group in model.mean_field_factorization()
+            for param in group]
 
-    logger.debug('load the dataset')
-    with open(args.dataset, 'rb') as f:
+
+# State of a worker process.
+_worker = {}
+
+
+def _init_worker(model_path, dataset_path, shared_nparams):
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    with open(dataset_path, 'rb') as f:
         dataset = pickle.load(f)
+    _worker.update(model=model, dataset=dataset, params=_parameters(model),
+                   shared_nparams=shared_nparams, version=0)
+
+
+def _worker_elbo(task):
+    version, uttids = task
+    model, dataset = _worker['model'], _worker['dataset']
+    params = _worker['params']
+
+    # Synchronize the worker's model with the parent's one.
+    if version != _worker['version']:
+        for param, nparams in zip(params, _worker['shared_nparams']):
+            param.posterior.natural_parameters = nparams.clone()
+            param._dispatch()
+        _worker['version'] = version
+
+    elbo = beer.evidence_lower_bound(model, datasize=dataset.size)
+    for uttid in uttids:
+        elbo += beer.evidence_lower_bound(model, dataset[uttid].features,
+                                          datasize=dataset.size)
+
+    # The accumulated statistics are stored in a single vector (in
+    # the order of the model's parameters) sent back to the parent
+    # process through shared memory.
+    return float(elbo), elbo.acc_stats.buffer, elbo.minibatchsize
 
-    logger.debug('create the optimizer')
-    optim = beer.BayesianModelOptimizer(model.mean_field_factorization(),
-                                        lrate=args.lrate)
 
+def train(args, logger, model, dataset, optim):
+    'Train the model in the current process.'
     for epoch in range(1, args.epochs + 1):
-        elbo = beer.evidence_lower_bound(datasize=dataset.size)
+        elbo = beer.evidence_lower_bound(model, datasize=dataset.size)
         optim.init_step()
         for i, utt in enumerate(dataset.utterances(), start=1):
             logger.debug(f'processing utterance: {utt.id}')
@@ -49,9 +90,106 @@ def main(args, logger):
                 logger.info(f'{"epoch=" + str(epoch):<20}  ' \
                             f'{"batch=" + str(i // args.batch_size) + "/" + str(int(len(dataset) / args.batch_size)):<20} ' \
                             f'{"ELBO=" + str(round(float(elbo) / (args.batch_size * dataset.size), 3)):<20}')
-                elbo = beer.evidence_lower_bound(datasize=dataset.size)
+                elbo = beer.evidence_lower_bound(model, datasize=dataset.size)
                 optim.init_step()
 
+
+def train_bucketed(args, logger, model, dataset, optim):
+    '''Train the model in the current process, each batch is a group of
+    utterances of similar length processed at once: the emissions are
+    scored for the whole batch and the posteriors of the states are
+    computed with the batched forward-backward algorithm.'''
+    for epoch in range(1, args.epochs + 1):
+        batches = dataset.batches(args.max_frames)
+        for i, batch in enumerate(batches, start=1):
+            logger.debug(f'processing batch: {" ".join(batch.ids)}')
+            optim.init_step()
+            elbo = beer.evidence_lower_bound(model, datasize=dataset.size)
+            elbo += beer.evidence_lower_bound(model, batch.features,
+                                              datasize=dataset.size,
+                                              lengths=batch.lengths.tolist(),
+                                              viterbi=False)
+            elbo.backward()
+            optim.step()
+
+            # The whole batch is a single term of the ELBO (whereas
+            # "train" adds one term per utterance): normalizing by the
+            # size of the data set gives the per-frame ELBO.
+            logger.info(f'{"epoch=" + str(epoch):<20}  ' \
+                        f'{"batch=" + str(i) + "/" + str(len(batches)):<20} ' \
+                        f'{"ELBO=" + str(round(float(elbo) / dataset.size, 3)):<20}')
+
+
+def train_parallel(args, logger, model, dataset, optim):
+    '''Data-parallel training: each batch is split into shards processed
+    by a pool of workers, the parent process reduces the accumulated
+    statistics and updates the model.'''
+    params = _parameters(model)
+    shared_nparams = [param.posterior.natural_parameters.clone().share_memory_()
+                      for param in params]
+    pool = mp.Pool(args.num_workers, initializer=_init_worker,
+                   initargs=(args.model, args.dataset, shared_nparams))
+
+    uttids = [utt.id for utt in dataset.utterances(random_order=False)]
+    batch_size = args.batch_size if args.batch_size > 0 else len(uttids)
+    nbatches = max(len(uttids) // batch_size, 1)
+    version = 0
+    try:
+        for epoch in range(1, args.epochs + 1):
+            random.shuffle(uttids)
+            for batch_no in range(nbatches):
+                start = batch_no * batch_size
+                end = start + batch_size if batch_no < nbatches - 1 \
+                      else len(uttids)
+                batch = uttids[start:end]
+                shards = [(version, batch[i::args.num_workers])
+                          for i in range(args.num_workers)]
+
+                optim.init_step()
+                elbo = beer.evidence_lower_bound(model, datasize=dataset.size)
+                for value, stats, mb_size in pool.map(_worker_elbo, shards):
+                    elbo += beer.inference.objectives.EvidenceLowerBoundInstance(
+                        torch.tensor(value),
+                        beer.StatisticsAccumulator(params, stats), params,
+                        mb_size, dataset.size)
+                elbo.backward()
+                optim.step()
+
+                # Publish the new parameters to the workers.
+                for param, nparams in zip(params, shared_nparams):
+                    nparams.copy_(param.posterior.natural_parameters)
+                version += 1
+
+                logger.info(f'{"epoch=" + str(epoch):<20}  ' \
+                            f'{"batch=" + str(batch_no + 1) + "/" + str(nbatches):<20} ' \
+                            f'{"ELBO=" + str(round(float(elbo) / (len(batch) * dataset.size), 3)):<20}')
+    finally:
+        pool.terminate()
+
+
+def main(args, logger):
+    logger.debug('load the model')
+    with open(args.model, 'rb') as f:
+        model = pickle.load(f)
+
+    logger.debug('load the dataset')
+    with open(args.dataset, 'rb') as f:
+        dataset = pickle.load(f)
+
+    logger.debug('create the optimizer')
+    optim = beer.BayesianModelOptimizer(model.mean_field_factorization(),
+                                        lrate=args.lrate)
+
+    if args.num_workers > 1:
+        logger.debug(f'training with {args.num_workers} processes')
+        train_parallel(args, logger, model, dataset, optim)
+    elif args.max_frames > 0:
+        logger.debug(f'training with batches of at most {args.max_frames} '
+                     'frames')
+        train_bucketed(args, logger, model, dataset, optim)
+    else:
+        train(args, logger, model, dataset, optim)
+
     logger.debug('save the model on disk...')
     with open(args.out, 'wb') as f:
         pickle.dump(model, f)
@@ -8,6 +8,7 @@ import sys
 
 import torch
 import beer
+from ...accstats import elbo_from_shard, reduce_shards
 
 
 def setup(parser):
@@ -36,24 +37,14 @@ def main(args, logger):
 
     optim.init_step()
 
-    elbo = None
-    nutts = 0
-    count = 0
-    for line in sys.stdin:
-        path = line.strip()
-        logger.debug(f'loading ELBO stored in {path}')
-        with open(path, 'rb') as f:
-            elbo_batch, nutts_batch = pickle.load(f)
-        if elbo is None:
-            elbo = elbo_batch
-            nutts = nutts_batch
-        else:
-            elbo += elbo_batch
-            nutts += nutts_batch
-        count += 1
+    # The statistics (possibly already reduced with "reduce") are
+    # summed one file after another.
+    paths = (line.strip() for line in sys.stdin if line.strip())
+    shard = reduce_shards(paths)
+    nutts = shard.count
 
     logger.debug('synchronizing the ELBO and the model')
-    elbo.sync(model)
+    elbo = elbo_from_shard(shard, model)
 
     logger.debug('computing the gradient')
     elbo.backward()
@@ -69,7 +60,7 @@ def main(args, logger):
         logger.debug(f'saving the optimizer state to: {args.optim_state}')
         torch.save(optim.state_dict(), args.optim_state)
 
-    logger.info(f'accumulated ELBO={float(elbo)/(nutts * elbo._datasize):.3f}')
+    logger.info(f'accumulated ELBO={float(elbo)/(nutts * elbo.datasize):.3f}')
 
 if __name__ == "__main__":
     main()
@@ -31,7 +31,7 @@ def bark2hz(bark):
 def __triangle(center, start, end, freqs):
     'Create triangular filter.'
     slopes = 1. / (center - start), 1./ (end - center)
-    retval = np.zeros_like(freqs).astype(np.float)
+    retval = np.zeros_like(freqs).astype(float)
     idxs = np.logical_and(freqs >= start, freqs <= center)
     retval[idxs] = np.linspace(slopes[0] * (freqs[idxs][0] - start),
                                slopes[0] * (freqs[idxs][-1] - start),
@@ -172,16 +172,23 @@ def fbank(signal, flen=0.025, frate=0.01, hifreq=8000, lowfreq=20, nfilters=26,
         window (function): Windowing function.
 
     '''
+    # Pre-emphasis filtering.
+    s_t = np.array(signal, dtype=np.float32)
+    s_t -= preemph * np.r_[s_t[0], s_t[:-1]]
+
+    return _fbank_from_preemphasized(s_t, flen, frate, hifreq, lowfreq,
+                                     nfilters, srate)
+
+
+# FBANK features of an already pre-emphasized signal.
+def _fbank_from_preemphasized(s_t, flen, frate, hifreq, lowfreq, nfilters,
+                              srate):
     # Convert the frame rate/length from second to number of samples.
     frate_samp = int(srate * frate)
     flen_samp = int(srate * flen)
 
     # Compute the number of frames.
-    nframes = (len(signal) - flen_samp) // frate_samp + 1
-
-    # Pre-emphasis filtering.
-    s_t = np.array(signal, dtype=np.float32)
-    s_t -= preemph * np.r_[s_t[0], s_t[:-1]]
+    nframes = max((len(s_t) - flen_samp) // frate_samp + 1, 0)
 
     # Extract the overlapping frames.
     isize = s_t.dtype.itemsize
@@ -202,3 +209,290 @@ def fbank(signal, flen=0.025, frate=0.01, hifreq=8000, lowfreq=20, nfilters=26,
     melspec = magspec @ filters.T
 
     return np.log(melspec + 1)
+
+
+class StreamingFbank:
+    '''Chunked counterpart of :any:`fbank`: extract the FBANK features
+    of a signal given chunk by chunk.
+
+    The concatenation of the features returned for each chunk is equal
+    to the features of the whole signal as computed by :any:`fbank`.
+
+    Example:
+        >>> stream = StreamingFbank(srate=16000)
+        >>> for chunk in chunks:
+        ...     fea = stream.process(chunk)
+
+    '''
+
+    def __init__(self, flen=0.025, frate=0.01, hifreq=8000, lowfreq=20,
+                 nfilters=26, preemph=0.97, srate=16000):
+        self.flen = flen
+        self.frate = frate
+        self.hifreq = hifreq
+        self.lowfreq = lowfreq
+        self.nfilters = nfilters
+        self.preemph = preemph
+        self.srate = srate
+
+        # Last raw sample of the previous chunk (for the pre-emphasis)
+        # and pre-emphasized samples not yet consumed by a frame.
+        self._last_sample = None
+        self._buffer = np.zeros(0, dtype=np.float32)
+
+    def process(self, chunk):
+        '''Features of all the frames completed by the chunk.
+
+        Args:
+            chunk (numpy.ndarray): Next samples of the signal.
+
+        Returns:
+            (``numpy.ndarray[nframes, nfilters]``): features of the new
+                frames (possibly none).
+
+        '''
+        s_t = np.array(chunk, dtype=np.float32)
+        if len(s_t) > 0:
+            previous = s_t[0] if self._last_sample is None else self._last_sample
+            self._last_sample = s_t[-1]
+            s_t -= self.preemph * np.r_[previous, s_t[:-1]]
+        s_t = np.r_[self._buffer, s_t]
+
+        fea = _fbank_from_preemphasized(s_t, self.flen, self.frate,
+                                        self.hifreq, self.lowfreq,
+                                        self.nfilters, self.srate)
+
+        # Keep the samples needed by the next frames.
+        frate_samp = int(self.srate * self.frate)
+        self._buffer = s_t[len(fea) * frate_samp:].copy()
+        return fea
+
+########################################################################
+# Batched features extraction: the features of several utterances are
+# computed at once. Internally, the utterances are concatenated (along
+# the time axis) and the number of frames of each utterance is used to
+# split the result into per-utterance views.
+
+
+@lru_cache(maxsize=8)
+def create_dct_bases(nfilters, n_dct_coeff):
+    '''Create the DCT (type II, without the 0th coefficient) bases.
+
+    Args:
+        nfilters (int): Number of filters (i.e. input dimension).
+        n_dct_coeff (int): Number of coefficients.
+
+    Returns
+        (numpy.ndarray): The bases as a (nfilters x n_dct_coeff) matrix.
+
+    '''
+    dct_bases = np.zeros((nfilters, n_dct_coeff))
+    for m in range(n_dct_coeff):
+        dct_bases[:, m] = np.cos((m+1) * np.pi / nfilters * \
+                                 (np.arange(nfilters) + 0.5))
+    return dct_bases
+
+
+@lru_cache(maxsize=8)
+def create_lifter(n_dct_coeff, lifter_coeff):
+    '''Create the cepstral liftering weights.
+
+    Args:
+        n_dct_coeff (int): Number of cepstral coefficients.
+        lifter_coeff (int): Liftering coefficient.
+
+    Returns
+        (numpy.ndarray): The weights.
+
+    '''
+    return 1 + (lifter_coeff / 2) * np.sin(np.pi * \
+        (1 + np.arange(n_dct_coeff)) / lifter_coeff)
+
+
+def _concatenate(signals, offsets=None, dtype=np.float64):
+    if offsets is None:
+        lengths = np.array([len(signal) for signal in signals], dtype=int)
+        buffer = np.concatenate([np.asarray(signal, dtype=dtype)
+                                 for signal in signals]) \
+                 if len(signals) > 0 else np.zeros(0, dtype=dtype)
+        offsets = np.cumsum(lengths) - lengths
+    else:
+        buffer = np.asarray(signals, dtype=dtype)
+        offsets = np.asarray(offsets, dtype=int)
+        lengths = np.diff(np.r_[offsets, len(buffer)])
+    return buffer, offsets, lengths
+
+
+def _split(fea, nframes):
+    return np.split(fea, np.cumsum(nframes)[:-1])
+
+
+def batch_short_term_mspec(signals, offsets=None, flen=0.025, frate=0.01,
+                           preemph=0.97, srate=16000, window=np.hamming,
+                           dtype=np.float64):
+    '''Short term magnitude spectrum of several signals at once (see
+    :any:`short_term_mspec`).
+
+    Args:
+        signals (list): List of raw audio signals or a single buffer
+            with all the signals concatenated (see ``offsets``).
+        offsets (list): If provided, ``signals`` is a single buffer and
+            ``offsets`` the start index of each signal in it.
+        flen (float): Frame duration in seconds.
+        frate (int): Frame rate in Hertz.
+        srate (int): Expected sampling rate of the audio.
+        window (function): Windowing function (default: hamming).
+        dtype (``numpy.dtype``): Precision of the computation.
+
+    Returns:
+        mspec (``numpy.ndarray``): Magnitude spectrum of all the frames
+            of all the signals.
+        fft_len (int): Length of the FFT used.
+        nframes (``numpy.ndarray``): Number of frames per signal.
+
+    '''
+    buffer, offsets, lengths = _concatenate(signals, offsets, dtype)
+
+    # Remove the DC offset of each signal.
+    sums = np.zeros(len(offsets), dtype=dtype)
+    non_empty = lengths > 0
+    if non_empty.any():
+        sums[non_empty] = np.add.reduceat(buffer, offsets[non_empty])
+    means = (sums / np.maximum(lengths, 1)).astype(dtype)
+    buffer = buffer - np.repeat(means, lengths)
+
+    # Convert the frame rate/length from second to number of samples.
+    frate_samp = int(srate * frate)
+    flen_samp = int(srate * flen)
+
+    # Index of the first sample of each frame in the buffer.
+    nframes = np.maximum((lengths - flen_samp) // frate_samp + 1, 0)
+    frame_offsets = np.cumsum(nframes) - nframes
+    frame_idxs = np.arange(nframes.sum()) - np.repeat(frame_offsets, nframes)
+    starts = np.repeat(offsets, nframes) + frate_samp * frame_idxs
+
+    # Pre-emphasis. It is applied independently on each frame: the
+    # filtered signal is computed once for the whole buffer and only
+    # the first sample of each frame is corrected.
+    emph_buffer = np.empty_like(buffer)
+    emph_buffer[1:] = buffer[1:] - preemph * buffer[:-1]
+    emph_buffer[:1] = buffer[:1]
+
+    # Extract the overlapping frames: all the windows of the buffer are
+    # viewed (without copy) and only the selected ones are copied.
+    isize = emph_buffer.dtype.itemsize
+    nwindows = max(len(emph_buffer) - flen_samp + 1, 0)
+    windows = np.lib.stride_tricks.as_strided(emph_buffer,
+                                              shape=(nwindows, flen_samp),
+                                              strides=(isize, isize),
+                                              writeable=False)
+    sframes = windows[starts]
+    sframes[:, 0] = (1 - preemph) * buffer[starts]
+
+    # Apply the window function.
+    sframes *= window(flen_samp).astype(dtype)[None, :]
+
+    # Compute FFT.
+    fft_len = int(2 ** np.floor(np.log2(flen_samp) + 1))
+    mspec = np.abs(np.fft.rfft(sframes, n=fft_len, axis=-1)[:, :-1])
+    return mspec.astype(dtype, copy=False), fft_len, nframes
+
+
+def batch_add_deltas(fea, nframes, winlens=(2, 2)):
+    '''Add derivatives to the features of several utterances (see
+    :any:`add_deltas`).
+
+    Args:
+        fea (numpy.ndarray): Features of all the utterances
+            concatenated.
+        nframes (list): Number of frames of each utterance.
+        winlens: tuple with window lengths for deltas, double deltas,
+            ... default is (2,2)
+
+    Returns:
+        numpy.ndarray: Feature array augmented with derivatives.
+
+    '''
+    nframes = np.asarray(nframes, dtype=int)
+    ends = np.cumsum(nframes)
+    starts = np.repeat(ends - nframes, nframes)
+    ends = np.repeat(ends - 1, nframes)
+    frame_idxs = np.arange(len(fea))
+    fea_list = [fea]
+    for wlen in winlens:
+        # The first/last frame of each utterance is repeated at the
+        # boundaries.
+        delta = np.zeros_like(fea)
+        for k in range(1, wlen + 1):
+            after = np.minimum(frame_idxs + k, ends)
+            before = np.maximum(frame_idxs - k, starts)
+            delta += k * (fea[after] - fea[before])
+        fea = delta / (2 * sum(k ** 2 for k in range(-wlen, wlen + 1)))
+        fea_list.append(fea)
+    return np.hstack(fea_list)
+
+
+def batch_mfcc(signals, offsets=None, flen=0.025, frate=0.01, preemph=0.97,
+               srate=16000, nfilters=26, lowfreq=20, hifreq=8000,
+               n_dct_coeff=13, lifter_coeff=22, add_energy=True,
+               deltas=(2, 2), dtype=np.float64):
+    '''Extract the MFCC (or log Mel filter bank) features of several
+    utterances at once.
+
+    The signals are processed together by a few large vectorized
+    operations which is much faster than processing them one by one
+    when the utterances are short.
+
+    Args:
+        signals (list): List of raw audio signals or a single buffer
+            with all the signals concatenated (see ``offsets``).
+        offsets (list): If provided, ``signals`` is a single buffer and
+            ``offsets`` the start index of each signal in it.
+        flen (float): Frame duration in seconds.
+        frate (int): Frame rate in Hertz.
+        preemph (float): Pre-emphasis coefficient.
+        srate (int): Expected sampling rate of the audio.
+        nfilters (int): Number of filters.
+        lowfreq (float): Global cut off frequency (Hz).
+        hifreq (float): Global cut off frequency (Hz).
+        n_dct_coeff (int): Number of cepstral coefficients. If None,
+            return the log Mel filter bank outputs.
+        lifter_coeff (int): Liftering coefficient.
+        add_energy (boolean): Prepend the energy of each frame.
+        deltas (tuple): Window lengths of the derivatives (empty for
+            no derivatives).
+        dtype (``numpy.dtype``): Precision of the computation.
+
+    Returns:
+        list: Features (``numpy.ndarray``) of each utterance. The
+        arrays are views of a single buffer.
+
+    '''
+    mspec, fft_len, nframes = batch_short_term_mspec(
+        signals, offsets, flen=flen, frate=frate, preemph=preemph,
+        srate=srate, dtype=dtype
+    )
+
+    # Filter bank.
+    filters = create_fbank(nfilters, fft_len, lowfreq=lowfreq, highfreq=hifreq)
+    log_melspec = np.log(1e-6 + mspec @ filters.T.astype(dtype))
+
+    # HTK compatibility normalization.
+    norm = np.sqrt(2. / nfilters)
+
+    # DCT transform and liftering.
+    if n_dct_coeff is not None:
+        dct_bases = create_dct_bases(nfilters, n_dct_coeff).astype(dtype)
+        lifter = create_lifter(n_dct_coeff, lifter_coeff).astype(dtype)
+        fea = (log_melspec @ dct_bases) * (norm * lifter)
+    else:
+        fea = log_melspec
+
+    if add_energy:
+        energy = log_melspec.sum(axis=-1) * norm
+        fea = np.c_[energy, fea]
+
+    if deltas:
+        fea = batch_add_deltas(fea, nframes, deltas)
+
+    return _split(fea.astype(dtype, copy=False), nframes)
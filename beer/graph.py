@@ -3,10 +3,27 @@
 from collections import defaultdict, OrderedDict
 from dataclasses import dataclass, field
 from typing import Set, Dict, TypeVar, Generic
+import math
+import numpy as np
 import torch
 from .utils import logsumexp
 
-__all__ = ['Graph']
+__all__ = ['Graph', 'CompiledGraph', 'SparseCompiledGraph',
+           'BandedCompiledGraph', 'StreamingViterbi']
+
+
+# Compiled graphs whose density (see :any:`CompiledGraph.density`) is
+# below this threshold use the sparse inference.
+SPARSE_MAX_DENSITY = .25
+
+# Sparse compiled graphs whose non-zero transitions lie in a band (around
+# the diagonal of the transition matrix) of at most this width (e.g.
+# left-to-right graphs) use the banded inference.
+BANDED_MAX_WIDTH = 3
+
+# Maximum number of elements of the intermediate tensors of the
+# parallel-in-time inference (see :any:`CompiledGraph.posteriors`).
+PARALLEL_MAX_SIZE = 2 ** 24
 
 
 # Create some new type to use with the "dataclass" code generator.
@@ -69,6 +86,25 @@ class Graph:
     start_state: int = field(default=None, init=False, repr=False)
     end_state: int = field(default=None, init=False, repr=False)
 
+    # Outgoing/incoming arcs of each state.
+    _out_arcs: Dict[int, Set[ArcType]] = field(
+        default_factory=lambda: defaultdict(set), init=False, repr=False,
+        compare=False)
+    _in_arcs: Dict[int, Set[ArcType]] = field(
+        default_factory=lambda: defaultdict(set), init=False, repr=False,
+        compare=False)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # Graphs pickled before the adjacency indexes were introduced.
+        if '_out_arcs' not in state:
+            self._out_arcs = defaultdict(set)
+            self._in_arcs = defaultdict(set)
+            for arc in self._arcs:
+                self._out_arcs[arc.start].add(arc)
+                self._in_arcs[arc.end].add(arc)
+
     def _repr_svg_(self):
         return _show_graph(self)
 
@@ -92,13 +128,13 @@ class Graph:
         Yields:
             ``Arc``.
         '''
-        for arc in self._arcs:
-            if not incoming:
-                if arc.start == state_id or state_id is None:
-                    yield arc
-            else:
-                if arc.end == state_id or state_id is None:
-                    yield arc
+        if state_id is None:
+            arcs = self._arcs
+        elif incoming:
+            arcs = self._in_arcs.get(state_id, ())
+        else:
+            arcs = self._out_arcs.get(state_id, ())
+        yield from arcs
 
     def add_state(self, pdf_id=None):
         state_id = self._state_count
@@ -109,49 +145,72 @@ class Graph:
 
     def add_arc(self, start, end, weight=1.0):
         new_arc = Arc(start, end, weight)
-        self._arcs.add(new_arc)
+        if new_arc not in self._arcs:
+            self._arcs.add(new_arc)
+            self._out_arcs[start].add(new_arc)
+            self._in_arcs[end].add(new_arc)
         return new_arc
 
+    def _remove_arc(self, arc):
+        self._arcs.remove(arc)
+        self._out_arcs[arc.start].discard(arc)
+        self._in_arcs[arc.end].discard(arc)
+
     def normalize(self):
         for state_id in self.states():
+            arcs = self._out_arcs.get(state_id, ())
             sum_out_weights = 0.
-            for arc in self.arcs(state_id):
+            for arc in arcs:
                 sum_out_weights += arc.weight
-            for arc in self.arcs(state_id):
+            for arc in arcs:
                 arc.weight /= sum_out_weights
 
     def replace_state(self, old_state_id, graph):
         '''Replace a state with a graph.'''
+        self.replace_states({old_state_id: graph})
+
+    def replace_states(self, graphs):
+        '''Replace several states with a graph each in a single pass.
+
+        Args:
+            graphs (dict): Mapping state id -> :any:`Graph`.
 
-        # Copy the states.
-        new_states = {}
-        for state_id in graph.states():
-            pdf_id = graph._states[state_id].pdf_id
-            new_state_id = self.add_state(pdf_id=pdf_id)
-            new_states[state_id] = new_state_id
-
-        # Copy the arcs.
-        for arc in graph.arcs():
-            self.add_arc(new_states[arc.start], new_states[arc.end], arc.weight)
-
-        # Connect the unit graph to the main graph.
-        to_delete = []
-        new_arcs = []
-        for arc in self.arcs(old_state_id):
-            to_delete.append(arc)
-            new_arcs.append((new_states[graph.end_state], arc.end, arc.weight))
-        for arc in self.arcs(old_state_id, incoming=True):
-            to_delete.append(arc)
-            new_arcs.append((arc.start, new_states[graph.start_state], arc.weight))
-
-        # Add the new arcs.
-        for start, end, weight in new_arcs:
-            self.add_arc(start, end, weight)
-
-        # Remove the old arcs and the replaced state.
-        for arc in to_delete:
+        '''
+        # Copy the states and the arcs of the sub-graphs and keep track
+        # of their entry/exit states.
+        entry_states, exit_states = {}, {}
+        for old_state_id, graph in graphs.items():
+            new_states = {}
+            for state_id in graph.states():
+                pdf_id = graph._states[state_id].pdf_id
+                new_states[state_id] = self.add_state(pdf_id=pdf_id)
+            for arc in graph.arcs():
+                self.add_arc(new_states[arc.start], new_states[arc.end],
+                             arc.weight)
+            entry_states[old_state_id] = new_states[graph.start_state]
+            exit_states[old_state_id] = new_states[graph.end_state]
+
+        # Collect the arcs of the replaced states.
+        old_arcs = set()
+        for old_state_id in graphs:
+            old_arcs.update(self._out_arcs.pop(old_state_id, ()))
+            old_arcs.update(self._in_arcs.pop(old_state_id, ()))
+
+        # Remove them and connect the sub-graphs to the main graph. An
+        # arc between two replaced states connects the exit state of
+        # the first sub-graph to the entry state of the second one.
+        for arc in old_arcs:
             self._arcs.remove(arc)
-        del self._states[old_state_id]
+            if arc.start in self._out_arcs:
+                self._out_arcs[arc.start].discard(arc)
+            if arc.end in self._in_arcs:
+                self._in_arcs[arc.end].discard(arc)
+        for arc in old_arcs:
+            self.add_arc(exit_states.get(arc.start, arc.start),
+                         entry_states.get(arc.end, arc.end), arc.weight)
+
+        for old_state_id in graphs:
+            del self._states[old_state_id]
 
     def find_next_pdf_ids(self, start_state, init_weight=1.0):
         to_explore = [(arc, init_weight) for arc in self.arcs(start_state)]
@@ -195,21 +254,30 @@ class Graph:
                 pdf_id_mapping.append(state.pdf_id)
                 tot_n_states += 1
 
-        init_probs = torch.zeros(tot_n_states)
-        final_probs = torch.zeros(tot_n_states)
-        trans_probs = torch.zeros(tot_n_states, tot_n_states)
-
         # Init probs.
+        init_probs = torch.zeros(tot_n_states)
+        idxs, weights = [], []
         for state_id, weight in self.find_next_pdf_ids(self.start_state, 1.0):
-            init_probs[state2pdf_id[state_id]] += weight
+            idxs.append(state2pdf_id[state_id])
+            weights.append(weight)
+        init_probs.index_add_(0, torch.LongTensor(idxs), torch.tensor(weights))
         init_probs /= init_probs.sum()
 
-        # Init probs.
+        # Final probs.
+        final_probs = torch.zeros(tot_n_states)
+        idxs, weights = [], []
         for state_id, weight in self.find_previous_pdf_ids(self.end_state, 1.0):
-            final_probs[state2pdf_id[state_id]] += weight
+            idxs.append(state2pdf_id[state_id])
+            weights.append(weight)
+        final_probs.index_add_(0, torch.LongTensor(idxs), torch.tensor(weights))
         final_probs /= final_probs.sum()
 
-        # Transprobs
+        # Transprobs: collect all the (source, destination, weight)
+        # triplets and accumulate them in one call.
+        # The emitting states reachable from a non-emitting state are
+        # computed only once.
+        next_pdf_ids = {}
+        srcs, dests, weights = [], [], []
         for arc in self.arcs():
             pdf_id1 = self._states[arc.start].pdf_id
             pdf_id2 = self._states[arc.end].pdf_id
@@ -222,22 +290,110 @@ class Graph:
             # We need to follow the path until the next valid pdf_id
             pdf_id1 = state2pdf_id[arc.start]
             if pdf_id2 is None:
-                for state_id, weight in self.find_next_pdf_ids(arc.end, weight):
-                    trans_probs[pdf_id1, state2pdf_id[state_id]] += weight
+                if arc.end not in next_pdf_ids:
+                    next_pdf_ids[arc.end] = [
+                        (state2pdf_id[state_id], next_weight)
+                        for state_id, next_weight in self.find_next_pdf_ids(arc.end)
+                    ]
+                for dest, next_weight in next_pdf_ids[arc.end]:
+                    srcs.append(pdf_id1)
+                    dests.append(dest)
+                    weights.append(weight * next_weight)
             else:
-                trans_probs[pdf_id1, state2pdf_id[arc.end]] += weight
+                srcs.append(pdf_id1)
+                dests.append(state2pdf_id[arc.end])
+                weights.append(weight)
+        trans_probs = torch.zeros(tot_n_states, tot_n_states)
+        trans_probs.index_put_((torch.LongTensor(srcs), torch.LongTensor(dests)),
+                               torch.tensor(weights, dtype=trans_probs.dtype),
+                               accumulate=True)
 
         # Normalize the transition matrix withouth changing its diagonal.
-        for dim in range(len(trans_probs)):
-            diag = trans_probs[dim, dim].clone()
-            off_diag  = trans_probs[dim, :].sum() - diag
-            if diag > 0. and off_diag > 0:
-                norms = off_diag
-                trans_probs[dim, :] /= norms / (1 - diag)
-                trans_probs[dim, dim] =  diag
+        diag = trans_probs.diag().clone()
+        off_diag = trans_probs.sum(dim=1) - diag
+        mask = (diag > 0.) & (off_diag > 0.)
+        trans_probs[mask] /= (off_diag[mask] / (1 - diag[mask]))[:, None]
+        idxs = mask.nonzero()[:, 0]
+        trans_probs[idxs, idxs] = diag[idxs]
+
+        compiled_graph = CompiledGraph(init_probs.log(), final_probs.log(),
+                                       trans_probs.log(), pdf_id_mapping)
 
-        return CompiledGraph(init_probs.log(), final_probs.log(),
-                             trans_probs.log(), pdf_id_mapping)
+        # Left-to-right graphs (e.g. alignment graphs) are compiled
+        # into a banded graph.
+        if compiled_graph.is_banded():
+            return compiled_graph.to_banded()
+        return compiled_graph
+
+
+# Indices of the states to keep given the beam (in log domain) and the
+# maximum number of active states.
+def _active_states(log_values, beam=None, max_active=None):
+    mask = log_values > float('-inf')
+    if beam is not None:
+        mask &= log_values >= log_values.max() - beam
+    if max_active is not None and int(mask.sum()) > max_active:
+        _, best_idxs = torch.topk(log_values, max_active)
+        best_mask = torch.zeros_like(mask)
+        best_mask[best_idxs] = True
+        mask &= best_mask
+    return mask.nonzero()[:, 0]
+
+
+# Set all the values but the active ones to -inf.
+def _prune(log_values, active_idxs):
+    pruned = torch.zeros_like(log_values) - float('inf')
+    pruned[active_idxs] = log_values[active_idxs]
+    return pruned
+
+
+# Product of batches of matrices ([B, K, K]) in the log semiring
+# ("reduce" is torch.logsumexp) or in the max-plus semiring ("reduce"
+# is torch.amax). The batch is processed in slices to bound the size
+# of the [B, K, K, K] intermediate tensor.
+def _semiring_matmul(mats1, mats2, reduce):
+    n_states = mats1.shape[-1]
+    step = max(1, PARALLEL_MAX_SIZE // n_states ** 3)
+    return torch.cat([
+        reduce(slice1[:, :, :, None] + slice2[:, None, :, :], dim=2)
+        for slice1, slice2 in zip(mats1.split(step), mats2.split(step))
+    ])
+
+
+# Identity matrices of the log/max-plus semirings.
+def _semiring_eye(n_mats, n_states, dtype, device):
+    eye = torch.zeros(n_states, n_states, dtype=dtype, device=device)
+    eye -= float('inf')
+    eye.fill_diagonal_(0.)
+    return eye.expand(n_mats, -1, -1)
+
+
+# Product of the [L, K, K] matrices of each of the [B] blocks. The
+# pairs of consecutive matrices are multiplied in parallel: log2(L)
+# steps.
+def _reduce_blocks(mats, reduce):
+    n_blocks, n_states = mats.shape[0], mats.shape[-1]
+    while mats.shape[1] > 1:
+        if mats.shape[1] % 2 == 1:
+            eye = _semiring_eye(n_blocks, n_states, mats.dtype, mats.device)
+            mats = torch.cat([mats, eye[:, None]], dim=1)
+        prods = _semiring_matmul(mats[:, 0::2].reshape(-1, n_states, n_states),
+                                 mats[:, 1::2].reshape(-1, n_states, n_states),
+                                 reduce)
+        mats = prods.view(n_blocks, -1, n_states, n_states)
+    return mats[:, 0]
+
+
+# Inclusive prefix products M[0] M[1] ... M[i] of a sequence of
+# matrices ([N, K, K]): log2(N) parallel steps (Hillis-Steele scan).
+def _scan(mats, reduce):
+    offset = 1
+    while offset < len(mats):
+        mats = torch.cat([mats[:offset],
+                          _semiring_matmul(mats[:-offset], mats[offset:],
+                                           reduce)])
+        offset *= 2
+    return mats
 
 
 class CompiledGraph(torch.nn.Module):
@@ -267,26 +423,436 @@ class CompiledGraph(torch.nn.Module):
         'Total number of states in the graph.'
         return len(self.trans_log_probs)
 
+    def density(self):
+        '''Ratio between the largest number of incoming/outgoing arcs
+        of a state and the total number of states.'''
+        mask = self.trans_log_probs > float('-inf')
+        max_degree = max(int(mask.sum(dim=0).max()),
+                         int(mask.sum(dim=1).max()))
+        return max_degree / self.n_states
+
+    def band_limits(self):
+        '''Offsets (column index minus row index) of the first and last
+        diagonals of the transition matrix with a non-zero transition.'''
+        rows, cols = (self.trans_log_probs > float('-inf')).nonzero(
+            as_tuple=True)
+        if len(rows) == 0:
+            return 0, 0
+        offsets = cols - rows
+        return int(offsets.min()), int(offsets.max())
+
+    def is_banded(self):
+        '''True if the graph is sparse and its transitions lie in a
+        narrow band around the diagonal of the transition matrix (see
+        :any:`BANDED_MAX_WIDTH`).'''
+        lower, upper = self.band_limits()
+        return self.density() <= SPARSE_MAX_DENSITY \
+            and upper - lower + 1 <= BANDED_MAX_WIDTH
+
+    def to_sparse(self):
+        'Sparse version of the graph.'
+        return SparseCompiledGraph(self.init_log_probs, self.final_log_probs,
+                                   self.trans_log_probs, self.pdf_id_mapping)
+
+    def to_banded(self):
+        'Banded version of the graph.'
+        return BandedCompiledGraph(self.init_log_probs, self.final_log_probs,
+                                   self.trans_log_probs, self.pdf_id_mapping)
+
+    def optimize(self):
+        '''Return the compiled graph with the most efficient
+        representation for the inference. The result is cached until
+        the transition matrix is replaced or modified in place.'''
+        trans = self.trans_log_probs
+        cached = self.__dict__.get('_optimized_cache')
+        if cached is not None and cached[0] is trans \
+                and cached[1] == trans._version:
+            return cached[2]
+        if self.is_banded():
+            optimized = self.to_banded()
+        elif self.density() <= SPARSE_MAX_DENSITY:
+            optimized = self.to_sparse()
+        else:
+            optimized = self
+        self.__dict__['_optimized_cache'] = (trans, trans._version, optimized)
+        return optimized
+
+    ####################################################################
+    # Elementary operations of the inference algorithms. All of them
+    # accept inputs with extra leading (i.e. batch) dimensions.
+
+    # log sum_i exp(log_alphas[i] + log A[i, j])
+    def _forward_step(self, log_alphas):
+        return torch.logsumexp(log_alphas[..., :, None] + self.trans_log_probs,
+                               dim=-2)
+
+    # log sum_j exp(log A[i, j] + values[j])
+    def _backward_step(self, values):
+        return torch.logsumexp(self.trans_log_probs + values[..., None, :],
+                               dim=-1)
+
+    # max_i omega[i] + log A[i, j] and the corresponding i.
+    def _viterbi_step(self, omega):
+        hypothesis = omega[..., :, None] + self.trans_log_probs
+        return torch.max(hypothesis, dim=-2)
+
+    # Posteriors (in the probability domain) of the transitions given
+    # the forward/backward values of two consecutive frames.
+    def _trans_posteriors(self, log_alphas, llhs_betas, lognorm):
+        log_xi = log_alphas[..., :, None] + self.trans_log_probs + \
+                 llhs_betas[..., None, :]
+        trans_posts = (log_xi - lognorm).exp()
+        return torch.where(trans_posts != trans_posts,
+                           torch.zeros_like(trans_posts),
+                           trans_posts)
+
+    # Same as the above but only the active states (as given by
+    # "active_idxs") are considered. The cost is proportional to the
+    # number of active states.
+
+    def _pruned_forward_step(self, log_alphas, active_idxs):
+        return torch.logsumexp(log_alphas[active_idxs, None] + \
+                               self.trans_log_probs[active_idxs], dim=0)
+
+    def _pruned_backward_step(self, values, active_idxs):
+        return torch.logsumexp(self.trans_log_probs[active_idxs] + values,
+                               dim=-1)
+
+    def _pruned_viterbi_step(self, omega, active_idxs):
+        hypothesis = omega[active_idxs, None] + \
+                     self.trans_log_probs[active_idxs]
+        best_hypothesis, backtrack = torch.max(hypothesis, dim=0)
+        return best_hypothesis, active_idxs[backtrack]
+
+    # Add the posteriors of the transitions from the active states
+    # "src_idxs" to the active states "dest_idxs" to the (dense)
+    # transition counts.
+    def _pruned_trans_counts(self, trans_counts, log_alphas, llhs_betas,
+                             lognorm, src_idxs, dest_idxs):
+        log_xi = log_alphas[src_idxs, None] + \
+                 self.trans_log_probs[src_idxs[:, None], dest_idxs] + \
+                 llhs_betas[dest_idxs]
+        trans_posts = (log_xi - lognorm).exp()
+        trans_posts = torch.where(trans_posts != trans_posts,
+                                  torch.zeros_like(trans_posts),
+                                  trans_posts)
+        idxs = (src_idxs[:, None] * self.n_states + dest_idxs).view(-1)
+        trans_counts.view(-1).index_add_(0, idxs, trans_posts.view(-1))
+
+    ####################################################################
+
     def _baum_welch_forward(self, llhs):
-        log_trans_mat = self.trans_log_probs
         log_alphas = torch.zeros_like(llhs) - float('inf')
         log_alphas[0] = llhs[0] + self.init_log_probs
         for i in range(1, llhs.shape[0]):
-            log_alphas[i] = llhs[i]
-            log_alphas[i] += torch.logsumexp(log_alphas[i-1] + log_trans_mat.t(),
-                                             dim=1).view(-1)
+            log_alphas[i] = llhs[i] + self._forward_step(log_alphas[i-1])
         return log_alphas
 
-    def _baum_welch_backward(self, llhs):
-        log_trans_mat = self.trans_log_probs
+    # If the forward values are given, the expected transition counts
+    # (summed over time) are accumulated during the backward recursion
+    # and returned along with the backward values.
+    def _baum_welch_backward(self, llhs, log_alphas=None):
         log_betas = torch.zeros_like(llhs) - float('inf')
         log_betas[-1] = self.final_log_probs
+        if log_alphas is not None:
+            lognorm = torch.logsumexp(log_alphas[-1] + log_betas[-1], dim=-1)
+            trans_counts = llhs.new_zeros(self.n_states, self.n_states)
         for i in reversed(range(llhs.shape[0]-1)):
-            log_betas[i] = torch.logsumexp(log_trans_mat + llhs[i+1] + \
-                           log_betas[i+1], dim=1).view(-1)
+            llhs_betas = llhs[i+1] + log_betas[i+1]
+            log_betas[i] = self._backward_step(llhs_betas)
+            if log_alphas is not None:
+                trans_counts += self._trans_posteriors(log_alphas[i],
+                                                       llhs_betas, lognorm)
+        if log_alphas is not None:
+            return log_betas, trans_counts
         return log_betas
 
-    def posteriors(self, llhs, trans_posteriors=False):
+    def _pruned_baum_welch_forward(self, llhs, beam, max_active):
+        log_alphas = torch.zeros_like(llhs) - float('inf')
+        active_states = []
+        log_values = llhs[0] + self.init_log_probs
+        for i in range(llhs.shape[0]):
+            if i > 0:
+                log_values = llhs[i] + \
+                    self._pruned_forward_step(log_alphas[i-1],
+                                              active_states[-1])
+            active_idxs = _active_states(log_values, beam, max_active)
+            log_alphas[i] = _prune(log_values, active_idxs)
+            active_states.append(active_idxs)
+        return log_alphas, active_states
+
+    # The backward recursion is restricted to the states that survived
+    # the pruning of the forward recursion.
+    def _pruned_baum_welch_backward(self, llhs, active_states,
+                                    log_alphas=None):
+        log_betas = torch.zeros_like(llhs) - float('inf')
+        log_betas[-1] = _prune(self.final_log_probs, active_states[-1])
+        if (log_betas[-1] == float('-inf')).all():
+            # None of the final states survived the pruning: we end the
+            # sequence on any of the active states.
+            log_betas[-1, active_states[-1]] = 0.
+        if log_alphas is not None:
+            lognorm = torch.logsumexp(log_alphas[-1] + log_betas[-1], dim=-1)
+            trans_counts = llhs.new_zeros(self.n_states, self.n_states)
+        for i in reversed(range(llhs.shape[0]-1)):
+            active_idxs = active_states[i]
+            llhs_betas = llhs[i+1] + log_betas[i+1]
+            log_betas[i, active_idxs] = self._pruned_backward_step(
+                llhs_betas, active_idxs)
+            if log_alphas is not None:
+                # Only the transitions between the active states of the
+                # two frames have a non-zero posterior.
+                self._pruned_trans_counts(trans_counts, log_alphas[i],
+                                          llhs_betas, lognorm, active_idxs,
+                                          active_states[i+1])
+        if log_alphas is not None:
+            return log_betas, trans_counts
+        return log_betas
+
+    # Parallel-in-time version of the recursion:
+    #   values[0] = start
+    #   values[i] = step(values[i-1]) + llhs[i], i > 0
+    # where "step" multiplies (in the semiring given by "reduce") a
+    # vector with the matrix "trans". The frames 1, ..., N-1 are split
+    # into blocks of "block_size" frames and:
+    #   1. the product of the matrices (trans + llhs[i]) of each block
+    #      is computed (log2(block_size) parallel steps)
+    #   2. the prefix products of the blocks' matrices give the values
+    #      at the start of each block (log2(n_blocks) parallel steps)
+    #   3. the recursion is run for all the blocks at once
+    #      ("block_size" steps).
+    # If "viterbi" is true, "step" also returns the best predecessor of
+    # each state and these are returned along with the values.
+    def _parallel_recursion(self, start, trans, llhs, step, reduce,
+                            block_size=None, viterbi=False):
+        length, n_states = llhs.shape
+        backtrack = torch.zeros(length, n_states, dtype=torch.long,
+                                device=llhs.device)
+        if length == 1:
+            return (start[None], backtrack) if viterbi else start[None]
+        n_elements = length - 1
+        if block_size is None:
+            block_size = max(1, int(math.sqrt(n_elements)))
+        n_blocks = -(-n_elements // block_size)
+        padding = n_blocks * block_size - n_elements
+        elements_llhs = torch.cat([llhs[1:], llhs.new_zeros(padding, n_states)])
+        elements_llhs = elements_llhs.view(n_blocks, block_size, n_states)
+
+        # The product of the last block is not needed.
+        starts = start[None]
+        if n_blocks > 1:
+            n_slice = max(1, PARALLEL_MAX_SIZE // (block_size * n_states ** 2))
+            block_mats = torch.cat([
+                _reduce_blocks(trans + slice_llhs[:, :, None, :], reduce)
+                for slice_llhs in elements_llhs[:-1].split(n_slice)
+            ])
+            prefixes = _scan(block_mats, reduce)
+            starts = torch.cat([starts,
+                                reduce(start[None, :, None] + prefixes, dim=1)])
+
+        values = llhs.new_empty(n_blocks, block_size, n_states)
+        blocks_backtrack = backtrack.new_empty(n_blocks, block_size, n_states)
+        current = starts
+        for i in range(block_size):
+            if viterbi:
+                current, blocks_backtrack[:, i] = step(current)
+            else:
+                current = step(current)
+            current = current + elements_llhs[:, i]
+            values[:, i] = current
+        values = torch.cat([start[None],
+                            values.view(-1, n_states)[:n_elements]])
+        if viterbi:
+            backtrack[1:] = blocks_backtrack.view(-1, n_states)[:n_elements]
+            return values, backtrack
+        return values
+
+    def _parallel_baum_welch_forward(self, llhs, block_size=None):
+        return self._parallel_recursion(llhs[0] + self.init_log_probs,
+                                        self.trans_log_probs, llhs,
+                                        self._forward_step, torch.logsumexp,
+                                        block_size)
+
+    # The recursion is done (backward in time) on the sum of the
+    # log-likelihoods and the backward values.
+    def _parallel_baum_welch_backward(self, llhs, block_size=None):
+        llhs_betas = self._parallel_recursion(
+            llhs[-1] + self.final_log_probs, self.trans_log_probs.t(),
+            llhs.flip(0), self._backward_step, torch.logsumexp, block_size
+        ).flip(0)
+        n_frames = max(1, PARALLEL_MAX_SIZE // self.n_states ** 2)
+        return torch.cat([
+            *[self._backward_step(chunk)
+              for chunk in llhs_betas[1:].split(n_frames)],
+            self.final_log_probs[None]
+        ])
+
+    # Expected transition counts computed from the forward/backward
+    # values of all the frames.
+    def _trans_counts(self, log_alphas, llhs_betas, lognorm):
+        n_frames = max(1, PARALLEL_MAX_SIZE // self.n_states ** 2)
+        counts = log_alphas.new_zeros(self.n_states, self.n_states)
+        for chunk_alphas, chunk_llhs_betas in zip(log_alphas.split(n_frames),
+                                                  llhs_betas.split(n_frames)):
+            counts += self._trans_posteriors(chunk_alphas, chunk_llhs_betas,
+                                             lognorm).sum(dim=0)
+        return counts
+
+    # Forward values of a segment of frames given the forward values
+    # of the frame preceding the segment (None for the first segment).
+    def _segment_forward(self, llhs, prev_log_alphas=None):
+        log_alphas = torch.zeros_like(llhs) - float('inf')
+        if prev_log_alphas is None:
+            log_alphas[0] = llhs[0] + self.init_log_probs
+        else:
+            log_alphas[0] = llhs[0] + self._forward_step(prev_log_alphas)
+        for i in range(1, llhs.shape[0]):
+            log_alphas[i] = llhs[i] + self._forward_step(log_alphas[i-1])
+        return log_alphas
+
+    # Checkpointed forward-backward: the forward pass only keeps the
+    # forward values at the boundaries of the segments ("segment_size"
+    # frames, about the square root of the number of frames by
+    # default). The forward values of each segment are recomputed
+    # during the backward pass. The log-likelihoods of the segments
+    # are given by "segment_llhs(start, end)" which is called twice per
+    # segment, the second call being done right before the results
+    # of the segment are generated.
+    # Generates, from the last segment to the first one:
+    #   (start, llhs, lognorm, state_posts[, trans_posts][, counts])
+    # where the transition posteriors/counts are the ones of the
+    # transitions starting in the segment.
+    def _checkpointed_baum_welch(self, n_frames, segment_llhs,
+                                 segment_size=None, trans_posteriors=False,
+                                 trans_counts=False):
+        if segment_size is None:
+            segment_size = max(1, int(math.sqrt(n_frames)))
+        starts = list(range(0, n_frames, segment_size))
+
+        checkpoints, log_alphas = [], None
+        for start in starts:
+            end = min(start + segment_size, n_frames)
+            checkpoints.append(log_alphas)
+            llhs = segment_llhs(start, end).detach()
+            log_alphas = self._segment_forward(llhs, log_alphas)[-1]
+        lognorm = torch.logsumexp(log_alphas + self.final_log_probs, dim=-1)
+
+        # Sum of the log-likelihood and the backward values of the
+        # first frame of the segment following the current one.
+        next_llhs_betas = None
+        for start, prev_log_alphas in zip(reversed(starts),
+                                          reversed(checkpoints)):
+            end = min(start + segment_size, n_frames)
+            llhs = segment_llhs(start, end)
+            log_alphas = self._segment_forward(llhs.detach(), prev_log_alphas)
+            log_betas = torch.zeros_like(log_alphas) - float('inf')
+            if next_llhs_betas is None:
+                log_betas[-1] = self.final_log_probs
+            else:
+                log_betas[-1] = self._backward_step(next_llhs_betas)
+            for i in reversed(range(llhs.shape[0]-1)):
+                log_betas[i] = self._backward_step(llhs[i+1].detach() + \
+                                                   log_betas[i+1])
+            llhs_betas = llhs.detach() + log_betas
+
+            retval = [start, llhs, lognorm,
+                      (log_alphas + log_betas - lognorm).exp()]
+            if trans_posteriors or trans_counts:
+                if next_llhs_betas is None:
+                    log_alphas, llhs_betas = log_alphas[:-1], llhs_betas[1:]
+                else:
+                    llhs_betas = torch.cat([llhs_betas[1:],
+                                            next_llhs_betas[None]])
+                if trans_posteriors:
+                    retval.append(self._trans_posteriors(log_alphas,
+                                                         llhs_betas, lognorm))
+                if trans_counts:
+                    retval.append(self._trans_counts(log_alphas, llhs_betas,
+                                                     lognorm))
+            next_llhs_betas = llhs[0].detach() + log_betas[0]
+            yield tuple(retval)
+
+    # Forward-backward in the probability domain. The emissions are
+    # shifted by their per-frame maximum and the forward values are
+    # normalized at each frame, the log of the normalizers is
+    # accumulated separately. Each step is a plain vector-matrix
+    # product (no exp/log). Returns None when the values underflow
+    # (the caller then falls back to the log-domain recursions).
+    def _scaled_baum_welch(self, llhs, trans_posteriors, trans_counts):
+        tiny = torch.finfo(llhs.dtype).tiny
+        trans_probs = self.trans_log_probs.exp()
+        max_llhs = llhs.max(dim=-1, keepdim=True)[0]
+        emissions = (llhs - max_llhs).exp()
+
+        alphas = torch.empty_like(llhs)
+        scales = llhs.new_empty(llhs.shape[0])
+        alpha = self.init_log_probs.exp() * emissions[0]
+        for i in range(llhs.shape[0]):
+            if i > 0:
+                alpha = (alpha @ trans_probs) * emissions[i]
+            scales[i] = alpha.sum()
+            alpha = alpha / scales[i]
+            alphas[i] = alpha
+        final_probs = self.final_log_probs.exp()
+        norm = alphas[-1] @ final_probs
+        if not bool((scales >= tiny).all()) or not float(norm) >= tiny:
+            return None
+
+        # The backward values are normalized with the forward
+        # normalizers: beta[i] = A (b[i+1] * beta[i+1]) / c[i+1].
+        emissions = emissions / scales[:, None]
+        betas = torch.empty_like(llhs)
+        emissions_betas = torch.empty_like(llhs)
+        betas[-1] = final_probs
+        for i in reversed(range(llhs.shape[0])):
+            if i < llhs.shape[0] - 1:
+                betas[i] = trans_probs @ emissions_betas[i + 1]
+            emissions_betas[i] = emissions[i] * betas[i]
+        if not bool(torch.isfinite(betas).all()):
+            return None
+
+        state_posts = alphas * betas / norm
+        lognorm = scales.log().sum() + max_llhs.sum() + norm.log()
+        retval = [state_posts]
+        if trans_posteriors:
+            retval.append(alphas[:-1, :, None] * trans_probs * \
+                          emissions_betas[1:, None, :] / norm)
+        if trans_counts:
+            retval.append(trans_probs * \
+                          (alphas[:-1].t() @ emissions_betas[1:]) / norm)
+        return retval, lognorm
+
+    def _checkpointed_posteriors(self, llhs, trans_posteriors, trans_counts,
+                                 log_evidence):
+        n_states = self.n_states
+        state_posts = torch.zeros_like(llhs)
+        if trans_posteriors:
+            trans_posts = llhs.new_zeros(max(len(llhs) - 1, 0), n_states,
+                                         n_states)
+        counts = llhs.new_zeros(n_states, n_states)
+        segments = self._checkpointed_baum_welch(
+            len(llhs), lambda start, end: llhs[start:end],
+            trans_posteriors=trans_posteriors, trans_counts=trans_counts)
+        for start, _, lognorm, posts, *results in segments:
+            state_posts[start:start + len(posts)] = posts
+            if trans_posteriors:
+                trans_posts[start:start + len(results[0])] = results[0]
+            if trans_counts:
+                counts += results[-1]
+        retval = [state_posts]
+        if trans_posteriors:
+            retval.append(trans_posts)
+        if trans_counts:
+            retval.append(counts)
+        if log_evidence:
+            retval.append(lognorm)
+        if len(retval) == 1:
+            return state_posts
+        return tuple(retval)
+
+    def posteriors(self, llhs, trans_posteriors=False, trans_counts=False,
+                   beam=None, max_active=None, scaled=False,
+                   parallel=False, checkpoint=False, log_evidence=False):
         '''Compute the posterior of the state given the
         (log-)likelihood of the data.
 
@@ -295,47 +861,649 @@ class CompiledGraph(torch.nn.Module):
                 state.
             trans_posteriors (boolean): If true, also compute the
                 transition posterior.
+            trans_counts (boolean): If true, also compute the expected
+                number of transitions (i.e. the transition posteriors
+                summed over time). The per-frame transition posteriors
+                are never stored.
+            beam (float): If provided, prune (at each frame) the states
+                whose forward log-probability is lower than the best
+                one minus the beam.
+            max_active (int): If provided, keep at most "max_active"
+                states per frame.
+            scaled (boolean): If true, run the forward-backward
+                algorithm in the probability domain with per-frame
+                scaling instead of the log domain. It is much faster
+                as it avoids the exp/log operations of the log-domain
+                recursions. If the values underflow, the log-domain
+                algorithm is used instead. Ignored with pruning.
+            parallel (boolean): If true, run the forward and backward
+                recursions in parallel over time (associative scan in
+                the log semiring). The number of sequential steps is
+                about the square root of the number of frames instead
+                of the number of frames but the amount of computation
+                is multiplied by the number of states: use it for long
+                sequences and small graphs. Ignored with pruning or
+                if "scaled" is true.
+            checkpoint (boolean): If true, only store the forward
+                values every sqrt(N) frames and recompute them segment
+                by segment during the backward recursion. The forward
+                and backward values are never stored for the whole
+                sequence. Ignored with pruning or if "scaled" or
+                "parallel" is true.
+            log_evidence (boolean): If true, also return the
+                log-likelihood of the sequence.
 
         Returns:
             ``torch.FloatTensor[N, K]``: state posteriors.
             ``torch.FloatTensor[N-1, K, K]``: transition posteriors
+                (only if "trans_posteriors" is true).
+            ``torch.FloatTensor[K, K]``: expected transition counts
+                (only if "trans_counts" is true).
+            ``torch.FloatTensor``: log-likelihood of the sequence
+                (only if "log_evidence" is true).
+            ``torch.LongTensor[N]``: number of active states per frame
+                (only if "beam" or "max_active" is provided).
+
+        Note:
+            The posteriors of the pruned states are set to zero.
 
         '''
-        log_alphas = self._baum_welch_forward(llhs)
-        log_betas = self._baum_welch_backward(llhs)
+        pruning = beam is not None or max_active is not None
+        if scaled and not pruning:
+            result = self._scaled_baum_welch(llhs, trans_posteriors,
+                                             trans_counts)
+            if result is not None:
+                retval, lognorm = result
+                if log_evidence:
+                    retval.append(lognorm)
+                if len(retval) == 1:
+                    return retval[0]
+                return tuple(retval)
+        # The backward recursions return the transition counts along
+        # with the backward values when the forward values are given.
+        if pruning:
+            log_alphas, active_states = \
+                self._pruned_baum_welch_forward(llhs, beam, max_active)
+            if trans_counts:
+                log_betas, counts = self._pruned_baum_welch_backward(
+                    llhs, active_states, log_alphas)
+            else:
+                log_betas = self._pruned_baum_welch_backward(llhs,
+                                                             active_states)
+        elif checkpoint and not parallel:
+            return self._checkpointed_posteriors(llhs, trans_posteriors,
+                                                 trans_counts, log_evidence)
+        elif parallel:
+            log_alphas = self._parallel_baum_welch_forward(llhs)
+            log_betas = self._parallel_baum_welch_backward(llhs)
+            if trans_counts:
+                lognorm = torch.logsumexp(log_alphas[-1] + log_betas[-1],
+                                          dim=-1)
+                counts = self._trans_counts(log_alphas[:-1],
+                                            (llhs + log_betas)[1:], lognorm)
+        else:
+            log_alphas = self._baum_welch_forward(llhs)
+            if trans_counts:
+                log_betas, counts = self._baum_welch_backward(llhs,
+                                                              log_alphas)
+            else:
+                log_betas = self._baum_welch_backward(llhs)
         lognorm = torch.logsumexp((log_alphas + log_betas)[0], dim=0)
         state_posts = (log_alphas + log_betas - lognorm).exp()
+        retval = [state_posts]
         if trans_posteriors:
-            log_A = self.trans_log_probs
-            log_xi = log_alphas[:-1, :, None] + log_A[None] + \
-                     (llhs + log_betas)[1:, None, :]
-            log_xi = log_xi.view(-1, len(log_A) * len(log_A))
-            lnorm = torch.logsumexp(log_xi[0], dim=0)
-            trans_posts = (log_xi - lnorm).exp()
-            trans_posts = torch.where(trans_posts != trans_posts,
-                                     torch.zeros_like(trans_posts),
-                                     trans_posts)
-            trans_posts = trans_posts.view(-1, len(log_A), len(log_A))
-            retval = state_posts, trans_posts
+            retval.append(self._trans_posteriors(log_alphas[:-1],
+                                                 (llhs + log_betas)[1:],
+                                                 lognorm))
+        if trans_counts:
+            retval.append(counts)
+        if log_evidence:
+            retval.append(lognorm)
+        if pruning:
+            retval.append(torch.LongTensor([len(active_idxs)
+                                            for active_idxs in active_states]))
+        if len(retval) == 1:
+            return state_posts
+        return tuple(retval)
+
+    def _batch_baum_welch_forward(self, llhs):
+        log_alphas = torch.zeros_like(llhs) - float('inf')
+        log_alphas[:, 0] = llhs[:, 0] + self.init_log_probs
+        for i in range(1, llhs.shape[1]):
+            log_alphas[:, i] = llhs[:, i] + \
+                               self._forward_step(log_alphas[:, i-1])
+        return log_alphas
+
+    def _batch_baum_welch_backward(self, llhs, lengths, log_alphas=None):
+        final_log_probs = self.final_log_probs.expand(llhs.shape[0], -1)
+        log_betas = torch.zeros_like(llhs) - float('inf')
+        log_betas[:, -1] = final_log_probs
+        if log_alphas is not None:
+            seq_idxs = torch.arange(llhs.shape[0], device=llhs.device)
+            last_log_alphas = log_alphas[seq_idxs, lengths - 1]
+            lognorm = torch.logsumexp(last_log_alphas + final_log_probs,
+                                      dim=-1)
+            trans_counts = llhs.new_zeros(llhs.shape[0], self.n_states,
+                                          self.n_states)
+        for i in reversed(range(llhs.shape[1]-1)):
+            # The recursion is restarted at the last frame of each
+            # sequence. Values after the end of a sequence are
+            # meaningless and masked out by the caller.
+            llhs_betas = llhs[:, i+1] + log_betas[:, i+1]
+            log_betas[:, i] = torch.where(
+                (lengths - 1 == i)[:, None],
+                final_log_probs,
+                self._backward_step(llhs_betas)
+            )
+            if log_alphas is not None:
+                trans_posts = self._trans_posteriors(
+                    log_alphas[:, i], llhs_betas, lognorm[:, None, None])
+                trans_counts += torch.where((i + 1 < lengths)[:, None, None],
+                                            trans_posts,
+                                            torch.zeros_like(trans_posts))
+        if log_alphas is not None:
+            return log_betas, trans_counts
+        return log_betas
+
+    def batch_posteriors(self, llhs, lengths=None, trans_posteriors=False,
+                         trans_counts=False):
+        '''Compute the posterior of the states for a batch of
+        sequences padded to the same length.
+
+        Args:
+            llhs (``torch.Tensor[B, N, K]``): Log-likelihood per
+                sequence, frame and state.
+            lengths (``torch.LongTensor[B]``): Length of each sequence.
+                If not provided, all the sequences are assumed to have
+                N frames.
+            trans_posteriors (boolean): If true, also compute the
+                transition posterior.
+            trans_counts (boolean): If true, also compute the expected
+                number of transitions of each sequence.
+
+        Returns:
+            ``torch.FloatTensor[B, N, K]``: state posteriors.
+            ``torch.FloatTensor[B, N-1, K, K]``: transition posteriors
+                (only if "trans_posteriors" is true).
+            ``torch.FloatTensor[B, K, K]``: expected transition counts
+                (only if "trans_counts" is true).
+
+        Note:
+            The posteriors of the padding frames (and of the
+            transitions starting from the last frame of a sequence) are
+            set to zero.
+
+        '''
+        if lengths is None:
+            lengths = [llhs.shape[1]] * llhs.shape[0]
+        lengths = torch.as_tensor(lengths, dtype=torch.long,
+                                  device=llhs.device)
+        frame_idxs = torch.arange(llhs.shape[1], device=llhs.device)
+        mask = frame_idxs[None, :] < lengths[:, None]
+
+        log_alphas = self._batch_baum_welch_forward(llhs)
+        if trans_counts:
+            log_betas, counts = self._batch_baum_welch_backward(
+                llhs, lengths, log_alphas=log_alphas)
         else:
-            retval = state_posts
-        return retval
+            log_betas = self._batch_baum_welch_backward(llhs, lengths)
+        lognorm = torch.logsumexp((log_alphas + log_betas)[:, 0], dim=-1)
+        state_posts = (log_alphas + log_betas - lognorm[:, None, None]).exp()
+        state_posts = torch.where(mask[:, :, None], state_posts,
+                                  torch.zeros_like(state_posts))
+        retval = [state_posts]
+        if trans_posteriors:
+            trans_posts = self._trans_posteriors(
+                log_alphas[:, :-1],
+                (llhs + log_betas)[:, 1:],
+                lognorm[:, None, None, None]
+            )
+            trans_posts = torch.where(mask[:, 1:, None, None], trans_posts,
+                                      torch.zeros_like(trans_posts))
+            retval.append(trans_posts)
+        if trans_counts:
+            retval.append(counts)
+        if len(retval) == 1:
+            return state_posts
+        return tuple(retval)
+
+    def best_path(self, llhs, beam=None, max_active=None, parallel=False):
+        '''Most likely sequence of states given the (log-)likelihood of
+        the data.
+
+        Args:
+            llhs (``torch.Tensor[N, K]``): Log-likelihood per frame and
+                state.
+            beam (float): If provided, prune (at each frame) the
+                hypotheses whose log-probability is lower than the best
+                one minus the beam.
+            max_active (int): If provided, keep at most "max_active"
+                hypotheses per frame.
+            parallel (boolean): If true, compute the scores of the
+                best partial paths in parallel over time (associative
+                scan in the max-plus semiring, see
+                :any:`CompiledGraph.posteriors`). Ignored with pruning.
 
+        Returns:
+            ``torch.LongTensor[N]``: best path.
+            ``torch.LongTensor[N]``: number of active states per frame
+                (only if "beam" or "max_active" is provided).
 
-    def best_path(self, llhs):
+        '''
+        pruning = beam is not None or max_active is not None
         init_log_prob = self.init_log_probs
         backtrack = torch.zeros_like(llhs, dtype=torch.long,
                                      device=llhs.device)
         omega = llhs[0] + init_log_prob
-        log_trans_mat = self.trans_log_probs
+        if pruning:
+            active_idxs = _active_states(omega, beam, max_active)
+            omega = _prune(omega, active_idxs)
+            n_active = [len(active_idxs)]
 
-        for i in range(1, llhs.shape[0]):
-            hypothesis = omega + log_trans_mat.t()
-            backtrack[i] = torch.argmax(hypothesis, dim=1)
-            omega = llhs[i] + hypothesis[range(len(log_trans_mat)), backtrack[i]]
+        # The parallel recursion replaces the loop over the frames.
+        n_frames = llhs.shape[0]
+        if parallel and not pruning:
+            omegas, backtrack = self._parallel_recursion(
+                omega, self.trans_log_probs, llhs, self._viterbi_step,
+                torch.amax, viterbi=True)
+            omega, n_frames = omegas[-1], 1
 
-        path = [torch.argmax(omega + self.final_log_probs)]
+        for i in range(1, n_frames):
+            if pruning:
+                best_hypothesis, backtrack[i] = \
+                    self._pruned_viterbi_step(omega, active_idxs)
+                omega = llhs[i] + best_hypothesis
+                active_idxs = _active_states(omega, beam, max_active)
+                omega = _prune(omega, active_idxs)
+                n_active.append(len(active_idxs))
+            else:
+                best_hypothesis, backtrack[i] = self._viterbi_step(omega)
+                omega = llhs[i] + best_hypothesis
+
+        final_omega = omega + self.final_log_probs
+        if pruning and (final_omega == float('-inf')).all():
+            # None of the final states survived the pruning: we end the
+            # path on the best active state.
+            final_omega = omega
+        # Backtracking. The loop is done on numpy views of the tensors
+        # to avoid the overhead of indexing the tensors frame by frame.
+        path = torch.zeros(len(llhs), dtype=torch.long)
+        path[-1] = torch.argmax(final_omega)
+        np_backtrack, np_path = backtrack.cpu().numpy(), path.numpy()
         for i in reversed(range(1, len(llhs))):
-            path.insert(0, backtrack[i, path[0]])
-        return torch.LongTensor(path, device=llhs.device)
+            np_path[i - 1] = np_backtrack[i, np_path[i]]
+        path = path.to(llhs.device)
+        if pruning:
+            return path, torch.LongTensor(n_active)
+        return path
+
+
+# List of the neighbors of each state (according to the non-zero
+# elements of each row of "mask"). The lists are padded to the largest
+# number of neighbors.
+def _padded_adjacency(mask):
+    n_states = mask.shape[1]
+    max_degree = max(int(mask.sum(dim=1).max()), 1)
+    # The keys are unique so the neighbors are sorted by increasing
+    # state index.
+    keys = (~mask).long() * n_states + torch.arange(n_states)
+    _, idxs = torch.sort(keys, dim=1)
+    neighbors = idxs[:, :max_degree].contiguous()
+    return neighbors, mask.gather(1, neighbors)
 
+
+class SparseCompiledGraph(CompiledGraph):
+    '''Inference graph for a HMM model with a sparse transition matrix.
+
+    The inference only considers the existing arcs (i.e. non-zero
+    transition probabilities). The cost per frame is proportional to the
+    number of states times the largest number of incoming/outgoing arcs
+    of a state instead of the squared number of states.
+
+    Note:
+        The dense transition matrix is kept so that the transition
+        probabilities of the existing arcs can be updated (see
+        :any:`PhoneLoop`).
+
+    '''
+
+    def __init__(self, init_log_probs, final_log_probs, trans_log_probs,
+                 pdf_id_mapping=None):
+        super().__init__(init_log_probs, final_log_probs, trans_log_probs,
+                         pdf_id_mapping)
+        in_states, in_mask, out_states, out_mask = self._adjacency()
+        self.register_buffer('in_states', in_states)
+        self.register_buffer('in_mask', in_mask)
+        self.register_buffer('out_states', out_states)
+        self.register_buffer('out_mask', out_mask)
+
+    def __repr__(self):
+        return '<SparseCompiledGraph>'
+
+    def to_sparse(self):
+        return self
+
+    def optimize(self):
+        return self
+
+    # Incoming/outgoing neighbors of each state and the corresponding
+    # masks (see "_padded_adjacency").
+    def _adjacency(self):
+        mask = self.trans_log_probs > float('-inf')
+        in_states, in_mask = _padded_adjacency(mask.t())
+        out_states, out_mask = _padded_adjacency(mask)
+        return in_states, in_mask, out_states, out_mask
+
+    # The log probabilities of the arcs are recomputed only when the
+    # transition matrix is replaced or modified in place.
+    def _arcs_log_probs(self, key, states, mask, trans_log_probs):
+        trans = self.trans_log_probs
+        cache = self.__dict__.setdefault('_arcs_cache', {})
+        cached = cache.get(key)
+        if cached is None or cached[0] is not trans \
+                or cached[1] != trans._version:
+            log_probs = trans_log_probs.gather(1, states)
+            log_probs = torch.where(mask, log_probs,
+                                    torch.zeros_like(log_probs) - float('inf'))
+            cached = (trans, trans._version, log_probs)
+            cache[key] = cached
+        return cached[2]
+
+    # Log probabilities of the incoming arcs of each state:
+    # log A[in_states[j, k], j].
+    def _in_log_probs(self):
+        return self._arcs_log_probs('in', self.in_states, self.in_mask,
+                                    self.trans_log_probs.t())
+
+    # Log probabilities of the outgoing arcs of each state:
+    # log A[i, out_states[i, k]].
+    def _out_log_probs(self):
+        return self._arcs_log_probs('out', self.out_states, self.out_mask,
+                                    self.trans_log_probs)
+
+    def _forward_step(self, log_alphas):
+        return torch.logsumexp(log_alphas[..., self.in_states] + \
+                               self._in_log_probs(), dim=-1)
+
+    def _backward_step(self, values):
+        return torch.logsumexp(values[..., self.out_states] + \
+                               self._out_log_probs(), dim=-1)
+
+    def _viterbi_step(self, omega):
+        hypothesis = omega[..., self.in_states] + self._in_log_probs()
+        best_hypothesis, best_arcs = torch.max(hypothesis, dim=-1)
+        in_states = self.in_states.expand(*hypothesis.shape)
+        return best_hypothesis, in_states.gather(-1, best_arcs[..., None])[..., 0]
+
+    # The sparse recursions are already cheap: the pruned states are
+    # simply ignored as their value is -inf.
+
+    def _pruned_forward_step(self, log_alphas, active_idxs):
+        return self._forward_step(log_alphas)
+
+    def _pruned_backward_step(self, values, active_idxs):
+        return self._backward_step(values)[active_idxs]
+
+    def _pruned_viterbi_step(self, omega, active_idxs):
+        return self._viterbi_step(omega)
+
+    def _trans_posteriors(self, log_alphas, llhs_betas, lognorm):
+        # Posteriors of the existing arcs only.
+        log_xi = log_alphas[..., self.in_states] + self._in_log_probs() + \
+                 llhs_betas[..., :, None]
+        arc_posts = (log_xi - lognorm).exp()
+        arc_posts = torch.where(self.in_mask & (arc_posts == arc_posts),
+                                arc_posts, torch.zeros_like(arc_posts))
+
+        # Scatter the arcs' posteriors in a dense matrix.
+        n_states = self.n_states
+        lead_shape = arc_posts.shape[:-2]
+        dest_states = torch.arange(n_states, device=self.in_states.device)
+        idxs = (self.in_states * n_states + dest_states[:, None]).view(-1)
+        arc_posts = arc_posts.reshape(-1, len(idxs))
+        trans_posts = torch.zeros(len(arc_posts), n_states * n_states,
+                                  dtype=arc_posts.dtype, device=arc_posts.device)
+        trans_posts.index_add_(1, idxs, arc_posts)
+        return trans_posts.view(*lead_shape, n_states, n_states)
+
+
+class BandedCompiledGraph(SparseCompiledGraph):
+    '''Inference graph for a HMM model whose transitions lie in a narrow
+    band around the diagonal of the transition matrix (e.g. left-to-right
+    graphs where the transitions are the self-loops and the arcs to the
+    next state).
+
+    The transitions of a state i go to the states i + lower, ..., i +
+    upper where lower/upper are the offsets of the first/last non-empty
+    diagonal of the transition matrix. The recursions process each
+    diagonal of the band with vector operations on contiguous slices of
+    the forward/backward values instead of gathering the neighbors of
+    each state. The cost per frame is proportional to the number of
+    states times the width of the band.
+
+    Note:
+        The Viterbi step and the transition posteriors are the ones of
+        :any:`SparseCompiledGraph` with all the states of the band as
+        neighbors.
+
+    '''
+
+    def __init__(self, init_log_probs, final_log_probs, trans_log_probs,
+                 pdf_id_mapping=None):
+        super().__init__(init_log_probs, final_log_probs, trans_log_probs,
+                         pdf_id_mapping)
+        self.lower, self.upper = self.band_limits()
+
+    def __repr__(self):
+        return '<BandedCompiledGraph>'
+
+    def to_banded(self):
+        return self
+
+    # The neighbors of a state are all the states of the band: the
+    # incoming states of j are j - upper, ..., j - lower and the
+    # outgoing states of i are i + lower, ..., i + upper.
+    def _adjacency(self):
+        lower, upper = self.band_limits()
+        n_states = self.n_states
+        state_idxs = torch.arange(n_states)[:, None]
+        band = torch.arange(upper - lower + 1)[None, :]
+        in_states = state_idxs - upper + band
+        out_states = state_idxs + lower + band
+        in_mask = (in_states >= 0) & (in_states < n_states)
+        out_mask = (out_states >= 0) & (out_states < n_states)
+        return in_states.clamp(0, n_states - 1), in_mask, \
+            out_states.clamp(0, n_states - 1), out_mask
+
+    # Iterator over the diagonals of the band: (offset, source states,
+    # destination states, log probabilities of the transitions). The
+    # diagonals are views of the transition matrix.
+    def _diagonals(self, offsets):
+        n_states = self.n_states
+        for offset in offsets:
+            if offset >= 0:
+                src, dest = slice(0, n_states - offset), slice(offset, n_states)
+            else:
+                src, dest = slice(-offset, n_states), slice(0, n_states + offset)
+            yield offset, src, dest, self.trans_log_probs.diagonal(offset)
+
+    def _forward_step(self, log_alphas):
+        if self.lower <= 0 <= self.upper:
+            result = log_alphas + self.trans_log_probs.diagonal()
+        else:
+            result = torch.zeros_like(log_alphas) - float('inf')
+        offsets = [offset for offset in range(self.lower, self.upper + 1)
+                   if offset != 0]
+        for _, src, dest, log_probs in self._diagonals(offsets):
+            result[..., dest] = torch.logaddexp(result[..., dest],
+                                                log_alphas[..., src] + log_probs)
+        return result
+
+    def _backward_step(self, values):
+        if self.lower <= 0 <= self.upper:
+            result = values + self.trans_log_probs.diagonal()
+        else:
+            result = torch.zeros_like(values) - float('inf')
+        offsets = [offset for offset in range(self.lower, self.upper + 1)
+                   if offset != 0]
+        for _, src, dest, log_probs in self._diagonals(offsets):
+            result[..., src] = torch.logaddexp(result[..., src],
+                                               values[..., dest] + log_probs)
+        return result
+
+
+class StreamingViterbi:
+    '''Incremental (online) Viterbi decoder.
+
+    The frames are given chunk by chunk. The decoder keeps the running
+    best hypotheses and the back-pointers of the frames for which the
+    best path is not yet known. As soon as all the surviving hypotheses
+    share the same past (i.e. the traceback has converged), the
+    corresponding part of the best path is returned and the
+    back-pointers are discarded.
+
+    Example:
+        >>> decoder = StreamingViterbi(graph)
+        >>> for llhs in chunks:
+        ...     partial_path = decoder.process(llhs)
+        >>> last_path = decoder.flush()
+
+    Note:
+        The concatenation of the partial paths is equal to the path
+        given by :any:`CompiledGraph.best_path` unless "max_latency"
+        forces the decoder to commit a path before convergence.
+
+    '''
+
+    def __init__(self, graph, beam=None, max_active=None, max_latency=None):
+        '''
+        Args:
+            graph (:any:`CompiledGraph`): Decoding graph.
+            beam (float): Pruning beam (in log domain).
+            max_active (int): Maximum number of active states per
+                frame.
+            max_latency (int): If provided, the path of the oldest
+                frames is committed (following the current best
+                hypothesis) when more than "max_latency" frames are
+                waiting for the traceback to converge.
+
+        '''
+        self.graph = graph
+        self.beam = beam
+        self.max_active = max_active
+        self.max_latency = max_latency
+        self.reset()
+
+    def reset(self):
+        'Start decoding a new stream.'
+        self._omega = None
+        self._active_idxs = None
+        self._backtrack = []
+        self.n_frames = 0
+        self.n_committed = 0
+
+    @property
+    def _pruning(self):
+        return self.beam is not None or self.max_active is not None
+
+    @property
+    def n_pending(self):
+        'Number of frames waiting for the traceback to converge.'
+        return self.n_frames - self.n_committed
+
+    def _step(self, llh):
+        if self._omega is None:
+            omega = llh + self.graph.init_log_probs
+        else:
+            if self._pruning:
+                best_hypothesis, backtrack = self.graph._pruned_viterbi_step(
+                    self._omega, self._active_idxs)
+            else:
+                best_hypothesis, backtrack = \
+                    self.graph._viterbi_step(self._omega)
+            omega = llh + best_hypothesis
+
+            # The back-pointers to an already committed frame are
+            # useless.
+            if self.n_pending > 0:
+                self._backtrack.append(backtrack.cpu().numpy())
+        if self._pruning:
+            self._active_idxs = _active_states(omega, self.beam,
+                                               self.max_active)
+            omega = _prune(omega, self._active_idxs)
+        self._omega = omega
+        self.n_frames += 1
+
+    # Follow the back-pointers from the given state of the last frame
+    # down to the frame "first" (index relative to the pending frames).
+    def _traceback(self, state, last, first=0):
+        path = np.zeros(last - first + 1, dtype=np.int64)
+        path[-1] = state
+        for i in range(last, first, -1):
+            path[i - first - 1] = self._backtrack[i - 1][path[i - first]]
+        return path
+
+    # Commit the path of the pending frames up to "last" (included)
+    # ending in the given state.
+    def _commit(self, state, last):
+        path = self._traceback(state, last)
+        self._backtrack = self._backtrack[last + 1:]
+        self.n_committed += len(path)
+        return path
+
+    def process(self, llhs):
+        '''Process a chunk of frames.
+
+        Args:
+            llhs (``torch.Tensor[N, K]``): Log-likelihood per frame and
+                state.
+
+        Returns:
+            ``torch.LongTensor``: the part of the best path that has
+                been decided (possibly empty).
+
+        '''
+        for llh in llhs:
+            self._step(llh)
+        if self.n_pending == 0:
+            return torch.zeros(0, dtype=torch.long)
+
+        # Go back in time until all the surviving hypotheses merge.
+        paths = []
+        states = (self._omega > float('-inf')).nonzero()[:, 0].cpu().numpy()
+        last = self.n_pending - 1
+        while len(states) > 1 and last > 0:
+            states = np.unique(self._backtrack[last - 1][states])
+            last -= 1
+        if len(states) == 1:
+            paths.append(self._commit(states[0], last))
+
+        # Bound the latency by following the best current hypothesis.
+        if self.max_latency is not None and self.n_pending > self.max_latency:
+            best_state = int(torch.argmax(self._omega))
+            last = self.n_pending - 1 - self.max_latency
+            state = self._traceback(best_state, self.n_pending - 1, last)[0]
+            paths.append(self._commit(state, last))
+
+        if not paths:
+            return torch.zeros(0, dtype=torch.long)
+        return torch.from_numpy(np.concatenate(paths))
+
+    def flush(self):
+        '''End of the stream: return the rest of the best path and
+        reset the decoder.
+
+        Returns:
+            ``torch.LongTensor``: the end of the best path.
+
+        '''
+        if self.n_pending == 0:
+            self.reset()
+            return torch.zeros(0, dtype=torch.long)
+        final_omega = self._omega + self.graph.final_log_probs
+        if self._pruning and (final_omega == float('-inf')).all():
+            final_omega = self._omega
+        state = int(torch.argmax(final_omega))
+        path = self._commit(state, self.n_pending - 1)
+        self.reset()
+        return torch.from_numpy(path)
@@ -48,6 +48,170 @@ def scale_acc_stats(acc_stats, scale):
     return new_stats
 
 
+class StatisticsAccumulator:
+    '''Accumulated statistics of a list of parameters stored in a
+    single preallocated buffer.
+
+    The statistics of each parameter are stored at a fixed offset of
+    a flat buffer and are added in-place. Two accumulators with the
+    same list of parameters (i.e. computed by different processes)
+    are summed with a single vector addition and the accumulated
+    statistics can be stored as a single tensor (see :any:`buffer`).
+
+    The accumulator has a (read-only) dictionary interface: parameter
+    -> accumulated statistics.
+
+    Example:
+        >>> acc_stats = StatisticsAccumulator(parameters)
+        >>> acc_stats.add_(model.accumulate(stats))
+        >>> acc_stats[parameters[0]]
+
+    '''
+
+    def __init__(self, parameters, buffer=None):
+        '''
+        Args:
+            parameters (list): List of parameters. The statistics
+                of a parameter have the shape of its "stats"
+                attribute.
+            buffer (``torch.Tensor``): Initial value of the
+                accumulated statistics (flattened and concatenated
+                in the order of the parameters). If not provided, the
+                statistics are initialized to zero.
+
+        '''
+        self._parameters = []
+        self._layout = {}
+        self._size = 0
+        for param in parameters:
+            self._append(param, param.stats.shape)
+        if buffer is None:
+            stats = [param.stats for param in self._parameters]
+            dtype = stats[0].dtype if stats else torch.get_default_dtype()
+            device = stats[0].device if stats else None
+            buffer = torch.zeros(self._size, dtype=dtype, device=device)
+        elif buffer.shape != (self._size,):
+            raise ValueError(f'expected a buffer of size {self._size}, got '
+                             f'{tuple(buffer.shape)}')
+        self.buffer = buffer
+
+    @classmethod
+    def from_stats(cls, acc_stats):
+        '''Create an accumulator from a dictionary of accumulated
+        statistics.
+
+        Args:
+            acc_stats (dict): Accumulated statistics.
+
+        Returns:
+            :any:`StatisticsAccumulator`
+
+        '''
+        acc = cls([])
+        acc.add_(acc_stats)
+        return acc
+
+    def _append(self, param, shape):
+        numel = int(torch.Size(shape).numel())
+        self._layout[param] = (self._size, self._size + numel, shape)
+        self._parameters.append(param)
+        self._size += numel
+
+    @property
+    def buffer(self):
+        'Accumulated statistics as a single vector.'
+        return self._buffer
+
+    @buffer.setter
+    def buffer(self, value):
+        self._buffer = value
+        self._views = {param: value[start:end].view(shape)
+                       for param, (start, end, shape) in self._layout.items()}
+
+    # Add the parameters not present in the accumulator at the end
+    # of the buffer. This is only needed when the list of parameters
+    # is not known in advance.
+    def _extend(self, acc_stats):
+        size = self._size
+        for param, stats in acc_stats.items():
+            if param not in self._layout:
+                self._append(param, stats.shape)
+        if self._size > size:
+            ref = next(iter(acc_stats.values()))
+            dtype = self.buffer.dtype if size > 0 else ref.dtype
+            device = self.buffer.device if size > 0 else ref.device
+            buffer = torch.zeros(self._size, dtype=dtype, device=device)
+            buffer[:size] = self.buffer
+            self.buffer = buffer
+
+    def _same_layout(self, other):
+        return self._parameters == other._parameters
+
+    def parameters(self):
+        'Parameters of the accumulator in the order of the buffer.'
+        return list(self._parameters)
+
+    def copy(self):
+        'Copy of the accumulator.'
+        acc = StatisticsAccumulator([])
+        acc._parameters = list(self._parameters)
+        acc._layout = dict(self._layout)
+        acc._size = self._size
+        acc.buffer = self.buffer.clone()
+        return acc
+
+    def add_(self, acc_stats, scale=1.):
+        '''Add in-place accumulated statistics.
+
+        Args:
+            acc_stats (dict or :any:`StatisticsAccumulator`):
+                Statistics to add.
+            scale (float): Scaling factor of the added statistics.
+
+        Returns:
+            :any:`StatisticsAccumulator`: The accumulator itself.
+
+        '''
+        if isinstance(acc_stats, StatisticsAccumulator) \
+                and self._same_layout(acc_stats):
+            self.buffer.add_(acc_stats.buffer.to(self.buffer), alpha=scale)
+            return self
+        if not acc_stats:
+            return self
+        if any(param not in self._layout for param in acc_stats):
+            self._extend(acc_stats)
+        with torch.no_grad():
+            torch._foreach_add_([self._views[param] for param in acc_stats],
+                                list(acc_stats.values()), alpha=scale)
+        return self
+
+    def __len__(self):
+        return len(self._parameters)
+
+    def __contains__(self, param):
+        return param in self._layout
+
+    def __iter__(self):
+        return iter(self._parameters)
+
+    def keys(self):
+        return list(self._parameters)
+
+    def values(self):
+        return [self[param] for param in self._parameters]
+
+    def items(self):
+        return [(param, self[param]) for param in self._parameters]
+
+    def get(self, param, default=None):
+        if param not in self._layout:
+            return default
+        return self[param]
+
+    def __getitem__(self, param):
+        return self._views[param]
+
+
 class EvidenceLowerBoundInstance:
     '''Evidence Lower Bound of a data set given a model.
 
@@ -77,20 +241,54 @@ class EvidenceLowerBoundInstance:
     def __float__(self):
         return float(self._elbo_value)
 
-    def __add__(self, other):
+    def _check_other(self, other):
         if not isinstance(other, EvidenceLowerBoundInstance):
             raise ValueError('EvidenceLowerBoundInstance')
         if self._datasize != other._datasize:
             raise ValueError('Cannot add ELBOs evaluated on different data set')
 
+    def __add__(self, other):
+        self._check_other(other)
+        if isinstance(self._acc_stats, StatisticsAccumulator):
+            acc_stats = self._acc_stats.copy().add_(other._acc_stats)
+        else:
+            acc_stats = add_acc_stats(self._acc_stats, other._acc_stats)
+
         return EvidenceLowerBoundInstance(
             self._elbo_value + other._elbo_value,
-            add_acc_stats(self._acc_stats, other._acc_stats),
+            acc_stats,
             self._model_parameters.union(other._model_parameters),
             self._minibatchsize + other._minibatchsize,
             self._datasize
         )
 
+    def __iadd__(self, other):
+        # The statistics are accumulated in-place into a single
+        # buffer (allocated on the first addition).
+        self._check_other(other)
+        if not isinstance(self._acc_stats, StatisticsAccumulator):
+            self._acc_stats = StatisticsAccumulator.from_stats(self._acc_stats)
+        self._acc_stats.add_(other._acc_stats)
+        self._elbo_value = self._elbo_value + other._elbo_value
+        self._model_parameters.update(other._model_parameters)
+        self._minibatchsize += other._minibatchsize
+        return self
+
+    @property
+    def acc_stats(self):
+        'Accumulated statistics of the parameters of the model.'
+        return self._acc_stats
+
+    @property
+    def minibatchsize(self):
+        'Number of data points on which the ELBO was evaluated.'
+        return self._minibatchsize
+
+    @property
+    def datasize(self):
+        'Number of data points of the total training data.'
+        return self._datasize
+
     def backward(self):
         # Pytorch minimizes the loss ! We change the sign of the ELBO
         # just before to compute the gradient.
@@ -193,13 +391,17 @@ def evidence_lower_bound(model=None, minibatch_data=None, datasize=-1,
     `datasize` argument is given, the function return an "empty"
     ``EvidenceLowerBoundInstance`` object which can be used to
     initialize the accumulatation of several
-    ``EvidenceLowerBoundInstance`.
+    ``EvidenceLowerBoundInstance`. If the `model` is also given, the
+    statistics of all its parameters are accumulated in a
+    preallocated buffer (see :any:`StatisticsAccumulator`).
 
     Args:
         model (:any:`BayesianModel`): The Bayesian model with which to
             compute the ELBO.
         minibatch_data (``torch.Tensor``): Data of the minibatch on
-            which to evaluate the ELBO.
+            which to evaluate the ELBO. For models with sequential
+            latent variables (i.e. :any:`HMM`), it can also be a list
+            of sequences which are processed as a single batch.
         datasize (int): Number of data points of the total training
             data. If set to 0 or negative values, the size of the
             provided `minibatch_data` will be used instead.
@@ -238,10 +440,19 @@ def evidence_lower_bound(model=None, minibatch_data=None, datasize=-1,
     '''
     if model is None and  minibatch_data is None and datasize > 0:
         return EvidenceLowerBoundInstance(0., {}, [], 0, datasize)
+    elif minibatch_data is None and datasize > 0:
+        parameters = [param for group in model.mean_field_factorization()
+                      for param in group]
+        return EvidenceLowerBoundInstance(0., StatisticsAccumulator(parameters),
+                                          parameters, 0, datasize)
     elif model is None or minibatch_data is None:
         raise ValueError('if datasize is not provided, need at least "model" '
                          'and "minibatch_data"')
 
+    if isinstance(minibatch_data, (list, tuple)):
+        kwargs['lengths'] = [len(seq) for seq in minibatch_data]
+        minibatch_data = torch.cat(minibatch_data)
+
     mb_datasize = len(minibatch_data)
     if datasize <= 0:
         datasize = mb_datasize
@@ -314,6 +525,11 @@ def stochastic_collapsed_evidence_lower_bound(model, minibatch_data, datasize=-1
     '''
     if model is None and  minibatch_data is None and datasize > 0:
         return EvidenceLowerBoundInstance(0., {}, [], 0, datasize)
+    elif minibatch_data is None and datasize > 0:
+        parameters = [param for group in model.mean_field_factorization()
+                      for param in group]
+        return EvidenceLowerBoundInstance(0., StatisticsAccumulator(parameters),
+                                          parameters, 0, datasize)
     elif model is None or minibatch_data is None:
         raise ValueError('if datasize is not provided, need at least "model" '
                          'and "minibatch_data"')
@@ -336,6 +552,7 @@ def stochastic_collapsed_evidence_lower_bound(model, minibatch_data, datasize=-1
 
 
 
-__all__ = ['evidence_lower_bound', 'collapsed_evidence_lower_bound',
+__all__ = ['StatisticsAccumulator', 'evidence_lower_bound',
+           'collapsed_evidence_lower_bound',
            'stochastic_collapsed_evidence_lower_bound']
 
@@ -9,6 +9,10 @@ __all__ = ['Model', 'DiscreteLatentModel']
 class Model(torch.nn.Module, metaclass=abc.ABCMeta):
     'Abstract base class for all the models.'
 
+    # Precision of the per-frame computations (see
+    # "set_compute_dtype").
+    compute_dtype = None
+
     def __init__(self):
         super().__init__()
         self._cache = {}
@@ -27,6 +31,25 @@ class Model(torch.nn.Module, metaclass=abc.ABCMeta):
             if module is not self and isinstance(module, Model):
                 module.clear_cache()
 
+    def set_compute_dtype(self, dtype=None):
+        '''Set the precision of the per-frame computations of the
+        model and its sub-models (see
+        :any:`BayesianModel.set_compute_dtype`).
+
+        Args:
+            dtype (``torch.dtype``): Precision of the per-frame
+                computations (None: precision of the parameters).
+
+        Returns:
+            :any:`Model`
+
+        '''
+        self.compute_dtype = dtype
+        for module in self.children():
+            if isinstance(module, Model):
+                module.set_compute_dtype(dtype)
+        return self
+
     def bayesian_parameters(self, paramtype=None, paramfilter=None,
                             keepgroups=False):
         '''Return an iterator over the Bayesian parameters of the model.
@@ -4,6 +4,7 @@
 import abc
 import torch
 
+from .basemodel import Model
 from .parameters import ConstantParameter
 from .parameters import BayesianParameter
 from .parameters import BayesianParameterSet
@@ -16,9 +17,14 @@ class BayesianModel(metaclass=abc.ABCMeta):
     Attributes:
         parameters (list): List of :any:`BayesianParameter` that the
             model has registered.
+        compute_dtype (``torch.dtype``): Precision of the per-frame
+            computations (None: precision of the parameters). See
+            :any:`set_compute_dtype`.
 
     '''
 
+    compute_dtype = None
+
     def __init__(self):
         self._submodels = {}
         self._bayesian_parameters = {}
@@ -187,6 +193,30 @@ class BayesianModel(metaclass=abc.ABCMeta):
             setattr(self, name, submodel.double())
         return self
 
+    def set_compute_dtype(self, dtype=None):
+        '''Set the precision of the per-frame computations (emission
+        scoring and inference) of the model and its sub-models. The
+        parameters, their posteriors and the accumulated statistics
+        keep their own precision.
+
+        Args:
+            dtype (``torch.dtype``): Precision of the per-frame
+                computations, e.g. ``torch.float32`` or
+                ``torch.bfloat16``. If None, the computations are done
+                in the precision of the parameters.
+
+        Returns:
+            :any:`BayesianModel`
+
+        '''
+        self.compute_dtype = dtype
+        for submodel in self._submodels.values():
+            submodel.set_compute_dtype(dtype)
+        for module in self._modules.values():
+            if isinstance(module, Model):
+                module.set_compute_dtype(dtype)
+        return self
+
     def to(self, device):
         '''Create a new :any:`BayesianModel` with all the parameters
         allocated on `device`.
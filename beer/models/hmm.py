@@ -1,11 +1,27 @@
 
+import copy
 import torch
 from .bayesmodel import DiscreteLatentBayesianModel
 from .modelset import DynamicallyOrderedModelSet
 from .parameters import ConstantParameter
+from ..graph import StreamingViterbi
 from ..utils import onehot
 
 
+# Pad a set of concatenated sequences ([N, K] tensor) into a
+# [B, max(lengths), K] tensor.
+def _pad(tensor, lengths):
+    padded = tensor.new_zeros(len(lengths), max(lengths), tensor.shape[-1])
+    for i, seq in enumerate(torch.split(tensor, lengths)):
+        padded[i, :len(seq)] = seq
+    return padded
+
+
+# Inverse of "_pad".
+def _unpad(padded, lengths):
+    return torch.cat([seq[:length] for seq, length in zip(padded, lengths)])
+
+
 class HMM(DiscreteLatentBayesianModel):
     ''' Hidden Markov Model.
 
@@ -34,34 +50,137 @@ class HMM(DiscreteLatentBayesianModel):
 
     def __init__(self, graph, modelset):
         super().__init__(DynamicallyOrderedModelSet(modelset))
-        self.graph = ConstantParameter(graph)
+        self.graph = ConstantParameter(graph.optimize())
+
+    # Graph used for the inference: the graph of the model by default.
+    # Sparse graphs are automatically converted to the sparse
+    # inference engine.
+    def _inference_graph(self, inference_graph):
+        if inference_graph is None:
+            graph = self.graph.value
+        else:
+            graph = inference_graph.optimize()
+        return self._cast_graph(graph)
+
+    # With a reduced precision for the per-frame computations (see
+    # "set_compute_dtype"), the inference is done in (at least) single
+    # precision. The converted copy of the graph of the model is
+    # cached until the probabilities of the graph are modified
+    # (in-place updates are tracked with the version counters of the
+    # tensors).
+    def _cast_graph(self, graph):
+        if self.compute_dtype is None:
+            return graph
+        dtype = torch.promote_types(self.compute_dtype, torch.float32)
+        if graph.init_log_probs.dtype == dtype:
+            return graph
+        tensors = (graph.init_log_probs, graph.final_log_probs,
+                   graph.trans_log_probs)
+        versions = tuple(tensor._version for tensor in tensors)
+        cached = getattr(self, '_cast_graph_cache', None)
+        if cached is None or cached[0] is not graph \
+                or any(t1 is not t2 for t1, t2 in zip(cached[1], tensors)) \
+                or cached[2] != versions \
+                or cached[3].init_log_probs.dtype != dtype:
+            cached = (graph, tensors, versions,
+                      copy.deepcopy(graph).to(dtype))
+            self._cast_graph_cache = cached
+        return cached[3]
 
-    def _pc_llhs(self, stats, inference_graph):
+    def _pc_llhs(self, stats, inference_graph, scale=1.):
         order = inference_graph.pdf_id_mapping
-        return self.modelset.expected_log_likelihood(stats, order)
+        pc_llhs = self.modelset.expected_log_likelihood(stats, order)
+        if scale != 1.:
+            pc_llhs = scale * pc_llhs
+        if self.compute_dtype is not None:
+            pc_llhs = pc_llhs.to(inference_graph.init_log_probs.dtype)
+        return pc_llhs
 
+    # Returns the state posteriors followed (if requested) by the
+    # transition posteriors, the expected transition counts (summed
+    # over all the frames and sequences) and the number of active
+    # states per frame.
+    # Note: pruning ("beam" and "max_active") is only available for a
+    # single sequence.
     def _inference(self, pc_llhs, inference_graph, viterbi=True,
-                   state_path=None, trans_posteriors=False):
-        if viterbi or state_path is not None:
+                   state_path=None, trans_posteriors=False, trans_counts=False,
+                   lengths=None, beam=None, max_active=None):
+        pruning = beam is not None or max_active is not None
+        if lengths is not None and (viterbi or state_path is not None):
+            # The best path is computed independently for each
+            # sequence.
             if state_path is None:
+                state_paths = [None] * len(lengths)
+            else:
+                state_paths = torch.split(state_path, lengths)
+            results = [
+                self._inference(seq_llhs, inference_graph, viterbi=viterbi,
+                                state_path=seq_path,
+                                trans_posteriors=trans_posteriors,
+                                trans_counts=trans_counts)
+                for seq_llhs, seq_path in zip(torch.split(pc_llhs, lengths),
+                                              state_paths)
+            ]
+            if not trans_posteriors and not trans_counts:
+                return torch.cat(results)
+            retval = [torch.cat([result[0] for result in results])]
+            if trans_posteriors:
+                retval.append(torch.cat([result[1] for result in results]))
+            if trans_counts:
+                retval.append(sum(result[-1] for result in results))
+        elif lengths is not None:
+            retval = inference_graph.batch_posteriors(
+                _pad(pc_llhs, lengths), lengths,
+                trans_posteriors=trans_posteriors,
+                trans_counts=trans_counts)
+            if not trans_posteriors and not trans_counts:
+                return _unpad(retval, lengths)
+            retval = list(retval)
+            retval[0] = _unpad(retval[0], lengths)
+            if trans_posteriors:
+                retval[1] = _unpad(retval[1],
+                                   [length - 1 for length in lengths])
+            if trans_counts:
+                retval[-1] = retval[-1].sum(dim=0)
+        elif viterbi or state_path is not None:
+            if state_path is None and pruning:
+                path, n_active = inference_graph.best_path(
+                    pc_llhs, beam=beam, max_active=max_active)
+            elif state_path is None:
                 path = inference_graph.best_path(pc_llhs)
             else:
+                # The path is given: nothing to prune.
                 path = state_path
+                n_active = torch.ones(len(path), dtype=torch.long)
             posts = onehot(path, inference_graph.n_states,
                            dtype=pc_llhs.dtype, device=pc_llhs.device)
+            retval = [posts]
+            n_states = inference_graph.n_states
+            path = path.cpu()
             if trans_posteriors:
-                n_states = self.graph.value.n_states
                 trans_posts = torch.zeros(len(pc_llhs) - 1, n_states, n_states)
-                for i, transition in enumerate(zip(path[:-1], path[1:])):
-                    src, dest = transition
-                    trans_posts[i, src, dest] += 1
-                retval = posts, trans_posts
-            else:
-                retval = posts
+                frame_idxs = torch.arange(len(pc_llhs) - 1)
+                trans_posts.index_put_((frame_idxs, path[:-1], path[1:]),
+                                       torch.ones(len(frame_idxs)),
+                                       accumulate=True)
+                retval.append(trans_posts)
+            if trans_counts:
+                counts = torch.zeros(n_states, n_states, dtype=pc_llhs.dtype)
+                counts.index_put_((path[:-1], path[1:]),
+                                  torch.ones(len(path) - 1, dtype=pc_llhs.dtype),
+                                  accumulate=True)
+                retval.append(counts.to(pc_llhs.device))
+            if pruning:
+                retval.append(n_active)
+            if len(retval) == 1:
+                return posts
         else:
-            retval = inference_graph.posteriors(pc_llhs,
-                                                trans_posteriors=trans_posteriors)
-        return retval
+            return inference_graph.posteriors(pc_llhs,
+                                              trans_posteriors=trans_posteriors,
+                                              trans_counts=trans_counts,
+                                              beam=beam,
+                                              max_active=max_active)
+        return tuple(retval)
 
     ####################################################################
     # BayesianModel interface.
@@ -70,21 +189,97 @@ class HMM(DiscreteLatentBayesianModel):
     def mean_field_factorization(self):
         return self.modelset.mean_field_factorization()
 
+    # The emissions are wrapped in a (non Bayesian) model set which is
+    # not registered as a sub-model: the parameters are taken from the
+    # mean-field factorization so that the KL divergence accounts for
+    # them.
+    def bayesian_parameters(self):
+        for group in self.mean_field_factorization():
+            for param in group:
+                yield param
+
     def sufficient_statistics(self, data):
         return self.modelset.sufficient_statistics(data)
 
+    # Checkpointed inference (see "CompiledGraph.posteriors"): the
+    # emissions are scored segment by segment (twice) and the
+    # statistics of each segment are accumulated as soon as its
+    # posteriors are known. Neither the per-frame log-likelihoods nor
+    # the posteriors are stored for the whole sequence. The posteriors
+    # are not differentiable.
+    def _checkpointed_expected_log_likelihood(self, stats, inference_graph):
+        segments = inference_graph._checkpointed_baum_welch(
+            len(stats),
+            lambda start, end: self._pc_llhs(stats[start:end],
+                                             inference_graph),
+            trans_counts=True
+        )
+        exp_llhs, acc_stats = [], {}
+        trans_counts = 0.
+        for start, pc_llhs, _, resps, counts in segments:
+            exp_llhs.append((pc_llhs * resps).sum(dim=-1))
+            seg_stats = self.modelset.accumulate(
+                stats[start:start + len(resps)], resps)
+            for param, value in seg_stats.items():
+                acc_stats[param] = acc_stats[param] + value \
+                    if param in acc_stats else value
+            trans_counts = trans_counts + counts
+        self.cache.pop('resps', None)
+        self.cache['acc_stats'] = acc_stats
+        self.cache['trans_counts'] = trans_counts
+        self.cache['init_resps'] = resps[0]
+        return torch.cat(exp_llhs[::-1])
+
     def expected_log_likelihood(self, stats, inference_graph=None,
-                                viterbi=True, state_path=None):
-        if inference_graph is None:
-            inference_graph = self.graph.value
+                                viterbi=True, state_path=None, lengths=None,
+                                checkpoint=False):
+        '''
+        Args:
+            stats (``torch.Tensor[N, D]``): Sufficient statistics.
+            inference_graph (:any:`CompiledGraph`): Graph to use for
+                the inference (default: the graph of the model).
+            viterbi (boolean): Use the best path instead of the
+                posteriors of the states.
+            state_path (``torch.LongTensor[N]``): Use the given path
+                instead of the best path.
+            lengths (list): If provided, `stats` is the concatenation
+                of several sequences of the given lengths. The
+                inference is done for all the sequences at once.
+            checkpoint (boolean): Use the checkpointed forward-backward
+                algorithm: the memory needed by the inference grows
+                with the square root of the number of frames. It is
+                only used for a single sequence without "viterbi" and
+                "state_path". The statistics of the emissions are
+                accumulated during the inference.
+
+        Returns:
+            ``torch.Tensor[N]``: expected log-likelihood.
+
+        '''
+        inference_graph = self._inference_graph(inference_graph)
+        if checkpoint and not viterbi and state_path is None \
+                and lengths is None:
+            return self._checkpointed_expected_log_likelihood(stats,
+                                                              inference_graph)
+        if lengths is not None:
+            lengths = [int(length) for length in lengths]
         pc_llhs = self._pc_llhs(stats, inference_graph)
-        resps, trans_resps = self._inference(pc_llhs, inference_graph,
-                                             viterbi=viterbi,
-                                             state_path=state_path,
-                                             trans_posteriors=True)
+        resps, trans_counts = self._inference(pc_llhs, inference_graph,
+                                              viterbi=viterbi,
+                                              state_path=state_path,
+                                              trans_counts=True,
+                                              lengths=lengths)
         exp_llh = (pc_llhs * resps).sum(dim=-1)
+        self.cache.pop('acc_stats', None)
         self.cache['resps'] = resps
-        self.cache['trans_resps'] = trans_resps
+        self.cache['trans_counts'] = trans_counts
+
+        # Posteriors of the first frame of each sequence.
+        if lengths is None:
+            self.cache['init_resps'] = resps[0]
+        else:
+            start_idxs = [sum(lengths[:i]) for i in range(len(lengths))]
+            self.cache['init_resps'] = resps[start_idxs].sum(dim=0)
 
         # We ignore the KL divergence term. It biases the
         # lower-bound (it may decrease) a little bit but will not affect
@@ -92,9 +287,13 @@ class HMM(DiscreteLatentBayesianModel):
         return exp_llh #- kl_div
 
     def accumulate(self, stats, parent_msg=None):
-        retval = {
-            **self.modelset.accumulate(stats, self.cache['resps'])
-        }
+        if 'acc_stats' in self.cache:
+            # Already accumulated by the checkpointed inference.
+            retval = dict(self.cache['acc_stats'])
+        else:
+            retval = {
+                **self.modelset.accumulate(stats, self.cache['resps'])
+            }
         # By default, we don't do anything with the transition probabilities
         return retval
 
@@ -102,24 +301,147 @@ class HMM(DiscreteLatentBayesianModel):
     # DiscreteLatentBayesianModel interface.
     ####################################################################
 
-    def decode(self, data, inference_graph=None):
-        if inference_graph is None:
-            inference_graph = self.graph.value
+    def decode(self, data, inference_graph=None, beam=None, max_active=None,
+               lengths=None, scale=1., return_active=False):
+        '''Most likely sequence of pdf ids.
+
+        Args:
+            data (``torch.Tensor[N, D]``): Input features.
+            inference_graph (:any:`CompiledGraph`): Graph to use for
+                the decoding (default: the graph of the model).
+            beam (float): Pruning beam (in log domain).
+            max_active (int): Maximum number of active states per
+                frame.
+            lengths (list): If provided, `data` is the concatenation
+                of several sequences of the given lengths. The emissions
+                are scored for all the sequences at once and the best
+                path is computed for each of them.
+            scale (float): Scaling factor of the acoustic model.
+            return_active (boolean): If True, also return the number
+                of active states per frame.
+
+        Returns:
+            ``torch.LongTensor[N]``: sequence of pdf ids.
+            ``torch.LongTensor[N]``: number of active states per frame
+                (only if "return_active" is True).
+
+        '''
+        inference_graph = self._inference_graph(inference_graph)
         stats = self.sufficient_statistics(data)
-        pc_llhs = self._pc_llhs(stats, inference_graph)
-        best_path = inference_graph.best_path(pc_llhs)
+        pc_llhs = self._pc_llhs(stats, inference_graph, scale)
+        pruning = beam is not None or max_active is not None
+        if lengths is None:
+            seqs_llhs = [pc_llhs]
+        else:
+            seqs_llhs = torch.split(pc_llhs, [int(length) for length in lengths])
+        results = [inference_graph.best_path(seq_llhs, beam=beam,
+                                             max_active=max_active)
+                   for seq_llhs in seqs_llhs]
+        if pruning:
+            best_path = torch.cat([result[0] for result in results])
+            n_active = torch.cat([result[1] for result in results])
+        else:
+            best_path = torch.cat(results)
+            n_active = torch.full((len(best_path),), inference_graph.n_states,
+                                  dtype=torch.long)
         best_path = [inference_graph.pdf_id_mapping[state]
                      for state in best_path]
         best_path = torch.LongTensor(best_path)
+        if return_active:
+            return best_path, n_active
         return best_path
 
-    def posteriors(self, data, inference_graph=None):
-        if inference_graph is None:
-            inference_graph = self.graph.value
+    def streaming_decoder(self, inference_graph=None, beam=None,
+                          max_active=None, max_latency=None):
+        '''Decoder processing the features chunk by chunk.
+
+        Args:
+            inference_graph (:any:`CompiledGraph`): Graph to use for
+                the decoding (default: the graph of the model).
+            beam (float): Pruning beam (in log domain).
+            max_active (int): Maximum number of active states per
+                frame.
+            max_latency (int): Maximum number of frames waiting for
+                the best path to be decided (see
+                :any:`StreamingViterbi`).
+
+        Returns:
+            An object with a ``process(data)`` and a ``flush()``
+            method, both returning the newly decided part of the
+            sequence of pdf ids (``torch.LongTensor``).
+
+        '''
+        inference_graph = self._inference_graph(inference_graph)
+        decoder = StreamingViterbi(inference_graph, beam=beam,
+                                   max_active=max_active,
+                                   max_latency=max_latency)
+        return _StreamingDecoder(self, inference_graph, decoder)
+
+    def posteriors(self, data, inference_graph=None, beam=None,
+                   max_active=None, lengths=None, scale=1.,
+                   return_active=False):
+        '''Posteriors of the states.
+
+        Args:
+            data (``torch.Tensor[N, D]``): Input features.
+            inference_graph (:any:`CompiledGraph`): Graph to use for
+                the inference (default: the graph of the model).
+            beam (float): Pruning beam (in log domain).
+            max_active (int): Maximum number of active states per
+                frame.
+            lengths (list): If provided, `data` is the concatenation
+                of several sequences of the given lengths. The emissions
+                are scored for all the sequences at once (pruning is
+                not available in this case).
+            scale (float): Scaling factor of the acoustic model.
+            return_active (boolean): If True, also return the number
+                of active states per frame.
+
+        Returns:
+            ``torch.Tensor[N, K]``: posteriors (pruned states have a
+                posterior of zero).
+            ``torch.LongTensor[N]``: number of active states per frame
+                (only if "return_active" is True).
+
+        '''
+        pruning = beam is not None or max_active is not None
+        if lengths is not None and pruning:
+            raise ValueError('pruning is not available for several sequences')
+        inference_graph = self._inference_graph(inference_graph)
         stats = self.modelset.sufficient_statistics(data)
-        pc_llhs = self._pc_llhs(stats, inference_graph)
-        return self._inference(pc_llhs, inference_graph)
+        pc_llhs = self._pc_llhs(stats, inference_graph, scale)
+        if lengths is not None:
+            lengths = [int(length) for length in lengths]
+        retval = self._inference(pc_llhs, inference_graph, beam=beam,
+                                 max_active=max_active, lengths=lengths)
+        if pruning:
+            posts, n_active = retval
+        else:
+            posts = retval
+            n_active = torch.full((len(posts),), inference_graph.n_states,
+                                  dtype=torch.long)
+        if return_active:
+            return posts, n_active
+        return posts
 
 
-__all__ = ['HMM']
+class _StreamingDecoder:
+
+    def __init__(self, model, inference_graph, decoder):
+        self.model = model
+        self.inference_graph = inference_graph
+        self.decoder = decoder
+        self.pdf_ids = torch.LongTensor(inference_graph.pdf_id_mapping)
+
+    def process(self, data):
+        if len(data) == 0:
+            return self.decoder.process(data)
+        stats = self.model.sufficient_statistics(data)
+        pc_llhs = self.model._pc_llhs(stats, self.inference_graph)
+        return self.pdf_ids[self.decoder.process(pc_llhs.detach())]
 
+    def flush(self):
+        return self.pdf_ids[self.decoder.flush()]
+
+
+__all__ = ['HMM']
@@ -9,6 +9,7 @@ from .bayesmodel import BayesianParameterSet
 from .modelset import BayesianModelSet
 from .normal import Normal
 from .normalset import NormalSetElement
+from .normalset import _weighted_outer_products
 from ..priors import NormalFullCovariancePrior
 from ..priors import WishartPrior
 from ..utils import make_symposdef
@@ -125,26 +126,30 @@ class MarginalPLDASet(BayesianModelSet):
         ]
 
     def sufficient_statistics(self, data):
-        # We need the raw data to accumualte the s. statistics.
+        # The expected log-likelihood and the accumulated statistics
+        # are computed directly from the data, this avoids to build the
+        # [N x K x D^2] outer products (x - m_k)(x - m_k)^T.
         self.cache['data'] = data
-
-        means = self.class_means
-        covs = self.class_covs
-        data_means = data[:, None, :] - means[None]
-        data_mean_quad = data_means[:, :, :, None] * data_means[:, :, None, :]
-        return torch.cat([
-            -.5 * (data_mean_quad + covs[None]).view(len(data), len(self), -1),
-            data_means,
-            -.5 * torch.ones(len(data), len(self), 1, dtype=data.dtype,
-                       device=data.device),
-            .5 * torch.ones(len(data), len(self), 1, dtype=data.dtype,
-                       device=data.device),
-        ], dim=-1)
+        return data
 
     def expected_log_likelihood(self, s_stats):
+        data = s_stats
         feadim = len(self.normal.mean)
         nparams = self.normal.mean_precision.expected_natural_parameters()
-        exp_llh = s_stats @ nparams
+        prec = nparams[:feadim ** 2].reshape(feadim, feadim)
+        prec_mean = nparams[feadim ** 2:feadim ** 2 + feadim]
+        means = self.class_means
+        covs = self.class_covs
+
+        # (x - m_k)^T Λ (x - m_k) + tr(Λ Σ_k)
+        prec_data = data @ prec
+        quad = (prec_data * data).sum(dim=-1)[:, None] \
+            - 2 * prec_data @ means.t() \
+            + ((means @ prec) * means).sum(dim=-1) \
+            + (covs * prec).reshape(len(self), -1).sum(dim=-1)
+
+        exp_llh = -.5 * quad + (data @ prec_mean)[:, None] \
+            - (means @ prec_mean) - .5 * nparams[-2] + .5 * nparams[-1]
         exp_llh -= .5 * feadim * math.log(2 * math.pi)
         return exp_llh
 
@@ -155,12 +160,30 @@ class MarginalPLDASet(BayesianModelSet):
         mean, prec = self.normal.mean_precision.expected_value()
         prec_data_mean = (data - mean)
 
-        acc_stats = self.normal.accumulate(
-            (s_stats * resps[:, :, None]).sum(dim=1))
+        # Statistics of the normal model weighted by the
+        # responsibilities and summed over the frames and the classes:
+        # sum_nk r_nk (x_n - m_k)(x_n - m_k)^T
+        #   = sum_n r_n x_n x_n^T - sum_k (a_k m_k^T + m_k a_k^T)
+        #     + sum_k r_k m_k m_k^T
+        # with r_n = sum_k r_nk, r_k = sum_n r_nk and a_k = sum_n r_nk x_n.
+        means = self.class_means
+        covs = self.class_covs
+        acc_resps = resps.sum(dim=0)
+        acc_data = resps.t() @ data
+        cross = acc_data.t() @ means
+        quad = _weighted_outer_products(data, resps.sum(dim=1)[:, None])[0] \
+            - (cross + cross.t()).view(-1) \
+            + ((acc_resps[:, None] * means).t() @ means).view(-1) \
+            + (acc_resps[:, None, None] * covs).sum(dim=0).view(-1)
+        total_resps = acc_resps.sum().view(1)
+        acc_stats = self.normal.accumulate(torch.cat([
+            -.5 * quad,
+            (acc_data - acc_resps[:, None] * means).sum(dim=0),
+            -.5 * total_resps,
+            .5 * total_resps,
+        ])[None])
 
         # Accumulate the statistics for the class means.
-        import pdb; pdb.set_trace()
-        acc_resps = resps.sum(dim=0)
         acc_prec_data_mean = (prec_data_mean[:, :, None] @ resps[:, None, :]).sum(dim=0).t()
         for i, mean_param in enumerate(self.class_mean_params):
             class_mean_acc_stats = {
@@ -85,6 +85,13 @@ class MixtureSet(BayesianModelSet):
     def expected_log_likelihood(self, stats):
         log_weights = self.weights.expected_natural_parameters()
         pc_exp_llhs = self.modelset.expected_log_likelihood(stats)
+
+        # With a reduced precision for the emissions (see
+        # "set_compute_dtype"), the responsibilities are still computed
+        # in (at least) single precision.
+        pc_exp_llhs = pc_exp_llhs.to(torch.promote_types(pc_exp_llhs.dtype,
+                                                         torch.float32))
+        log_weights = log_weights.to(pc_exp_llhs.dtype)
         pc_exp_llhs = pc_exp_llhs.reshape(-1, len(self), self.n_comp_per_mixture)
         w_pc_exp_llhs = pc_exp_llhs + log_weights[None]
 
@@ -105,7 +112,8 @@ class MixtureSet(BayesianModelSet):
     def accumulate(self, stats, resps):
         ret_val = {}
         joint_resps = self.cache['resps'] * resps[:,:, None]
-        sum_joint_resps = joint_resps.sum(dim=0)
+        dtype = self.weights[0].posterior.natural_parameters.dtype
+        sum_joint_resps = joint_resps.sum(dim=0).to(dtype)
         ret_val = dict(zip(self.weights, torch.tensor(sum_joint_resps)))
         acc_stats = self.modelset.accumulate(stats,
             joint_resps.reshape(-1, len(self) * self.n_comp_per_mixture))
@@ -150,6 +150,11 @@ class DynamicallyOrderedModelSet(ModelSet):
         super().__init__()
         self.original_modelset = original_modelset
 
+    def set_compute_dtype(self, dtype=None):
+        self.compute_dtype = dtype
+        self.original_modelset.set_compute_dtype(dtype)
+        return self
+
     ####################################################################
     # BayesianModel interface.
     ####################################################################
@@ -161,19 +166,27 @@ class DynamicallyOrderedModelSet(ModelSet):
         return self.original_modelset.sufficient_statistics(data)
 
     def expected_log_likelihood(self, stats, order=None):
-        if order is None:
-            order = list(range(len(self.original_modelset)))
-        dtype, device = stats.dtype, stats.device
+        # The components are evaluated once and the log-likelihoods
+        # are gathered following the order (repeated components are
+        # not re-evaluated).
         pc_exp_llh = self.original_modelset.expected_log_likelihood(stats)
+        if order is not None:
+            order = torch.as_tensor(order, dtype=torch.long,
+                                    device=pc_exp_llh.device)
+            pc_exp_llh = pc_exp_llh.index_select(1, order)
         self.cache['order'] = order
-        return pc_exp_llh[:, order]
+        return pc_exp_llh
 
     def accumulate(self, stats, resps):
         order = self.cache['order']
+        if order is None:
+            return self.original_modelset.accumulate(stats, resps)
+
+        # Fold the responsibilities of the repeated components onto
+        # the original components.
         new_resps = torch.zeros((len(stats), len(self.original_modelset)),
                                  dtype=resps.dtype, device=resps.device)
-        for i, val in enumerate(resps.t()):
-            new_resps[:, order[i]] += val
+        new_resps.index_add_(1, order.to(resps.device), resps)
         return self.original_modelset.accumulate(stats, new_resps)
 
     ####################################################################
@@ -203,6 +216,11 @@ class RepeatedModelSet(ModelSet):
         self.modelset = modelset
         self.repeat = repeat
 
+    def set_compute_dtype(self, dtype=None):
+        self.compute_dtype = dtype
+        self.modelset.set_compute_dtype(dtype)
+        return self
+
 
     ####################################################################
     # BayesianModel interface.
@@ -27,6 +27,62 @@ from ..priors import JointNormalWishartPrior
 NormalSetElement = namedtuple('NormalSetElement', ['mean', 'cov'])
 
 
+# Maximum number of elements of the per-frame second order
+# statistics (outer products) built at once by the full covariance
+# sets.
+_MAX_OUTER_PRODUCTS_SIZE = 2 ** 22
+
+
+def _split_frames(tensors, dim):
+    chunk_size = max(1, _MAX_OUTER_PRODUCTS_SIZE // (dim ** 2))
+    return zip(*[torch.split(tensor, chunk_size) for tensor in tensors])
+
+
+def _outer_products(data):
+    return (data[:, :, None] * data[:, None, :]).reshape(len(data), -1)
+
+
+def _quadratic_forms(data, mats):
+    '''Quadratic forms x_n^T M_k x_n for all the frames and matrices
+    without materializing the outer products of the whole data.
+
+    Args:
+        data (``torch.Tensor[N, D]``): Data.
+        mats (``torch.Tensor[K, D, D]``): Matrices.
+
+    Returns:
+        ``torch.Tensor[N, K]``
+
+    '''
+    dim = data.shape[1]
+    if len(mats) <= dim:
+        # Batched matrix product, the [K, N, D] intermediate result is
+        # smaller than the outer products.
+        return ((data @ mats) * data).sum(dim=-1).t()
+    vmats = mats.reshape(len(mats), -1).t()
+    return torch.cat([_outer_products(chunk) @ vmats
+                      for chunk, in _split_frames([data], dim)])
+
+
+def _weighted_outer_products(data, weights):
+    '''Weighted sums of the outer products: sum_n w_nk x_n x_n^T.
+
+    Args:
+        data (``torch.Tensor[N, D]``): Data.
+        weights (``torch.Tensor[N, K]``): Weights.
+
+    Returns:
+        ``torch.Tensor[K, D * D]``
+
+    '''
+    dim = data.shape[1]
+    acc_stats = torch.zeros(weights.shape[1], dim ** 2, dtype=data.dtype,
+                            device=data.device)
+    for chunk, w_chunk in _split_frames([data, weights], dim):
+        acc_stats += w_chunk.t() @ _outer_products(chunk)
+    return acc_stats
+
+
 class NormalSet(BayesianModelSet, metaclass=abc.ABCMeta):
     '''Set of Normal models.'''
 
@@ -62,6 +118,12 @@ class NormalSet(BayesianModelSet, metaclass=abc.ABCMeta):
     def __len__(self):
         pass
 
+    # Tensor in the precision of the per-frame computations.
+    def _to_compute_dtype(self, tensor):
+        if self.compute_dtype is None:
+            return tensor
+        return tensor.to(self.compute_dtype)
+
 
 ########################################################################
 # Normal set with no shared covariance matrix.
@@ -97,6 +159,35 @@ class NormalSetNonSharedCovariance(NormalSet, metaclass=abc.ABCMeta):
             for post in posteriors
         ])
 
+    # Models pickled before the natural parameters were cached by the
+    # parameter set have this callback registered on their parameters.
+    def _on_params_update(self):
+        pass
+
+    def expected_natural_parameters(self):
+        '''Expected natural parameters of all the components. The
+        stacked matrix is cached by the parameter set until one of
+        the parameters is updated.
+
+        Returns:
+            ``torch.Tensor[K, D']``
+        '''
+        return self.means_precisions.expected_natural_parameters()
+
+    # Expected natural parameters in the precision of the per-frame
+    # computations. The down-cast copy is cached along with the
+    # matrix it was made from.
+    def _compute_natural_parameters(self):
+        nparams = self.expected_natural_parameters()
+        if self.compute_dtype is None or self.compute_dtype == nparams.dtype:
+            return nparams
+        cached = getattr(self, '_compute_nparams', None)
+        if cached is None or cached[0] is not nparams \
+                or cached[1].dtype != self.compute_dtype:
+            cached = (nparams, nparams.to(self.compute_dtype))
+            self._compute_nparams = cached
+        return cached[1]
+
     def __len__(self):
         return len(self.means_precisions)
 
@@ -108,7 +199,8 @@ class NormalSetNonSharedCovariance(NormalSet, metaclass=abc.ABCMeta):
         return [[*self.means_precisions]]
 
     def expected_log_likelihood(self, stats):
-        nparams = self.means_precisions.expected_natural_parameters()
+        nparams = self._compute_natural_parameters()
+        stats = self._to_compute_dtype(stats)
         return stats @ nparams.t() - .5 * self.dim * math.log(2 * math.pi)
 
     def marginal_log_likelihood(self, stats):
@@ -120,7 +212,11 @@ class NormalSetNonSharedCovariance(NormalSet, metaclass=abc.ABCMeta):
         return torch.cat(m_llhs, dim=-1)
 
     def accumulate(self, stats, weights):
-        return dict(zip(self.means_precisions, torch.tensor(weights.t() @ stats)))
+        # The statistics are accumulated in the precision of the
+        # parameters.
+        dtype = self.means_precisions[0].posterior.natural_parameters.dtype
+        w_stats = weights.t().to(dtype) @ stats.to(dtype)
+        return dict(zip(self.means_precisions, torch.tensor(w_stats)))
 
 
 class NormalSetIsotropicCovariance(NormalSetNonSharedCovariance):
@@ -167,7 +263,15 @@ class NormalSetDiagonalCovariance(NormalSetNonSharedCovariance):
 
 
 class NormalSetFullCovariance(NormalSetNonSharedCovariance):
-    '''Set of Normal models with full covariance matrix.'''
+    '''Set of Normal models with full covariance matrix.
+
+    Note:
+        To avoid building the outer product of each frame ([N, D * D]
+        matrix), the sufficient statistics of the set are the data
+        themselves. The second order statistics are only built,
+        weighted and summed over the frames, in :any:`accumulate`.
+
+    '''
 
     def __getitem__(self, key):
         mean, precision = self.means_precisions[key].expected_value()
@@ -176,9 +280,32 @@ class NormalSetFullCovariance(NormalSetNonSharedCovariance):
 
     @staticmethod
     def sufficient_statistics(data):
-        return NormalFullCovariance.sufficient_statistics(data)
+        return data
+
+    def expected_log_likelihood(self, stats):
+        data = self._to_compute_dtype(stats)
+        nparams = self._compute_natural_parameters()
+        dim = data.shape[1]
+        quad_nparams = nparams[:, :dim ** 2].reshape(-1, dim, dim)
+        exp_llhs = -.5 * _quadratic_forms(data, quad_nparams)
+        exp_llhs += data @ nparams[:, dim ** 2: dim ** 2 + dim].t()
+        exp_llhs += -.5 * nparams[:, -2] + .5 * nparams[:, -1]
+        return exp_llhs - .5 * dim * math.log(2 * math.pi)
+
+    def accumulate(self, stats, weights):
+        dtype = self.means_precisions[0].posterior.natural_parameters.dtype
+        data, weights = stats.detach().to(dtype), weights.detach().to(dtype)
+        acc_weights = weights.sum(dim=0)[:, None]
+        acc_stats = torch.cat([
+            -.5 * _weighted_outer_products(data, weights),
+            weights.t() @ data,
+            -.5 * acc_weights,
+            .5 * acc_weights
+        ], dim=-1)
+        return dict(zip(self.means_precisions, acc_stats))
 
     def marginal_log_likelihood(self, stats):
+        stats = NormalFullCovariance.sufficient_statistics(stats)
         m_llhs = []
         for param in self.means_precisions:
             cls = NormalFullCovariance
@@ -237,6 +364,22 @@ class NormalSetSharedCovariance(NormalSet, metaclass=abc.ABCMeta):
     def mean_field_factorization(self):
         return [[self.means_precision]]
 
+    # Split expected natural parameters in the precision of the
+    # per-frame computations. They are cached along with the
+    # expected natural parameters they were computed from (the
+    # posterior returns the same tensor until it is updated).
+    def _compute_natural_parameters(self):
+        nparams = self.means_precision.expected_natural_parameters()
+        cached = getattr(self, '_split_nparams', None)
+        if cached is None or cached[0] is not nparams \
+                or cached[1] != self.compute_dtype:
+            nparams1, nparams2 = self._split_natural_parameters(nparams)
+            cached = (nparams, self.compute_dtype,
+                      self._to_compute_dtype(nparams1),
+                      self._to_compute_dtype(nparams2))
+            self._split_nparams = cached
+        return cached[2], cached[3]
+
     def marginal_log_likelihood(self, stats):
         joint_nparams = self.means_precision.posterior.natural_parameters
         np1, np2 = self._split_natural_parameters(joint_nparams)
@@ -298,9 +441,9 @@ class NormalSetSharedIsotropicCovariance(NormalSetSharedCovariance):
         return NormalIsotropicCovariance.sufficient_statistics(data)
 
     def expected_log_likelihood(self, stats):
+        stats = self._to_compute_dtype(stats)
         stats1, stats2 = stats[:, (0, -1)], stats[:, 1:-1]
-        nparams = self.means_precision.expected_natural_parameters()
-        nparams1, nparams2 = self._split_natural_parameters(nparams)
+        nparams1, nparams2 = self._compute_natural_parameters()
         exp_llhs = (stats1 @ nparams1)[:, None] + stats2 @ nparams2.t()
         exp_llhs -= .5 * self.dim * math.log(2 * math.pi)
         return exp_llhs
@@ -314,8 +457,8 @@ class NormalSetSharedIsotropicCovariance(NormalSetSharedCovariance):
         return torch.cat(m_llhs, dim=-1)
 
     def accumulate(self, stats, resps):
-        dtype, device = stats.dtype, stats.device
-        w_stats = resps.t() @ stats
+        dtype = self.means_precision.posterior.natural_parameters.dtype
+        w_stats = resps.t().to(dtype) @ stats.to(dtype)
         acc_stats = torch.cat([
             w_stats[:, 0].sum().view(1),
             w_stats[:, 1: 1 + self.dim].contiguous().view(-1),
@@ -368,15 +511,15 @@ class NormalSetSharedDiagonalCovariance(NormalSetSharedCovariance):
         return NormalDiagonalCovariance.sufficient_statistics(data)
 
     def expected_log_likelihood(self, stats):
-        stats1, stats2 = self._split_stats(stats)
-        nparams = self.means_precision.expected_natural_parameters()
-        nparams1, nparams2 = self._split_natural_parameters(nparams)
+        stats1, stats2 = self._split_stats(self._to_compute_dtype(stats))
+        nparams1, nparams2 = self._compute_natural_parameters()
         exp_llhs = (stats1 @ nparams1)[:, None] + stats2 @ nparams2.t()
         exp_llhs -= .5 * self.dim * math.log(2 * math.pi)
         return exp_llhs
 
     def accumulate(self, stats, resps):
-        w_stats = resps.t() @ stats
+        dtype = self.means_precision.posterior.natural_parameters.dtype
+        w_stats = resps.t().to(dtype) @ stats.to(dtype)
         acc_stats = torch.cat([
             w_stats[:, :self.dim].sum(dim=0),
             w_stats[:, self.dim: 2 * self.dim].contiguous().view(-1),
@@ -411,11 +554,6 @@ class NormalSetSharedFullCovariance(NormalSetSharedCovariance):
         cov = precision.inverse()
         return NormalSetElement(mean=means[key], cov=cov)
 
-    def _split_stats(self, stats):
-        stats1 = torch.cat([stats[:,:self.dim ** 2], stats[:,-1].view(-1, 1)], dim=-1)
-        stats2 = stats[:, self.dim**2:-1]
-        return stats1, stats2
-
     def _split_natural_parameters(self, nparams):
         nparams1 = torch.cat([nparams[:self.dim**2], nparams[-1].view(1)], dim=-1)
         start = self.dim**2
@@ -428,25 +566,37 @@ class NormalSetSharedFullCovariance(NormalSetSharedCovariance):
 
     @staticmethod
     def sufficient_statistics(data):
-        return NormalFullCovariance.sufficient_statistics(data)
+        # See "NormalSetFullCovariance".
+        return data
 
     def expected_log_likelihood(self, stats):
-        stats1, stats2 = self._split_stats(stats)
-        nparams = self.means_precision.expected_natural_parameters()
-        nparams1, nparams2 = self._split_natural_parameters(nparams)
-        exp_llhs = (stats1 @ nparams1)[:, None] + stats2 @ nparams2.t()
-        exp_llhs -= .5 * self.dim * math.log(2 * math.pi)
+        data = self._to_compute_dtype(stats)
+        nparams1, nparams2 = self._compute_natural_parameters()
+        dim = data.shape[1]
+        quad_nparams = nparams1[:dim ** 2].reshape(dim, dim)
+        exp_llhs = -.5 * ((data @ quad_nparams) * data).sum(dim=-1) \
+                   + .5 * nparams1[-1]
+        exp_llhs = exp_llhs[:, None] + data @ nparams2[:, :-1].t() \
+                   - .5 * nparams2[:, -1]
+        exp_llhs -= .5 * dim * math.log(2 * math.pi)
         return exp_llhs
 
     def accumulate(self, stats, resps):
-        w_stats = resps.t() @ stats
+        dtype = self.means_precision.posterior.natural_parameters.dtype
+        data, resps = stats.detach().to(dtype), resps.detach().to(dtype)
+        acc_resps = resps.sum(dim=0)
         acc_stats = torch.cat([
-            w_stats[:, :self.dim**2].sum(dim=0),
-            w_stats[:, self.dim**2: self.dim + (self.dim**2)].contiguous().view(-1),
-            w_stats[:, -2].view(-1),
-            w_stats[:, -1].sum().view(1)
+            -.5 * _weighted_outer_products(data,
+                                           resps.sum(dim=1)[:, None]).view(-1),
+            (resps.t() @ data).view(-1),
+            -.5 * acc_resps,
+            .5 * acc_resps.sum().view(1)
         ], dim=0)
-        return {self.means_precision: torch.tensor(acc_stats)}
+        return {self.means_precision: acc_stats}
+
+    def marginal_log_likelihood(self, stats):
+        stats = NormalFullCovariance.sufficient_statistics(stats)
+        return super().marginal_log_likelihood(stats)
 
 
 __all__ = ['NormalSet']
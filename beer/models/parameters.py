@@ -130,9 +130,11 @@ class BayesianParameter:
 
     def remove_stats(self, acc_stats):
         self.posterior.natural_parameters = self.posterior.natural_parameters - acc_stats
+        self._dispatch()
 
     def add_stats(self, acc_stats):
         self.posterior.natural_parameters = self.posterior.natural_parameters + acc_stats
+        self._dispatch()
 
     def natural_grad_update(self, lrate):
         grad = self.prior.natural_parameters + self.stats - \
@@ -153,12 +155,14 @@ class BayesianParameter:
         self.prior = self.prior.float()
         self.posterior = self.posterior.float()
         self.stats = self.stats.float()
+        self._dispatch()
 
     def double_(self):
         '''Convert the value of the parameter to double precision.'''
         self.prior = self.prior.double()
         self.posterior = self.posterior.double()
         self.stats = self.stats.double()
+        self._dispatch()
 
     def to_(self, device):
         '''Move the internal buffer of the parameter to the given
@@ -171,13 +175,39 @@ class BayesianParameter:
         self.prior = self.prior.to(device)
         self.posterior = self.posterior.to(device)
         self.stats = self.stats.to(device)
+        self._dispatch()
 
 
 class BayesianParameterSet:
-    '''Set of Bayesian parameters.'''
+    '''Set of Bayesian parameters.
+
+    Note:
+        The expected natural parameters of the elements of the set are
+        stacked into a single matrix which is kept until one of the
+        parameters notifies an update (see
+        :any:`BayesianParameter.register_callback`).
+
+    '''
 
     def __init__(self, parameters):
         self.__parameters = parameters
+        self._nparams = None
+        self._register_callbacks()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._nparams = None
+
+        # Sets pickled before the cache was introduced did not
+        # register their callback.
+        self._register_callbacks()
+
+    def _register_callbacks(self):
+        for param in self.__parameters:
+            param.register_callback(self._on_params_update)
+
+    def _on_params_update(self):
+        self._nparams = None
 
     def __len__(self):
         return len(self.__parameters)
@@ -193,8 +223,12 @@ class BayesianParameterSet:
             ``torch.Tensor[k,dim`` where k is the number of elements of
                 the set.
         '''
-        return torch.cat([param.expected_natural_parameters().view(1, -1)
-                          for param in self.__parameters], dim=0)
+        if self._nparams is None:
+            self._nparams = torch.cat([
+                param.expected_natural_parameters().view(1, -1)
+                for param in self.__parameters
+            ], dim=0)
+        return self._nparams
 
     def float_(self):
         '''Convert value of the parameter to float precision in-place.'''
@@ -76,13 +76,13 @@ class PhoneLoop(HMM):
 
         # If the phone loop is trained with forced alignments, we don't
         # train the transitions.
-        if 'trans_resps' in self.cache:
-            trans_resps = self.cache['trans_resps'].sum(dim=0)
+        if 'trans_counts' in self.cache:
+            trans_counts = self.cache['trans_counts']
             start_idxs = [value for value in self.start_pdf.values()]
             end_idxs = [value for value in self.end_pdf.values()]
-            phone_resps = trans_resps[:, start_idxs]
+            phone_resps = trans_counts[:, start_idxs]
             phone_resps = phone_resps[end_idxs, :].sum(dim=0)
-            phone_resps += self.cache['resps'][0][start_idxs]
+            phone_resps += self.cache['init_resps'][start_idxs]
             lhf = self.weights.likelihood_fn
             resps_stats = lhf.sufficient_statistics(phone_resps.view(1, -1))
             retval.update({self.weights: resps_stats.view(-1)})
@@ -93,7 +93,7 @@ class NormalWishartPrior(ExpFamilyPrior):
         mean_quad = mean[:, :, None] * mean[:, None, :]
         M = -2 * np1 - scale[:, :, None] * mean_quad
         eye = M.new_ones(M.size(-1)).diag().expand_as(M)
-        M_inv, _ = torch.gesv(eye, M)
+        M_inv = torch.linalg.solve(M, eye)
 
         return mean, scale, M_inv.contiguous(), dof
 
@@ -229,7 +229,7 @@ class JointNormalWishartPrior(ExpFamilyPrior):
         sum_digamma = torch.digamma(.5 * (dof + 1 - seq)).sum()
 
         quad_means = (means[:, :, None] @ means[:, None, :]).view(ncomp, -1)
-        vec_precision = precision.view(-1)
+        vec_precision = precision.reshape(-1)
         return torch.cat([
             precision.reshape(-1),
             (means @ precision).view(-1),
@@ -13,7 +13,7 @@ def _logdet(mats):
     for mat in vmats:
         if mat.requires_grad:
             mat.register_hook(lambda grad: .5 * (grad + grad.t()))
-        retval.append(2 * torch.log(torch.diag(torch.potrf(mat))).sum().view(1))
+        retval.append(2 * torch.log(torch.diag(torch.linalg.cholesky(mat))).sum().view(1))
     return torch.cat(retval).view(-1, 1)
 
 
@@ -82,7 +82,7 @@ class WishartPrior(ExpFamilyPrior):
         ])
 
     def _to_std_parameters(self, natural_parameters):
-        dim = math.sqrt(len(natural_parameters) - 1)
+        dim = int(math.sqrt(len(natural_parameters) - 1))
         np1 = natural_parameters[:-1].reshape((dim, dim))
         np2 = natural_parameters[-1]
         scale = torch.inverse(-2 * np1)
@@ -18,12 +18,16 @@ from basetest import BaseTest
 import test_nnet
 import test_problayers
 import test_arnet
+import test_cli
 import test_create_model
 import test_bayesmodel
 import test_expfamilyprior
 import test_features
+import test_graph
 import test_mixture
+import test_modelset
 import test_normal
+import test_normalset
 import test_hmm
 import test_subspacemodels
 import test_utils
@@ -36,11 +40,15 @@ testcases = {
     'test_arnet': test_arnet,
     'test_nnet': test_nnet,
     'test_features': test_features,
+    'test_graph': test_graph,
     'test_priors': test_priors,
     'test_bayesmodel': test_bayesmodel,
+    'test_cli': test_cli,
     'test_create_model': test_create_model,
     'test_mixture': test_mixture,
+    'test_modelset': test_modelset,
     'test_normal': test_normal,
+    'test_normalset': test_normalset,
     'test_subspacemodels': test_subspacemodels,
     'test_vae': test_vae,
     'test_utils': test_utils,
@@ -76,11 +84,15 @@ def run():
             test_nnet,
             test_arnet,
             test_bayesmodel,
+            test_cli,
             test_expfamilyprior,
             test_features,
+            test_graph,
             #test_hmm,
             test_mixture,
+            test_modelset,
             test_normal,
+            test_normalset,
             test_subspacemodels,
             test_utils,
             test_vae,
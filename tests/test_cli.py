@@ -0,0 +1,199 @@
+'Test the command line tools.'
+
+# pylint: disable=C0413
+# Not all the modules can be placed at the top of the files as we need
+# first to change the PYTHONPATH before to import the modules.
+import sys
+sys.path.insert(0, './')
+sys.path.insert(0, './tests')
+
+import argparse
+import contextlib
+import copy
+import io
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import types
+
+import numpy as np
+import torch
+import beer
+from beer.cli.aligraphs import AlignmentGraphCache
+from beer.cli.dataset import Dataset
+from beer.cli.feastore import FeatureStoreWriter
+from beer.cli.subcommands.hmm import decode, posteriors, train
+from basetest import BaseTest
+
+
+def create_unit_graph(pdf_ids):
+    graph = beer.graph.Graph()
+    graph.start_state = graph.add_state()
+    previous_state = graph.start_state
+    for pdf_id in pdf_ids:
+        state = graph.add_state(pdf_id=pdf_id)
+        graph.add_arc(previous_state, state)
+        graph.add_arc(state, state)
+        previous_state = state
+    graph.end_state = graph.add_state()
+    graph.add_arc(previous_state, graph.end_state)
+    graph.normalize()
+    return graph
+
+
+def create_dataset(path, nutts, dim):
+    feats = [torch.randn(int(2 + torch.randint(30, (1, 1)).item()),
+                         dim).numpy()
+             for _ in range(nutts)]
+    with FeatureStoreWriter(path) as writer:
+        for i, fea in enumerate(feats):
+            writer.add(f'utt{i}', fea)
+    nframes = sum(len(fea) for fea in feats)
+    return Dataset(path, None, None, nframes), feats
+
+
+class TestHMMTrain(BaseTest):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dim = int(1 + torch.randint(5, (1, 1)).item())
+        self.nutts = int(2 + torch.randint(10, (1, 1)).item())
+        self.dataset, _ = create_dataset(os.path.join(self.tmpdir,
+                                                      'feats.bin'),
+                                         self.nutts, self.dim)
+        self.nframes = self.dataset.size
+
+        # With a single state, the best path and the posteriors of the
+        # states are the same: both training modes yield the same
+        # update.
+        modelset = beer.NormalSet.create(torch.zeros(self.dim),
+                                         torch.ones(self.dim), 1,
+                                         noise_std=0.1, cov_type='diagonal')
+        self.model = beer.HMM.create(create_unit_graph([0]).compile(),
+                                     modelset)
+        self.logger = logging.getLogger('test_cli')
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def update(self, train_fn, **kwargs):
+        model = copy.deepcopy(self.model)
+        optim = beer.BayesianModelOptimizer(model.mean_field_factorization(),
+                                            lrate=1.)
+        args = types.SimpleNamespace(epochs=1, **kwargs)
+        train_fn(args, self.logger, model, self.dataset, optim)
+        return [param.posterior.natural_parameters
+                for group in model.mean_field_factorization()
+                for param in group]
+
+    def test_bucketed_update(self):
+        nparams1 = self.update(train.train, batch_size=self.nutts)
+        nparams2 = self.update(train.train_bucketed,
+                               max_frames=self.nutts * self.nframes)
+        nparams0 = [param.posterior.natural_parameters
+                    for group in self.model.mean_field_factorization()
+                    for param in group]
+        for nparam0, nparam1, nparam2 in zip(nparams0, nparams1, nparams2):
+            self.assertFalse(np.allclose(nparam0.numpy(), nparam1.numpy()))
+            # The posteriors of the forward-backward are only equal to
+            # 1 up to the rounding errors.
+            self.assertTrue(np.allclose(nparam1.numpy(), nparam2.numpy(),
+                                        rtol=1e-3, atol=1e-3))
+
+
+class TestHMMDecode(BaseTest):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dim = int(1 + torch.randint(5, (1, 1)).item())
+        self.nutts = int(1 + torch.randint(5, (1, 1)).item())
+        dataset, self.feats = create_dataset(
+            os.path.join(self.tmpdir, 'feats.bin'), self.nutts, self.dim)
+        self.dataset_path = os.path.join(self.tmpdir, 'dataset.pkl')
+        with open(self.dataset_path, 'wb') as f:
+            pickle.dump(dataset, f)
+
+        # Loop over two units of 3 (left-to-right) states each.
+        modelset = beer.NormalSet.create(torch.zeros(self.dim),
+                                         torch.ones(self.dim), 6,
+                                         noise_std=0.1, cov_type='diagonal')
+        trans_probs = .5 * (torch.eye(6) + torch.eye(6).roll(1, 1))
+        cgraph = beer.graph.CompiledGraph(
+            torch.tensor([.5, 0, 0, .5, 0, 0]).log(),
+            torch.tensor([0, 0, .5, 0, 0, .5]).log(),
+            trans_probs.log(), list(range(6)))
+        model = beer.HMM.create(cgraph, modelset)
+        model.start_pdf = {'a': 0, 'b': 3}
+        model.end_pdf = {'a': 3, 'b': 6}
+        self.model_path = os.path.join(self.tmpdir, 'model.pkl')
+        with open(self.model_path, 'wb') as f:
+            pickle.dump(model, f)
+        self.logger = logging.getLogger('test_cli')
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_cmd(self, cmd, cmd_args):
+        parser = argparse.ArgumentParser()
+        cmd.setup(parser)
+        args = parser.parse_args(cmd_args)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cmd.main(args, self.logger)
+        return output.getvalue().strip().split('\n')
+
+    def test_decode(self):
+        lines1 = self.run_cmd(decode, [self.model_path, self.dataset_path])
+        lines2 = self.run_cmd(decode, ['-s', '.5', '--beam', '1e3',
+                                       '--max-active', '6', self.model_path,
+                                       self.dataset_path])
+        self.assertEqual(len(lines1), self.nutts)
+        self.assertEqual([line.split()[0] for line in lines1],
+                         sorted(f'utt{i}' for i in range(self.nutts)))
+        self.assertEqual(len(lines2), self.nutts)
+
+    def test_posteriors(self):
+        outdir = os.path.join(self.tmpdir, 'posts')
+        os.mkdir(outdir)
+        self.run_cmd(posteriors, ['-s', '.5', '--beam', '1e3', '-S',
+                                  self.model_path, self.dataset_path, outdir])
+        for i, fea in enumerate(self.feats):
+            posts = np.load(os.path.join(outdir, f'utt{i}.npy'))
+            self.assertEqual(posts.shape, (len(fea), 6))
+            self.assertTrue(np.allclose(posts.sum(axis=-1), 1.))
+
+
+class TestAlignmentGraphCache(BaseTest):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.phone_graphs = {
+            phone: create_unit_graph([3 * i, 3 * i + 1, 3 * i + 2])
+            for i, phone in enumerate(['a', 'b', 'c'])
+        }
+        nphones = int(5 + torch.randint(20, (1, 1)).item())
+        self.seq = [['a', 'b', 'c'][int(i)]
+                    for i in torch.randint(3, (nphones,))]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load(self):
+        # The first cache compiles the graph, the second one loads it.
+        graph1 = AlignmentGraphCache(self.tmpdir,
+                                     self.phone_graphs).get(self.seq)
+        graph2 = AlignmentGraphCache(self.tmpdir,
+                                     self.phone_graphs).get(self.seq)
+        self.assertTrue(isinstance(graph1, beer.graph.BandedCompiledGraph))
+        self.assertTrue(isinstance(graph2, beer.graph.BandedCompiledGraph))
+        self.assertTrue(graph2.optimize() is graph2)
+        self.assertEqual(graph1.band_limits(), graph2.band_limits())
+        self.assertTrue(np.allclose(graph1.trans_log_probs.numpy(),
+                                    graph2.trans_log_probs.numpy()))
+
+
+__all__ = ['TestHMMTrain', 'TestHMMDecode', 'TestAlignmentGraphCache']
@@ -27,5 +27,60 @@ class TestFbank(BaseTest):
         fea_d_dd = beer.features.add_deltas(fea)
         self.assertTrue(np.allclose(ref_fea, fea_d_dd))
 
+    def test_streaming_fbank(self):
+        s_t = np.load('tests/audio.npy')
+        fea = beer.features.fbank(s_t, nfilters=30, lowfreq=100)
+        stream = beer.features.StreamingFbank(nfilters=30, lowfreq=100)
+        chunks = np.split(s_t, [1, 150, 1000, 1003, 2500])
+        stream_fea = np.concatenate([stream.process(chunk)
+                                     for chunk in chunks])
+        self.assertTrue(np.allclose(fea, stream_fea))
+
+
+class TestBatchFeatures(BaseTest):
+
+    def setUp(self):
+        s_t = np.load('tests/audio.npy')
+        self.signals = [s_t[:2000], s_t[2000:2600], s_t[2600:]]
+
+    def mfcc(self, signal):
+        mspec, fft_len = beer.features.short_term_mspec(signal)
+        filters = beer.features.create_fbank(26, fft_len, lowfreq=20,
+                                             highfreq=8000)
+        log_melspec = np.log(1e-6 + mspec @ filters.T)
+        norm = np.sqrt(2. / 26)
+        fea = log_melspec @ beer.features.create_dct_bases(26, 13)
+        fea *= norm * beer.features.create_lifter(13, 22)
+        fea = np.c_[log_melspec.sum(axis=-1) * norm, fea]
+        return beer.features.add_deltas(fea)
+
+    def test_batch_mfcc(self):
+        feas = beer.features.batch_mfcc(self.signals)
+        self.assertEqual(len(feas), len(self.signals))
+        for fea, signal in zip(feas, self.signals):
+            self.assertTrue(np.allclose(fea, self.mfcc(signal)))
+
+    def test_batch_mfcc_offsets(self):
+        buffer = np.concatenate(self.signals)
+        offsets = np.cumsum([0] + [len(signal) for signal in self.signals[:-1]])
+        feas1 = beer.features.batch_mfcc(self.signals)
+        feas2 = beer.features.batch_mfcc(buffer, offsets)
+        for fea1, fea2 in zip(feas1, feas2):
+            self.assertTrue(np.allclose(fea1, fea2))
+
+    def test_batch_mfcc_float32(self):
+        feas1 = beer.features.batch_mfcc(self.signals)
+        feas2 = beer.features.batch_mfcc(self.signals, dtype=np.float32)
+        for fea1, fea2 in zip(feas1, feas2):
+            self.assertEqual(fea2.dtype, np.float32)
+            self.assertTrue(np.allclose(fea1, fea2, rtol=1e-3, atol=1e-2))
+
+    def test_batch_deltas(self):
+        feas = [np.random.randn(n, 5) for n in (1, 7, 20)]
+        fea_d_dd = beer.features.batch_add_deltas(np.concatenate(feas),
+                                                  [len(fea) for fea in feas])
+        ref = np.concatenate([beer.features.add_deltas(fea) for fea in feas])
+        self.assertTrue(np.allclose(ref, fea_d_dd))
+
 
-__all__ = ['TestFbank']
+__all__ = ['TestFbank', 'TestBatchFeatures']
@@ -0,0 +1,543 @@
+'Test the graph module.'
+
+
+# pylint: disable=C0413
+# Not all the modules can be placed at the top of the files as we need
+# first to change the PYTHONPATH before to import the modules.
+import sys
+sys.path.insert(0, './')
+sys.path.insert(0, './tests')
+
+import time
+import torch
+import beer
+from basetest import BaseTest
+
+
+def create_compiled_graph(nstates, type_t):
+    init_probs = torch.rand(nstates)
+    final_probs = torch.rand(nstates)
+
+    # Remove randomly some arcs to have "-inf" in the transition matrix.
+    trans_probs = torch.rand(nstates, nstates)
+    trans_probs *= (torch.rand(nstates, nstates) > .5).float()
+    trans_probs += torch.eye(nstates)
+    trans_probs /= trans_probs.sum(dim=1, keepdim=True)
+    return beer.graph.CompiledGraph(
+        (init_probs / init_probs.sum()).log().type(type_t),
+        (final_probs / final_probs.sum()).log().type(type_t),
+        trans_probs.log().type(type_t),
+        list(range(nstates))
+    )
+
+
+def create_banded_graph(nstates, lower, upper, type_t):
+    init_probs = torch.rand(nstates)
+    final_probs = torch.rand(nstates)
+    trans_probs = torch.zeros(nstates, nstates)
+    for offset in range(lower, upper + 1):
+        trans_probs += torch.diag(torch.rand(nstates), offset)[:nstates, :nstates]
+    trans_probs += torch.eye(nstates)
+    trans_probs /= trans_probs.sum(dim=1, keepdim=True)
+    return beer.graph.CompiledGraph(
+        (init_probs / init_probs.sum()).log().type(type_t),
+        (final_probs / final_probs.sum()).log().type(type_t),
+        trans_probs.log().type(type_t),
+        list(range(nstates))
+    )
+
+
+def create_unit_graph(pdf_ids):
+    graph = beer.graph.Graph()
+    graph.start_state = graph.add_state()
+    previous_state = graph.start_state
+    for pdf_id in pdf_ids:
+        state = graph.add_state(pdf_id=pdf_id)
+        graph.add_arc(previous_state, state)
+        graph.add_arc(state, state)
+        previous_state = state
+    graph.end_state = graph.add_state()
+    graph.add_arc(previous_state, graph.end_state)
+    graph.normalize()
+    return graph
+
+
+def create_loop_graph(nunits):
+    graph = beer.graph.Graph()
+    graph.start_state = graph.add_state()
+    graph.end_state = graph.add_state()
+    pivot_state = graph.add_state()
+    unit_states = [graph.add_state() for _ in range(nunits)]
+    graph.add_arc(graph.start_state, pivot_state)
+    graph.add_arc(pivot_state, graph.end_state)
+    for state in unit_states:
+        graph.add_arc(pivot_state, state)
+        graph.add_arc(state, pivot_state)
+    graph.normalize()
+    return graph, unit_states
+
+
+class TestGraph(BaseTest):
+
+    def setUp(self):
+        self.nunits = int(1 + torch.randint(10, (1, 1)).item())
+        self.graph, self.unit_states = create_loop_graph(self.nunits)
+        self.units = {state: create_unit_graph([3 * i, 3 * i + 1, 3 * i + 2])
+                      for i, state in enumerate(self.unit_states)}
+
+    def assertIndexesConsistent(self, graph):
+        all_arcs = list(graph.arcs())
+        for state_id in graph.states():
+            out_arcs = set(arc for arc in all_arcs if arc.start == state_id)
+            in_arcs = set(arc for arc in all_arcs if arc.end == state_id)
+            self.assertEqual(set(graph.arcs(state_id)), out_arcs)
+            self.assertEqual(set(graph.arcs(state_id, incoming=True)),
+                             in_arcs)
+
+    def assertLoopReplaced(self, graph, nunits):
+        # start, end and pivot states + 5 states per unit.
+        self.assertEqual(len(graph.states()), 3 + 5 * nunits)
+        # 2 arcs of the pivot state to/from each unit + 7 arcs per unit.
+        self.assertEqual(len(list(graph.arcs())), 2 + 9 * nunits)
+        pdf_ids = [graph.state_from_id(state).pdf_id
+                   for state in graph.states()]
+        self.assertEqual(sorted(pdf_id for pdf_id in pdf_ids
+                                if pdf_id is not None),
+                         list(range(3 * nunits)))
+
+    def test_replace_states(self):
+        pivot_state = self.unit_states[0] - 1
+        self.graph.replace_states(self.units)
+        self.assertIndexesConsistent(self.graph)
+        self.assertLoopReplaced(self.graph, self.nunits)
+        for state in self.unit_states:
+            self.assertTrue(state not in self.graph.states())
+        # The pivot state leads to the first emitting state of each unit.
+        entry_states = [arc.end for arc in self.graph.arcs(pivot_state)
+                        if arc.end != self.graph.end_state]
+        first_pdf_ids = [self.graph.state_from_id(arc.end).pdf_id
+                         for state in entry_states
+                         for arc in self.graph.arcs(state)]
+        self.assertEqual(sorted(first_pdf_ids),
+                         [3 * i for i in range(self.nunits)])
+
+    def test_replace_adjacent_states(self):
+        # Replacing a sequence of states at once connects the exit state
+        # of each sub-graph to the entry state of the next one.
+        graph = beer.graph.Graph()
+        graph.start_state = graph.add_state()
+        states = [graph.add_state() for _ in range(self.nunits)]
+        graph.end_state = graph.add_state()
+        for start, end in zip([graph.start_state] + states,
+                              states + [graph.end_state]):
+            graph.add_arc(start, end)
+        graph.replace_states(dict(zip(states, self.units.values())))
+        self.assertIndexesConsistent(graph)
+        graph.normalize()
+        cgraph = graph.compile()
+        nstates = 3 * self.nunits
+        self.assertEqual(cgraph.n_states, nstates)
+        self.assertEqual(cgraph.pdf_id_mapping, list(range(nstates)))
+        self.assertAlmostEqual(float(cgraph.init_log_probs[0].exp()), 1.,
+                               places=5)
+        self.assertAlmostEqual(float(cgraph.final_log_probs[-1].exp()), 1.,
+                               places=5)
+
+    def test_replace_states_large_loop(self):
+        # Phone-loop of 200 units: the replacement must scale with the
+        # size of the graph.
+        nunits = 200
+        graph, unit_states = create_loop_graph(nunits)
+        units = {state: create_unit_graph([3 * i, 3 * i + 1, 3 * i + 2])
+                 for i, state in enumerate(unit_states)}
+        start_time = time.time()
+        graph.replace_states(units)
+        duration = time.time() - start_time
+        self.assertLoopReplaced(graph, nunits)
+        self.assertLess(duration, 1.)
+
+    def test_compile(self):
+        self.graph.replace_states(self.units)
+        self.graph.normalize()
+        cgraph = self.graph.compile()
+        nstates = 3 * self.nunits
+        self.assertEqual(cgraph.n_states, nstates)
+        self.assertEqual(sorted(cgraph.pdf_id_mapping), list(range(nstates)))
+        self.assertAlmostEqual(float(cgraph.init_log_probs.exp().sum()), 1.,
+                               places=5)
+        self.assertAlmostEqual(float(cgraph.final_log_probs.exp().sum()), 1.,
+                               places=5)
+        self.assertArraysAlmostEqual(
+            cgraph.trans_log_probs.exp().sum(dim=1).numpy(),
+            torch.ones(nstates).numpy())
+
+    def test_pickle(self):
+        # Graph pickled without the adjacency indexes.
+        state = dict(self.graph.__dict__)
+        del state['_out_arcs'], state['_in_arcs']
+        graph = beer.graph.Graph.__new__(beer.graph.Graph)
+        graph.__setstate__(state)
+        self.assertIndexesConsistent(graph)
+
+
+class TestCompiledGraph(BaseTest):
+
+    def setUp(self):
+        self.nstates = int(1 + torch.randint(20, (1, 1)).item())
+        self.nseqs = int(1 + torch.randint(10, (1, 1)).item())
+        self.lengths = [int(2 + torch.randint(50, (1, 1)).item())
+                        for _ in range(self.nseqs)]
+        self.graph = create_compiled_graph(self.nstates, self.type)
+        self.seqs = [torch.randn(length, self.nstates).type(self.type)
+                     for length in self.lengths]
+        self.llhs = torch.zeros(self.nseqs, max(self.lengths),
+                                self.nstates).type(self.type)
+        for i, seq in enumerate(self.seqs):
+            self.llhs[i, :len(seq)] = seq
+
+    def test_batch_posteriors(self):
+        posts = self.graph.batch_posteriors(self.llhs, self.lengths)
+        for i, seq in enumerate(self.seqs):
+            with self.subTest(i=i):
+                length = self.lengths[i]
+                posts1 = self.graph.posteriors(seq).numpy()
+                posts2 = posts[i, :length].numpy()
+                self.assertArraysAlmostEqual(posts1, posts2)
+                self.assertAlmostEqual(float(posts[i, length:].sum()), 0.)
+
+    def test_batch_trans_posteriors(self):
+        _, tposts = self.graph.batch_posteriors(self.llhs, self.lengths,
+                                                trans_posteriors=True)
+        for i, seq in enumerate(self.seqs):
+            with self.subTest(i=i):
+                length = self.lengths[i]
+                _, tposts1 = self.graph.posteriors(seq, trans_posteriors=True)
+                tposts2 = tposts[i, :length - 1]
+                self.assertArraysAlmostEqual(tposts1.numpy(), tposts2.numpy())
+                self.assertAlmostEqual(float(tposts[i, length - 1:].sum()), 0.)
+
+    def test_trans_counts(self):
+        seq = self.seqs[0]
+        _, tposts = self.graph.posteriors(seq, trans_posteriors=True)
+        _, counts = self.graph.posteriors(seq, trans_counts=True)
+        self.assertArraysAlmostEqual(tposts.sum(dim=0).numpy(),
+                                     counts.numpy())
+
+    def test_batch_trans_counts(self):
+        _, tposts, counts = self.graph.batch_posteriors(
+            self.llhs, self.lengths, trans_posteriors=True, trans_counts=True)
+        self.assertArraysAlmostEqual(tposts.sum(dim=1).numpy(),
+                                     counts.numpy())
+
+    def test_pruned_trans_counts(self):
+        seq = self.seqs[0]
+        _, tposts, counts, _ = self.graph.posteriors(
+            seq, trans_posteriors=True, trans_counts=True, beam=2.)
+        self.assertArraysAlmostEqual(tposts.sum(dim=0).numpy(),
+                                     counts.numpy())
+
+    def test_pruned_posteriors(self):
+        seq = self.seqs[0]
+        posts1, tposts1 = self.graph.posteriors(seq, trans_posteriors=True)
+        posts2, tposts2, n_active = self.graph.posteriors(
+            seq, trans_posteriors=True, beam=float('inf'))
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertArraysAlmostEqual(tposts1.numpy(), tposts2.numpy())
+        self.assertEqual(len(n_active), len(seq))
+
+    def test_max_active(self):
+        seq = self.seqs[0]
+        max_active = int(1 + torch.randint(self.nstates, (1, 1)).item())
+        posts, n_active = self.graph.posteriors(seq, max_active=max_active)
+        self.assertTrue(int(n_active.max()) <= max_active)
+        self.assertTrue(((posts > 0).long().sum(dim=1) <= n_active).all())
+        self.assertArraysAlmostEqual(posts.sum(dim=1).numpy(),
+                                     torch.ones(len(seq)).numpy())
+
+    def test_scaled_posteriors(self):
+        seq = self.seqs[0]
+        results1 = self.graph.posteriors(seq, trans_posteriors=True,
+                                         trans_counts=True, log_evidence=True)
+        results2 = self.graph.posteriors(seq, trans_posteriors=True,
+                                         trans_counts=True, log_evidence=True,
+                                         scaled=True)
+        for result1, result2 in zip(results1[:-1], results2[:-1]):
+            self.assertArraysAlmostEqual(result1.numpy(), result2.numpy())
+        self.assertAlmostEqual(float(results1[-1]), float(results2[-1]),
+                               places=self.tolplaces)
+
+    def test_scaled_posteriors_underflow(self):
+        # The only state reachable from the initial state has a
+        # likelihood too small to be represented in the probability
+        # domain.
+        init_probs = torch.zeros(2).type(self.type)
+        init_probs[0] = 1.
+        graph = beer.graph.CompiledGraph(
+            init_probs.log(),
+            torch.ones(2).type(self.type).log(),
+            torch.eye(2).type(self.type).log()
+        )
+        llhs = torch.zeros(len(self.seqs[0]), 2).type(self.type)
+        llhs[:, 0] = -1e4
+        self.assertIsNone(graph._scaled_baum_welch(llhs, False, False))
+        posts1, lognorm1 = graph.posteriors(llhs, log_evidence=True)
+        posts2, lognorm2 = graph.posteriors(llhs, log_evidence=True,
+                                            scaled=True)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertAlmostEqual(float(lognorm1), float(lognorm2))
+
+    def test_parallel_posteriors(self):
+        seq = self.seqs[0]
+        results1 = self.graph.posteriors(seq, trans_posteriors=True,
+                                         trans_counts=True, log_evidence=True)
+        results2 = self.graph.posteriors(seq, trans_posteriors=True,
+                                         trans_counts=True, log_evidence=True,
+                                         parallel=True)
+        for result1, result2 in zip(results1[:-1], results2[:-1]):
+            self.assertArraysAlmostEqual(result1.numpy(), result2.numpy())
+        self.assertAlmostEqual(float(results1[-1]), float(results2[-1]),
+                               places=self.tolplaces)
+
+    def test_parallel_recursions(self):
+        seq = self.seqs[0]
+        log_alphas1 = self.graph._baum_welch_forward(seq)
+        log_betas1 = self.graph._baum_welch_backward(seq)
+        for block_size in [1, 2, 3, len(seq)]:
+            with self.subTest(block_size=block_size):
+                log_alphas2 = self.graph._parallel_baum_welch_forward(
+                    seq, block_size)
+                log_betas2 = self.graph._parallel_baum_welch_backward(
+                    seq, block_size)
+                self.assertArraysAlmostEqual(log_alphas1.numpy(),
+                                             log_alphas2.numpy())
+                self.assertArraysAlmostEqual(log_betas1.numpy(),
+                                             log_betas2.numpy())
+
+    def test_parallel_best_path(self):
+        for seq in self.seqs:
+            path1 = self.graph.best_path(seq)
+            path2 = self.graph.best_path(seq, parallel=True)
+            self.assertEqual(path1.tolist(), path2.tolist())
+
+    def test_checkpointed_posteriors(self):
+        seq = self.seqs[0]
+        results1 = self.graph.posteriors(seq, trans_posteriors=True,
+                                         trans_counts=True, log_evidence=True)
+        results2 = self.graph.posteriors(seq, trans_posteriors=True,
+                                         trans_counts=True, log_evidence=True,
+                                         checkpoint=True)
+        for result1, result2 in zip(results1[:-1], results2[:-1]):
+            self.assertArraysAlmostEqual(result1.numpy(), result2.numpy())
+        self.assertAlmostEqual(float(results1[-1]), float(results2[-1]),
+                               places=self.tolplaces)
+
+    def test_checkpointed_segments(self):
+        seq = self.seqs[0]
+        posts1, counts1 = self.graph.posteriors(seq, trans_counts=True)
+        for segment_size in [1, 2, len(seq)]:
+            with self.subTest(segment_size=segment_size):
+                segments = self.graph._checkpointed_baum_welch(
+                    len(seq), lambda start, end: seq[start:end],
+                    segment_size=segment_size, trans_counts=True)
+                posts2 = torch.zeros_like(posts1)
+                counts2 = torch.zeros_like(counts1)
+                for start, llhs, _, posts, counts in segments:
+                    self.assertEqual(len(llhs), len(posts))
+                    posts2[start:start + len(posts)] = posts
+                    counts2 += counts
+                self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+                self.assertArraysAlmostEqual(counts1.numpy(),
+                                             counts2.numpy())
+
+    def test_pruned_best_path(self):
+        seq = self.seqs[0]
+        path1 = self.graph.best_path(seq)
+        path2, n_active = self.graph.best_path(seq, beam=float('inf'))
+        self.assertEqual(path1.tolist(), path2.tolist())
+        self.assertEqual(len(n_active), len(seq))
+        _, n_active = self.graph.best_path(seq, max_active=1)
+        self.assertEqual(n_active.tolist(), [1] * len(seq))
+
+
+class TestSparseCompiledGraph(BaseTest):
+
+    def setUp(self):
+        self.nstates = int(1 + torch.randint(20, (1, 1)).item())
+        self.length = int(2 + torch.randint(50, (1, 1)).item())
+        self.graph = create_compiled_graph(self.nstates, self.type)
+        self.sparse_graph = self.graph.to_sparse()
+        self.llhs = torch.randn(self.length, self.nstates).type(self.type)
+
+    def test_posteriors(self):
+        posts1, tposts1 = self.graph.posteriors(self.llhs,
+                                                trans_posteriors=True)
+        posts2, tposts2 = self.sparse_graph.posteriors(self.llhs,
+                                                       trans_posteriors=True)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertArraysAlmostEqual(tposts1.numpy(), tposts2.numpy())
+
+    def test_batch_posteriors(self):
+        llhs = torch.stack([self.llhs, self.llhs.flip(0)])
+        lengths = [self.length, self.length - 1]
+        posts1, tposts1 = self.graph.batch_posteriors(llhs, lengths,
+                                                      trans_posteriors=True)
+        posts2, tposts2 = self.sparse_graph.batch_posteriors(
+            llhs, lengths, trans_posteriors=True)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertArraysAlmostEqual(tposts1.numpy(), tposts2.numpy())
+
+    def test_best_path(self):
+        path1 = self.graph.best_path(self.llhs)
+        path2 = self.sparse_graph.best_path(self.llhs)
+        self.assertEqual(path1.tolist(), path2.tolist())
+
+    def test_trans_counts(self):
+        _, counts1 = self.graph.posteriors(self.llhs, trans_counts=True)
+        _, counts2 = self.sparse_graph.posteriors(self.llhs,
+                                                  trans_counts=True)
+        self.assertArraysAlmostEqual(counts1.numpy(), counts2.numpy())
+
+    def test_pruned_posteriors(self):
+        posts1, n_active1 = self.graph.posteriors(self.llhs, beam=2.)
+        posts2, n_active2 = self.sparse_graph.posteriors(self.llhs, beam=2.)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertEqual(n_active1.tolist(), n_active2.tolist())
+
+    def test_pruned_trans_counts(self):
+        _, counts1, _ = self.graph.posteriors(self.llhs, trans_counts=True,
+                                              beam=2.)
+        _, counts2, _ = self.sparse_graph.posteriors(self.llhs,
+                                                     trans_counts=True,
+                                                     beam=2.)
+        self.assertArraysAlmostEqual(counts1.numpy(), counts2.numpy())
+
+    def test_optimize(self):
+        trans_probs = torch.eye(self.nstates) + torch.eye(self.nstates).roll(1, 1)
+        graph = beer.graph.CompiledGraph(
+            self.graph.init_log_probs,
+            self.graph.final_log_probs,
+            (trans_probs / trans_probs.sum(dim=1, keepdim=True)).log().type(self.type)
+        )
+        optimized = graph.optimize()
+        if graph.density() <= beer.graph.SPARSE_MAX_DENSITY:
+            self.assertTrue(isinstance(optimized, beer.graph.SparseCompiledGraph))
+        else:
+            self.assertTrue(optimized is graph)
+
+
+class TestBandedCompiledGraph(BaseTest):
+
+    def setUp(self):
+        self.nstates = int(1 + torch.randint(20, (1, 1)).item())
+        self.length = int(2 + torch.randint(50, (1, 1)).item())
+        self.lower = -int(torch.randint(2, (1, 1)).item())
+        self.upper = int(torch.randint(3, (1, 1)).item())
+        self.graph = create_banded_graph(self.nstates, self.lower, self.upper,
+                                         self.type)
+        self.banded_graph = self.graph.to_banded()
+        self.llhs = torch.randn(self.length, self.nstates).type(self.type)
+
+    def test_band_limits(self):
+        lower, upper = self.banded_graph.band_limits()
+        self.assertTrue(self.lower <= lower <= 0)
+        self.assertTrue(0 <= upper <= self.upper)
+        self.assertEqual((self.banded_graph.lower, self.banded_graph.upper),
+                         (lower, upper))
+
+    def test_posteriors(self):
+        posts1, tposts1 = self.graph.posteriors(self.llhs,
+                                                trans_posteriors=True)
+        posts2, tposts2 = self.banded_graph.posteriors(self.llhs,
+                                                       trans_posteriors=True)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertArraysAlmostEqual(tposts1.numpy(), tposts2.numpy())
+
+    def test_batch_posteriors(self):
+        llhs = torch.stack([self.llhs, self.llhs.flip(0)])
+        lengths = [self.length, self.length - 1]
+        posts1, tposts1 = self.graph.batch_posteriors(llhs, lengths,
+                                                      trans_posteriors=True)
+        posts2, tposts2 = self.banded_graph.batch_posteriors(
+            llhs, lengths, trans_posteriors=True)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertArraysAlmostEqual(tposts1.numpy(), tposts2.numpy())
+
+    def test_best_path(self):
+        path1 = self.graph.best_path(self.llhs)
+        path2 = self.banded_graph.best_path(self.llhs)
+        self.assertEqual(path1.tolist(), path2.tolist())
+
+    def test_trans_counts(self):
+        _, counts1 = self.graph.posteriors(self.llhs, trans_counts=True)
+        _, counts2 = self.banded_graph.posteriors(self.llhs,
+                                                  trans_counts=True)
+        self.assertArraysAlmostEqual(counts1.numpy(), counts2.numpy())
+
+    def test_pruned_posteriors(self):
+        posts1, n_active1 = self.graph.posteriors(self.llhs, beam=2.)
+        posts2, n_active2 = self.banded_graph.posteriors(self.llhs, beam=2.)
+        self.assertArraysAlmostEqual(posts1.numpy(), posts2.numpy())
+        self.assertEqual(n_active1.tolist(), n_active2.tolist())
+
+    def test_optimize(self):
+        optimized = self.graph.optimize()
+        if self.graph.is_banded():
+            self.assertTrue(isinstance(optimized,
+                                       beer.graph.BandedCompiledGraph))
+        else:
+            self.assertFalse(isinstance(optimized,
+                                        beer.graph.BandedCompiledGraph))
+
+    def test_optimize_cache(self):
+        optimized = self.graph.optimize()
+        self.assertTrue(self.graph.optimize() is optimized)
+
+        # An in-place modification of the transitions invalidates the
+        # cached graph.
+        self.graph.trans_log_probs[0, 0] = self.graph.trans_log_probs[0, 0]
+        if optimized is not self.graph:
+            self.assertFalse(self.graph.optimize() is optimized)
+
+    def test_compile(self):
+        graph = create_unit_graph(list(range(10 + self.nstates)))
+        cgraph = graph.compile()
+        self.assertTrue(isinstance(cgraph, beer.graph.BandedCompiledGraph))
+        self.assertEqual(cgraph.band_limits(), (0, 1))
+
+
+class TestStreamingViterbi(BaseTest):
+
+    def setUp(self):
+        self.nstates = int(1 + torch.randint(20, (1, 1)).item())
+        self.length = int(2 + torch.randint(50, (1, 1)).item())
+        self.graph = create_compiled_graph(self.nstates, self.type)
+        self.llhs = torch.randn(self.length, self.nstates).type(self.type)
+        self.chunk_size = int(1 + torch.randint(10, (1, 1)).item())
+
+    def decode(self, decoder):
+        paths = [decoder.process(chunk)
+                 for chunk in self.llhs.split(self.chunk_size)]
+        paths.append(decoder.flush())
+        return torch.cat(paths)
+
+    def test_best_path(self):
+        path1 = self.graph.best_path(self.llhs)
+        path2 = self.decode(beer.graph.StreamingViterbi(self.graph))
+        self.assertEqual(path1.tolist(), path2.tolist())
+
+    def test_pruned_best_path(self):
+        path1, _ = self.graph.best_path(self.llhs, beam=2.)
+        path2 = self.decode(beer.graph.StreamingViterbi(self.graph, beam=2.))
+        self.assertEqual(path1.tolist(), path2.tolist())
+
+    def test_max_latency(self):
+        decoder = beer.graph.StreamingViterbi(self.graph, max_latency=3)
+        for chunk in self.llhs.split(self.chunk_size):
+            decoder.process(chunk)
+            self.assertTrue(decoder.n_pending <= 3)
+        decoder.flush()
+        self.assertEqual(decoder.n_pending, 0)
+
+
+__all__ = ['TestGraph', 'TestCompiledGraph', 'TestSparseCompiledGraph',
+           'TestBandedCompiledGraph', 'TestStreamingViterbi']
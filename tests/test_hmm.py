@@ -322,5 +322,43 @@ class TestHMM(BaseTest):
                 exp_llh2 = model(stats, state_path=label_idxs).numpy()
                 self.assertArraysAlmostEqual(exp_llh1, exp_llh2)
 
+class TestHMMComputeDtype(BaseTest):
+
+    def setUp(self):
+        self.npoints = int(2 + torch.randint(50, (1, 1)).item())
+        self.dim = int(1 + torch.randint(10, (1, 1)).item())
+        self.nstates = int(2 + torch.randint(10, (1, 1)).item())
+        self.data = torch.randn(self.npoints, self.dim).double()
+        modelset = beer.NormalSet.create(
+            torch.zeros(self.dim).double(), torch.ones(self.dim).double(),
+            self.nstates, noise_std=0.1, cov_type='diagonal')
+        trans_probs = torch.rand(self.nstates, self.nstates).double()
+        trans_probs /= trans_probs.sum(dim=1, keepdim=True)
+        graph = beer.graph.CompiledGraph(
+            torch.ones(self.nstates).double().div(self.nstates).log(),
+            torch.ones(self.nstates).double().div(self.nstates).log(),
+            trans_probs.log(), list(range(self.nstates)))
+        self.model = beer.HMM.create(graph, modelset)
+
+    def test_graph_update(self):
+        self.model.set_compute_dtype(torch.float32)
+        self.model.posteriors(self.data)
+
+        # Modify in-place the graph after it has been cast.
+        graph = self.model.graph.value
+        trans_probs = torch.rand(self.nstates, self.nstates).double()
+        trans_probs /= trans_probs.sum(dim=1, keepdim=True)
+        graph.trans_log_probs.copy_(trans_probs.log())
+        init_probs = torch.rand(self.nstates).double()
+        graph.init_log_probs.copy_((init_probs / init_probs.sum()).log())
+
+        posts1 = self.model.posteriors(self.data)
+        self.model.set_compute_dtype(None)
+        posts2 = self.model.posteriors(self.data)
+        self.assertEqual(posts1.dtype, torch.float32)
+        self.assertTrue(np.allclose(posts1.double().numpy(), posts2.numpy(),
+                                    atol=1e-4))
+
+
 __all__ = ['TestHMM', 'TestForwardBackwardViterbi',
-           'TestCreateTransMatrix', 'TestAlignModelSet']
+           'TestCreateTransMatrix', 'TestAlignModelSet', 'TestHMMComputeDtype']
@@ -0,0 +1,70 @@
+'Test the modelset module.'
+
+
+# pylint: disable=C0413
+# Not all the modules can be placed at the top of the files as we need
+# first to change the PYTHONPATH before to import the modules.
+import sys
+sys.path.insert(0, './')
+sys.path.insert(0, './tests')
+
+import torch
+import beer
+from basetest import BaseTest
+
+
+class TestDynamicallyOrderedModelSet(BaseTest):
+
+    def setUp(self):
+        self.dim = int(1 + torch.randint(20, (1, 1)).item())
+        self.npoints = int(1 + torch.randint(100, (1, 1)).item())
+        self.ncomps = int(1 + torch.randint(20, (1, 1)).item())
+        mean = torch.randn(self.dim).type(self.type)
+        variance = (1 + torch.randn(self.dim) ** 2).type(self.type)
+        self.data = torch.randn(self.npoints, self.dim).type(self.type)
+        self.modelset = beer.NormalSet.create(mean, variance, self.ncomps,
+                                              cov_type='diagonal')
+        self.ordered_modelset = \
+            beer.DynamicallyOrderedModelSet(self.modelset)
+
+        # Order with repeated (shared) components.
+        self.order = torch.randint(self.ncomps, (2 * self.ncomps,)).tolist()
+
+    def test_exp_llh(self):
+        stats = self.ordered_modelset.sufficient_statistics(self.data)
+        exp_llh1 = self.modelset.expected_log_likelihood(stats)
+        exp_llh2 = self.ordered_modelset.expected_log_likelihood(stats,
+                                                                 self.order)
+        self.assertEqual(exp_llh2.shape, (len(stats), len(self.order)))
+        for i, comp in enumerate(self.order):
+            self.assertArraysAlmostEqual(exp_llh1[:, comp].numpy(),
+                                         exp_llh2[:, i].numpy())
+
+    def test_accumulate(self):
+        stats = self.ordered_modelset.sufficient_statistics(self.data)
+        self.ordered_modelset.expected_log_likelihood(stats, self.order)
+        resps = torch.rand(len(stats), len(self.order)).type(self.type)
+        acc_stats1 = self.ordered_modelset.accumulate(stats, resps)
+
+        new_resps = torch.zeros(len(stats), self.ncomps).type(self.type)
+        for i, comp in enumerate(self.order):
+            new_resps[:, comp] += resps[:, i]
+        acc_stats2 = self.modelset.accumulate(stats, new_resps)
+        for param in acc_stats2:
+            self.assertArraysAlmostEqual(acc_stats1[param].numpy(),
+                                         acc_stats2[param].numpy())
+
+    def test_default_order(self):
+        stats = self.ordered_modelset.sufficient_statistics(self.data)
+        exp_llh1 = self.modelset.expected_log_likelihood(stats)
+        exp_llh2 = self.ordered_modelset.expected_log_likelihood(stats)
+        self.assertArraysAlmostEqual(exp_llh1.numpy(), exp_llh2.numpy())
+        resps = torch.rand(len(stats), self.ncomps).type(self.type)
+        acc_stats1 = self.ordered_modelset.accumulate(stats, resps)
+        acc_stats2 = self.modelset.accumulate(stats, resps)
+        for param in acc_stats2:
+            self.assertArraysAlmostEqual(acc_stats1[param].numpy(),
+                                         acc_stats2[param].numpy())
+
+
+__all__ = ['TestDynamicallyOrderedModelSet']
@@ -0,0 +1,159 @@
+'Test the NormalSet model.'
+
+
+# pylint: disable=C0413
+# Not all the modules can be placed at the top of the files as we need
+# first to change the PYTHONPATH before to import the modules.
+import sys
+sys.path.insert(0, './')
+sys.path.insert(0, './tests')
+
+import math
+import torch
+import beer
+from basetest import BaseTest
+
+
+class TestNormalSetNonSharedCovariance(BaseTest):
+
+    def setUp(self):
+        self.dim = int(1 + torch.randint(20, (1, 1)).item())
+        self.npoints = int(1 + torch.randint(100, (1, 1)).item())
+        self.ncomps = int(1 + torch.randint(20, (1, 1)).item())
+        self.mean = torch.randn(self.dim).type(self.type)
+        self.variance = (1 + torch.randn(self.dim) ** 2).type(self.type)
+        self.data = torch.randn(self.npoints, self.dim).type(self.type)
+        self.modelsets = [
+            beer.NormalSet.create(self.mean, self.variance, self.ncomps,
+                                  cov_type=cov_type)
+            for cov_type in ['diagonal', 'isotropic']
+        ]
+
+    def exp_llh(self, modelset, stats):
+        exp_llhs = [stats @ param.expected_natural_parameters()
+                    for param in modelset.means_precisions]
+        return torch.stack(exp_llhs, dim=-1) - \
+               .5 * self.dim * math.log(2 * math.pi)
+
+    def test_exp_llh(self):
+        for modelset in self.modelsets:
+            with self.subTest(modelset=modelset.__class__.__name__):
+                stats = modelset.sufficient_statistics(self.data)
+                exp_llh1 = self.exp_llh(modelset, stats).numpy()
+                exp_llh2 = modelset.expected_log_likelihood(stats).numpy()
+                self.assertArraysAlmostEqual(exp_llh1, exp_llh2)
+
+    def test_exp_llh_after_update(self):
+        for modelset in self.modelsets:
+            with self.subTest(modelset=modelset.__class__.__name__):
+                stats = modelset.sufficient_statistics(self.data)
+
+                # Fill the cache of the natural parameters.
+                modelset.expected_log_likelihood(stats)
+
+                param = modelset.means_precisions[self.ncomps - 1]
+                param.stats = stats.sum(dim=0)
+                param.natural_grad_update(1.)
+                exp_llh1 = self.exp_llh(modelset, stats).numpy()
+                exp_llh2 = modelset.expected_log_likelihood(stats).numpy()
+                self.assertArraysAlmostEqual(exp_llh1, exp_llh2)
+
+    def test_nparams_cache(self):
+        for modelset in self.modelsets:
+            with self.subTest(modelset=modelset.__class__.__name__):
+                nparams1 = modelset.expected_natural_parameters()
+                nparams2 = modelset.expected_natural_parameters()
+                self.assertIs(nparams1, nparams2)
+
+                modelset.means_precisions[0].double_()
+                nparams3 = modelset.expected_natural_parameters()
+                self.assertIsNot(nparams1, nparams3)
+                self.assertEqual(nparams3.dtype, torch.float64)
+
+    def test_compute_dtype(self):
+        for modelset in self.modelsets:
+            with self.subTest(modelset=modelset.__class__.__name__):
+                stats = modelset.sufficient_statistics(self.data)
+                exp_llh1 = modelset.expected_log_likelihood(stats)
+                modelset.set_compute_dtype(torch.float32)
+                exp_llh2 = modelset.expected_log_likelihood(stats)
+                self.assertEqual(exp_llh2.dtype, torch.float32)
+                self.assertArraysAlmostEqual(exp_llh1.float().numpy(),
+                                             exp_llh2.numpy())
+
+                # The statistics are accumulated in the precision of
+                # the parameters.
+                resps = torch.ones(len(stats), self.ncomps,
+                                   dtype=torch.float32)
+                acc_stats = modelset.accumulate(stats, resps)
+                param = modelset.means_precisions[0]
+                self.assertEqual(acc_stats[param].dtype,
+                                 param.posterior.natural_parameters.dtype)
+                modelset.set_compute_dtype(None)
+
+
+class TestNormalSetFullCovariance(BaseTest):
+
+    def setUp(self):
+        self.dim = int(1 + torch.randint(20, (1, 1)).item())
+        self.npoints = int(1 + torch.randint(100, (1, 1)).item())
+        self.ncomps = int(1 + torch.randint(40, (1, 1)).item())
+        self.mean = torch.randn(self.dim).type(self.type)
+        self.variance = (1 + torch.randn(self.dim) ** 2).type(self.type)
+        self.data = torch.randn(self.npoints, self.dim).type(self.type)
+        self.resps = torch.rand(self.npoints, self.ncomps).type(self.type)
+        self.modelsets = [
+            beer.NormalSet.create(self.mean, self.variance, self.ncomps,
+                                  cov_type='full', shared_cov=shared_cov)
+            for shared_cov in [False, True]
+        ]
+        self.stats = beer.NormalFullCovariance.sufficient_statistics(self.data)
+
+    def test_exp_llh(self):
+        modelset = self.modelsets[0]
+        exp_llh1 = self.stats @ modelset.expected_natural_parameters().t()
+        exp_llh1 -= .5 * self.dim * math.log(2 * math.pi)
+        exp_llh2 = modelset.expected_log_likelihood(
+            modelset.sufficient_statistics(self.data))
+        self.assertArraysAlmostEqual(exp_llh1.numpy(), exp_llh2.numpy())
+
+    def test_exp_llh_shared(self):
+        modelset = self.modelsets[1]
+        dim = self.dim
+        nparams1, nparams2 = modelset._split_natural_parameters(
+            modelset.means_precision.expected_natural_parameters())
+        stats1 = torch.cat([self.stats[:, :dim ** 2], self.stats[:, -1:]],
+                           dim=-1)
+        stats2 = self.stats[:, dim ** 2:-1]
+        exp_llh1 = (stats1 @ nparams1)[:, None] + stats2 @ nparams2.t()
+        exp_llh1 -= .5 * dim * math.log(2 * math.pi)
+        exp_llh2 = modelset.expected_log_likelihood(
+            modelset.sufficient_statistics(self.data))
+        self.assertArraysAlmostEqual(exp_llh1.numpy(), exp_llh2.numpy())
+
+    def test_accumulate(self):
+        modelset = self.modelsets[0]
+        acc_stats1 = self.resps.t() @ self.stats
+        acc_stats2 = modelset.accumulate(
+            modelset.sufficient_statistics(self.data), self.resps)
+        for i, param in enumerate(modelset.means_precisions):
+            self.assertArraysAlmostEqual(acc_stats1[i].numpy(),
+                                         acc_stats2[param].numpy())
+
+    def test_accumulate_shared(self):
+        modelset = self.modelsets[1]
+        dim = self.dim
+        w_stats = self.resps.t() @ self.stats
+        acc_stats1 = torch.cat([
+            w_stats[:, :dim ** 2].sum(dim=0),
+            w_stats[:, dim ** 2:dim ** 2 + dim].reshape(-1),
+            w_stats[:, -2],
+            w_stats[:, -1].sum().view(1)
+        ])
+        acc_stats2 = modelset.accumulate(
+            modelset.sufficient_statistics(self.data), self.resps)
+        self.assertArraysAlmostEqual(
+            acc_stats1.numpy(), acc_stats2[modelset.means_precision].numpy())
+
+
+__all__ = ['TestNormalSetNonSharedCovariance', 'TestNormalSetFullCovariance']
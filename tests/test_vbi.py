@@ -155,4 +155,79 @@ class TestEvidenceLowerbound(BaseTest):
                     previous = elbo
 
 
-__all__ = ['TestEvidenceLowerbound']
+class TestStatisticsAccumulator(BaseTest):
+
+    def setUp(self):
+        self.dim = int(1 + torch.randint(20, (1, 1)).item())
+        self.npoints = int(1 + torch.randint(100, (1, 1)).item())
+        self.ncomps = int(1 + torch.randint(20, (1, 1)).item())
+        mean = torch.randn(self.dim).type(self.type)
+        variance = (1 + torch.randn(self.dim) ** 2).type(self.type)
+        self.model = beer.NormalSet.create(mean, variance, self.ncomps,
+                                           cov_type='diagonal')
+        self.parameters = [param for group in
+                           self.model.mean_field_factorization()
+                           for param in group]
+        self.batches = [torch.randn(self.npoints, self.dim).type(self.type)
+                        for _ in range(3)]
+
+    def acc_stats(self, data):
+        stats = self.model.sufficient_statistics(data)
+        resps = torch.rand(len(data), self.ncomps).type(self.type)
+        return self.model.accumulate(stats, resps)
+
+    def test_add(self):
+        all_acc_stats = [self.acc_stats(data) for data in self.batches]
+        acc = beer.StatisticsAccumulator(self.parameters)
+        self.assertEqual(acc.buffer.shape,
+                         (sum(param.stats.numel()
+                              for param in self.parameters),))
+        for acc_stats in all_acc_stats:
+            acc.add_(acc_stats)
+        for param in self.parameters:
+            expected = sum(acc_stats[param] for acc_stats in all_acc_stats)
+            self.assertArraysAlmostEqual(acc[param].numpy(),
+                                         expected.numpy())
+
+    def test_from_stats(self):
+        acc_stats = self.acc_stats(self.batches[0])
+        acc = beer.StatisticsAccumulator.from_stats(acc_stats)
+        self.assertEqual(len(acc), len(acc_stats))
+        for param in acc_stats:
+            self.assertArraysAlmostEqual(acc[param].numpy(),
+                                         acc_stats[param].numpy())
+
+    def test_buffer(self):
+        acc1 = beer.StatisticsAccumulator(self.parameters)
+        acc1.add_(self.acc_stats(self.batches[0]))
+        acc2 = beer.StatisticsAccumulator(self.parameters,
+                                          acc1.buffer.clone())
+        acc2.add_(acc1)
+        for param in self.parameters:
+            self.assertArraysAlmostEqual(acc2[param].numpy(),
+                                         2 * acc1[param].numpy())
+        with self.assertRaises(ValueError):
+            beer.StatisticsAccumulator(self.parameters, acc1.buffer[1:])
+
+    def test_elbo_iadd(self):
+        elbo1 = beer.evidence_lower_bound(datasize=100)
+        elbo2 = beer.evidence_lower_bound(self.model, datasize=100)
+        for data in self.batches:
+            stats = self.model.sufficient_statistics(data)
+            resps = torch.ones(len(data), self.ncomps).type(self.type)
+            elbo = beer.inference.objectives.EvidenceLowerBoundInstance(
+                torch.tensor(1.), self.model.accumulate(stats, resps),
+                self.parameters, len(data), 100)
+            elbo1 = elbo1 + elbo
+            elbo2 += elbo
+        self.assertAlmostEqual(float(elbo1), float(elbo2))
+        npoints = sum(len(data) for data in self.batches)
+        self.assertEqual(elbo1.minibatchsize, npoints)
+        self.assertEqual(elbo2.minibatchsize, npoints)
+        self.assertEqual(elbo2.datasize, 100)
+        for param in self.parameters:
+            self.assertArraysAlmostEqual(elbo1._acc_stats[param].numpy(),
+                                         elbo2.acc_stats[param].numpy())
+
+
+__all__ = ['TestEvidenceLowerbound', 'TestStatisticsAccumulator']